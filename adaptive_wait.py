@@ -0,0 +1,179 @@
+"""
+Waits for Indeed's pages with timeouts learnt from how long each element has taken to appear.
+
+Every wait has a key, e.g. 'job_post' or 'cookie_banner'. Once a key has enough samples its timeout becomes a multiple
+of its 99th percentile latency, kept between min_timeout and max_timeout, so an element that isn't coming costs a
+fraction of a second instead of 10. Waits for things the scrape can't go on without always get max_timeout.
+The time spent waiting on each job post is recorded too.
+"""
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+from selenium.common.exceptions import TimeoutException, WebDriverException
+from selenium.webdriver.support.ui import WebDriverWait
+
+POLL_SECONDS = 0.05  # WebDriverWait polls every 0.5 seconds by default, which adds up to half a second to every wait
+
+
+class LatencyTracker:
+    """
+    The last history latencies of every key, and how many waits timed out. Safe to share between threads.
+    """
+
+    def __init__(self, history: int = 500):
+        self.history = history
+        self._latencies = {}
+        self._timeouts = {}
+        self._lock = threading.Lock()
+
+    def record(self, key: str, seconds: float):
+        with self._lock:
+            self._latencies.setdefault(key, deque(maxlen=self.history)).append(seconds)
+
+    def record_timeout(self, key: str):
+        with self._lock:
+            self._timeouts[key] = self._timeouts.get(key, 0) + 1
+
+    def count(self, key: str):
+        with self._lock:
+            return len(self._latencies.get(key, ()))
+
+    def percentile(self, key: str, percentile: float):
+        """
+        This function returns the percentile of the key's recorded latencies in seconds, or None when there are none.
+        """
+        with self._lock:
+            latencies = list(self._latencies.get(key, ()))
+        return float(np.percentile(latencies, percentile)) if latencies else None
+
+    def stats(self):
+        """
+        This function returns {key: {'waits', 'timeouts', 'p50', 'p95', 'p99'}} with the percentiles in seconds.
+        """
+        with self._lock:
+            keys = set(self._latencies) | set(self._timeouts)
+            latencies = {key: list(self._latencies.get(key, ())) for key in keys}
+            timeouts = dict(self._timeouts)
+        stats = {}
+        for key in sorted(keys):
+            percentiles = map(float, np.percentile(latencies[key], (50, 95, 99))) if latencies[key] else (None, None, None)
+            stats[key] = dict(zip(('p50', 'p95', 'p99'), percentiles), waits=len(latencies[key]) + timeouts.get(key, 0),
+                              timeouts=timeouts.get(key, 0))
+        return stats
+
+
+class AdaptiveWaiter:
+    """
+    Waits on a Selenium driver with per-key adaptive timeouts: max_timeout until a key has min_samples latencies, then
+    headroom times their 99th percentile, between min_timeout and max_timeout. One waiter can be shared by every
+    driver of a process.
+    """
+
+    def __init__(self, max_timeout: float = 10, min_timeout: float = 1, headroom: float = 2, min_samples: int = 20,
+                 history: int = 500):
+        self.max_timeout = max_timeout
+        self.min_timeout = min_timeout
+        self.headroom = headroom
+        self.min_samples = min_samples
+        self.latencies = LatencyTracker(history)
+        self.post_waits = deque(maxlen=history)  # Seconds spent waiting on each of the latest job posts
+        self._post = threading.local()
+
+    def timeout(self, key: str):
+        """
+        This function returns how long a wait for key is allowed to take.
+        """
+        if self.latencies.count(key) < self.min_samples:
+            return self.max_timeout
+        return min(self.max_timeout, max(self.min_timeout, self.latencies.percentile(key, 99) * self.headroom))
+
+    def wait(self, driver, key: str, condition, required: bool = False, timeout: float = None):
+        """
+        This function waits until condition(driver) returns something truthy and returns it, recording how long it took
+        under key. It raises TimeoutException after the key's adaptive timeout, or max_timeout when required is set.
+        A timeout passed in is used as it is.
+        """
+        if timeout is None:
+            timeout = self.max_timeout if required else self.timeout(key)
+        started = time.monotonic()
+        try:
+            result = WebDriverWait(driver, timeout, poll_frequency=POLL_SECONDS).until(condition)
+        except TimeoutException:
+            self.latencies.record_timeout(key)
+            raise
+        finally:
+            self._add_post_wait(time.monotonic() - started)
+        self.latencies.record(key, time.monotonic() - started)
+        return result
+
+    def settle(self, driver, key: str, condition, required: bool = False, timeout: float = None):
+        """
+        This function waits once for the page to settle, i.e. for condition(driver) to hold, such as an element being
+        on it. It returns False if it didn't in time, so whatever has loaded can still be read.
+        """
+        try:
+            self.wait(driver, key, condition, required, timeout)
+            return True
+        except TimeoutException:
+            return False
+
+    @contextmanager
+    def post(self):
+        """
+        Records the time spent waiting inside the block as one job post's. Nested blocks count towards the outermost one.
+        """
+        depth = getattr(self._post, 'depth', 0)
+        if depth == 0:
+            self._post.seconds = 0.0
+        self._post.depth = depth + 1
+        try:
+            yield
+        finally:
+            self._post.depth = depth
+            if depth == 0:
+                self.post_waits.append(self._post.seconds)
+
+    def _add_post_wait(self, seconds: float):
+        if getattr(self._post, 'depth', 0):
+            self._post.seconds += seconds
+
+    def stats(self):
+        """
+        This function returns the latency percentiles of every key and of the time spent waiting per job post, in seconds.
+        """
+        post_waits = list(self.post_waits)
+        stats = {'waits': self.latencies.stats(), 'posts': len(post_waits)}
+        if post_waits:
+            stats['post_wait_p50'], stats['post_wait_p95'] = map(float, np.percentile(post_waits, (50, 95)))
+        return stats
+
+    def summary(self):
+        """
+        This function returns a one-line description of the waiting per job post and the keys that timed out.
+        """
+        stats = self.stats()
+        if not stats['posts']:
+            return 'No job posts waited on yet'
+        timeouts = ', '.join(f"{key} {key_stats['timeouts']}/{key_stats['waits']}" for key, key_stats in stats['waits'].items()
+                             if key_stats['timeouts'])
+        return (f"Waited {stats['post_wait_p50']:.2f}s a job post (p95 {stats['post_wait_p95']:.2f}s) over {stats['posts']} posts"
+                + (f", timed out: {timeouts}" if timeouts else ''))
+
+
+def element_text_or(element, default: str):
+    """
+    This function returns the text of a Selenium element, or default when there's no element or it has gone from the page.
+    """
+    if element is None:
+        return default
+    try:
+        return element.text
+    except WebDriverException:  # Usually StaleElementReferenceException, when the page changed under us
+        return default
+
+
+# Shared by the scraping functions of this process
+waiter = AdaptiveWaiter()
@@ -0,0 +1,263 @@
+"""
+asyncio crawler that scrapes many Indeed searches at once over HTTP, as fast as each host's rate limit allows.
+
+Search results pages and job posts go on one work queue shared by a fixed number of worker tasks. Every request to a
+host waits for that host's token bucket and takes one of its connection slots, so a crawl keeps the allowed request
+rate busy instead of sleeping between pages, and a 429 or 503 from a host pauses every worker's requests to it.
+Pages are parsed with the same BeautifulSoup code as the other scrapers, so the job dictionaries are the same.
+
+    $ python pipeline.py queries.csv --backend async --workers 32 --per-host 8 --rps 10
+"""
+import asyncio
+import itertools
+import time
+from urllib.parse import urlencode, urlsplit
+
+import aiohttp
+from bs4 import BeautifulSoup
+
+from find_core_job_details import parse_job_page
+from http_scraper import BLOCKED_PAGE_MARKERS, BROWSER_HEADERS, INDEED_URL, RESULTS_PER_PAGE, ScrapeBlocked
+from rate_limit import TokenBucket, backoff_delay
+from selector_registry import registry
+
+RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
+
+# Job posts are fetched before further results pages, so jobs come out as soon as their page is read and the queue stays short
+_JOB_PAGE, _RESULTS_PAGE = 0, 1
+_END = object()  # Put on the results queue once the work queue is empty
+
+
+class RetryableResponse(Exception):
+    """
+    Raised for a response worth asking for again, such as a 429 or a 5xx.
+    """
+
+    def __init__(self, url: str, status: int, retry_after: float = 0):
+        super().__init__(f"{url} returned HTTP {status}")
+        self.status = status
+        self.retry_after = retry_after
+
+
+class HostLimiter:
+    """
+    Politeness limits for one host: at most max_concurrency requests in flight and requests_per_second on average.
+    pause() holds back every request to the host, e.g. for as long as a 429's Retry-After asks.
+    """
+
+    def __init__(self, max_concurrency: int, requests_per_second: float):
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.bucket = TokenBucket(requests_per_second, capacity=max(1, min(max_concurrency, requests_per_second)))
+        self.resume_at = 0
+
+    def pause(self, seconds: float):
+        self.resume_at = max(self.resume_at, time.monotonic() + seconds)
+
+    async def acquire(self):
+        """
+        This function waits until the host may be sent another request and takes a connection slot for it.
+        """
+        await self.semaphore.acquire()
+        try:
+            while self.resume_at > time.monotonic():
+                await asyncio.sleep(self.resume_at - time.monotonic())
+            await self.bucket.acquire()
+        except BaseException:
+            self.semaphore.release()
+            raise
+
+    def release(self):
+        self.semaphore.release()
+
+
+class _Search:
+    """
+    Progress of one search: the job keys queued from its results so far.
+    """
+
+    def __init__(self, job_title_search: str, location_search: str, max_posts: int):
+        self.job_title_search = job_title_search
+        self.location_search = location_search
+        self.max_posts = max_posts
+        self.queued = 0
+
+
+class AsyncCrawler:
+    """
+    Crawls the results of many searches concurrently with concurrency worker tasks sharing one aiohttp session.
+
+    Each host gets at most per_host_concurrency requests in flight and requests_per_second on average. Connection
+    errors, timeouts, 429s and 5xxs are retried up to max_retries times with jittered backoff, honouring Retry-After.
+    timeout is the limit in seconds on each request. A crawl is stopped by cancelling the task iterating crawl(), or
+    by leaving the loop, which cancels every request still in flight.
+    """
+
+    def __init__(self, base_url: str = INDEED_URL, concurrency: int = 16, per_host_concurrency: int = 8,
+                 requests_per_second: float = 5, max_retries: int = 3, timeout: float = 15):
+        self.base_url = base_url.rstrip('/')
+        self.concurrency = concurrency
+        self.per_host_concurrency = per_host_concurrency
+        self.requests_per_second = requests_per_second
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.pages = 0     # Pages fetched
+        self.retries = 0   # Requests that were sent again
+        self.failures = 0  # Pages given up on
+        self._hosts = {}
+
+    def search_url(self, job_title_search: str, location_search: str, page_number: int = 1):
+        return f"{self.base_url}/jobs?" + urlencode({'q': job_title_search, 'l': location_search,
+                                                     'start': (page_number - 1) * RESULTS_PER_PAGE})
+
+    def job_url(self, job_key: str):
+        return f"{self.base_url}/viewjob?" + urlencode({'jk': job_key})
+
+    def _host(self, url: str):
+        # asyncio primitives belong to one event loop, so they are made the first time they're needed inside it
+        host = urlsplit(url).netloc
+        if host not in self._hosts:
+            self._hosts[host] = HostLimiter(self.per_host_concurrency, self.requests_per_second)
+        return self._hosts[host]
+
+    async def fetch(self, session: aiohttp.ClientSession, url: str):
+        """
+        This function returns the HTML of a page once the host's limits allow it, retrying failures that may pass.
+        Raises ScrapeBlocked when Indeed turns the request away.
+        """
+        host = self._host(url)
+        attempt = 0
+        while True:
+            retry_after = 0
+            await host.acquire()
+            try:
+                async with session.get(url) as response:
+                    if response.status in RETRYABLE_STATUSES:
+                        raise RetryableResponse(url, response.status, _retry_after(response.headers.get('Retry-After')))
+                    text = await response.text()
+                    if response.status == 403 or any(marker in text for marker in BLOCKED_PAGE_MARKERS):
+                        raise ScrapeBlocked(f"{url} was turned away with HTTP {response.status}")
+                    response.raise_for_status()
+                    self.pages += 1
+                    return text
+            except (RetryableResponse, aiohttp.ClientConnectionError, aiohttp.ServerTimeoutError, asyncio.TimeoutError) as error:
+                if attempt >= self.max_retries:
+                    raise
+                if isinstance(error, RetryableResponse):
+                    retry_after = error.retry_after
+                    if error.status in (429, 503):
+                        host.pause(max(retry_after, backoff_delay(attempt)))
+            finally:
+                host.release()
+            # Waits with the connection slot given back, so other pages of the host carry on
+            await asyncio.sleep(max(backoff_delay(attempt), retry_after))
+            attempt += 1
+            self.retries += 1
+
+    async def crawl(self, queries, max_posts: int = 100, cache=None):
+        """
+        This function yields the job dictionary of every post on the results of each (job title, location) search, in
+        the order they're scraped, until max_posts jobs have been queued for a search or its results run out. Jobs
+        found by more than one search are scraped once. When a job_cache.JobCache is given, jobs scraped recently are
+        served from it.
+        """
+        work = asyncio.PriorityQueue()
+        results = asyncio.Queue(maxsize=self.concurrency * 2)  # Holds the workers back when the caller falls behind
+        order = itertools.count()  # Keeps the queue first in, first out within a priority
+        seen_job_keys = set()
+
+        async def handle(session, kind, search, payload):
+            if kind == _RESULTS_PAGE:
+                page_number = payload
+                html = await self.fetch(session, self.search_url(search.job_title_search, search.location_search, page_number))
+                job_keys, has_next_page = await asyncio.to_thread(_parse_results_page, html)
+                for job_key in job_keys:
+                    if search.queued >= search.max_posts:
+                        break
+                    if job_key not in seen_job_keys:
+                        seen_job_keys.add(job_key)
+                        search.queued += 1
+                        work.put_nowait((_JOB_PAGE, next(order), search, job_key))
+                if has_next_page and job_keys and search.queued < search.max_posts:
+                    work.put_nowait((_RESULTS_PAGE, next(order), search, page_number + 1))
+                return
+            job_key = payload
+            job_dic = cache.get(job_key) if cache is not None else None
+            if job_dic is None:
+                url = self.job_url(job_key)
+                job_dic = await asyncio.to_thread(parse_job_page, await self.fetch(session, url), url)
+                job_dic['job_key'] = job_key
+                if cache is not None:
+                    cache.put(job_key, job_dic)
+            await results.put(job_dic)
+
+        async def worker(session):
+            while True:
+                kind, _, search, payload = await work.get()
+                try:
+                    await handle(session, kind, search, payload)
+                except Exception as error:
+                    self.failures += 1
+                    print(f"Gave up on {'job ' + payload if kind == _JOB_PAGE else f'results page {payload}'} of "
+                          f"'{search.job_title_search}' in '{search.location_search}': {error!r}")
+                finally:
+                    work.task_done()
+
+        async def finish():
+            await work.join()
+            await results.put(_END)
+
+        for job_title_search, location_search in queries:
+            work.put_nowait((_RESULTS_PAGE, next(order), _Search(job_title_search, location_search, max_posts), 1))
+        connector = aiohttp.TCPConnector(limit=self.concurrency, limit_per_host=self.per_host_concurrency, ttl_dns_cache=300)
+        async with aiohttp.ClientSession(connector=connector, headers=BROWSER_HEADERS,
+                                         timeout=aiohttp.ClientTimeout(total=self.timeout)) as session:
+            tasks = [asyncio.create_task(worker(session)) for _ in range(self.concurrency)]
+            tasks.append(asyncio.create_task(finish()))
+            try:
+                while True:
+                    job_dic = await results.get()
+                    if job_dic is _END:
+                        break
+                    yield job_dic
+            finally:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def _parse_results_page(html: str):
+    """
+    Returns the job keys of the cards on a page of search results, and whether there is a next page.
+    """
+    soup = BeautifulSoup(html, 'html.parser')
+    job_keys = [card.get('data-jk') for card in registry.select(soup, 'job_card')]  # None on cards without one, such as ads
+    return [job_key for job_key in job_keys if job_key], registry.select_one(soup, 'next_page') is not None
+
+
+def _retry_after(value):
+    """
+    Returns the number of seconds a Retry-After header asks us to wait, or 0.
+    """
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return 0
+
+
+def crawl_jobs(queries, max_posts: int = 100, cache=None, **crawler_options):
+    """
+    This function is a plain generator over AsyncCrawler.crawl for code that isn't async. The crawl runs on its own
+    event loop while the next job is asked for, so scraping pauses while the caller works on a job (up to a few
+    jobs are already waiting).
+    """
+    loop = asyncio.new_event_loop()
+    jobs = AsyncCrawler(**crawler_options).crawl(queries, max_posts, cache)
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(jobs.__anext__())
+            except StopAsyncIteration:
+                return
+    finally:
+        loop.run_until_complete(jobs.aclose())
+        loop.close()
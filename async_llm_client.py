@@ -0,0 +1,164 @@
+"""
+asyncio OpenAI client for summarising many scraped job posts at once.
+
+    $ python async_llm_client.py scraped_jobs.jsonl --output job_summaries.jsonl --concurrency 16 --rpm 500
+
+Every summary is stored in the completion cache, so the app shows those jobs without waiting on OpenAI.
+"""
+import argparse
+import asyncio
+import os
+
+import openai
+from dotenv import load_dotenv
+
+from jsonl_sink import JsonlSink, read_jsonl
+from llm_cache import CompletionCache
+from prompts import job_summary_prompt
+from rate_limit import TokenBucket, backoff_delay
+
+RETRYABLE_ERRORS = (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)
+
+
+class AsyncCompletionClient:
+    """
+    Sends chat completions with at most max_concurrency requests in flight, no more than requests_per_minute
+    (and, if set, an estimated tokens_per_minute), retrying 429s, 5xxs and connection errors with jittered backoff.
+    """
+
+    def __init__(self, api_key: str = None, base_url: str = None, max_concurrency: int = 8, requests_per_minute: float = 500,
+                 tokens_per_minute: float = None, max_retries: int = 5, cache: CompletionCache = None, timeout: float = 60):
+        # Retries are done here, so they go through the rate limiter
+        self.client = openai.AsyncOpenAI(api_key=api_key, base_url=base_url, max_retries=0, timeout=timeout)
+        self.max_retries = max_retries
+        self.cache = cache
+        self.max_concurrency = max_concurrency
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._semaphore = None
+        self._request_bucket = None
+        self._token_bucket = None
+
+    def _limits(self):
+        # asyncio primitives belong to one event loop, so they are made the first time they're needed inside it
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._request_bucket = TokenBucket(self.requests_per_minute / 60, capacity=self.max_concurrency)
+            if self.tokens_per_minute:
+                self._token_bucket = TokenBucket(self.tokens_per_minute / 60, capacity=self.tokens_per_minute / 60 * 5)
+        return self._semaphore, self._request_bucket, self._token_bucket
+
+    async def complete(self, prompt: str, model: str = "gpt-4o-mini", temperature: float = 0):
+        """
+        This function returns OpenAI's response to the prompt as a string, from the cache when it has been asked before.
+        """
+        if self.cache is not None:
+            cached_completion = self.cache.get(prompt, model, temperature)
+            if cached_completion is not None:
+                return cached_completion
+        semaphore, request_bucket, token_bucket = self._limits()
+        messages = [{"role": "user", "content": prompt}]
+        attempt = 0
+        async with semaphore:
+            while True:
+                await request_bucket.acquire()
+                if token_bucket is not None:
+                    await token_bucket.acquire(len(prompt) / 4 + 300)  # Rough estimate of prompt plus completion tokens
+                try:
+                    response = await self.client.chat.completions.create(model=model, messages=messages, temperature=temperature)
+                    break
+                except RETRYABLE_ERRORS as error:
+                    if attempt >= self.max_retries:
+                        raise
+                    await asyncio.sleep(max(backoff_delay(attempt), _retry_after(error)))
+                    attempt += 1
+        completion = response.choices[0].message.content
+        if self.cache is not None:
+            self.cache.put(prompt, model, temperature, completion)
+        return completion
+
+    async def complete_many(self, prompts: list, model: str = "gpt-4o-mini", temperature: float = 0, return_exceptions: bool = False):
+        """
+        This function completes every prompt concurrently and returns the responses in the same order.
+        """
+        return await asyncio.gather(*(self.complete(prompt, model, temperature) for prompt in prompts),
+                                    return_exceptions=return_exceptions)
+
+    async def summarise_jobs(self, job_dics: list, return_exceptions: bool = True):
+        """
+        This function returns the summary of every job post, in the same order, using the same prompt as the app.
+        Failed summaries are returned as the exception when return_exceptions is set.
+        """
+        prompts = [job_summary_prompt(job_dic['job_description']) for job_dic in job_dics]
+        return await self.complete_many(prompts, return_exceptions=return_exceptions)
+
+    async def close(self):
+        await self.client.close()
+
+
+def _retry_after(error):
+    """
+    Returns the number of seconds the server asked us to wait, or 0.
+    """
+    response = getattr(error, 'response', None)
+    try:
+        return float(response.headers.get('retry-after', 0))
+    except (AttributeError, TypeError, ValueError):
+        return 0
+
+
+async def summarise_file(input_path: str, output_path: str, client: AsyncCompletionClient, batch_size: int = 200):
+    """
+    This function summarises every job in a scraped jobs JSON lines file, a batch at a time, and appends the jobs with
+    their summaries to output_path. It returns the number of jobs summarised and the number that failed.
+    """
+    summarised = failed = 0
+    with JsonlSink(output_path) as sink:
+        batch = []
+        for job_dic in read_jsonl(input_path):
+            batch.append(job_dic)
+            if len(batch) == batch_size:
+                done = await _summarise_batch(batch, client, sink)
+                summarised, failed, batch = summarised + done, failed + len(batch) - done, []
+        if batch:
+            done = await _summarise_batch(batch, client, sink)
+            summarised, failed = summarised + done, failed + len(batch) - done
+    return summarised, failed
+
+
+async def _summarise_batch(batch, client, sink):
+    done = 0
+    for job_dic, summary in zip(batch, await client.summarise_jobs(batch)):
+        if isinstance(summary, BaseException):
+            print(f"Couldn't summarise {job_dic.get('application_link')}: {summary!r}")
+            continue
+        sink.write(dict(job_dic, job_desc_summary=summary))
+        done += 1
+    return done
+
+
+async def _main(args):
+    cache = CompletionCache(os.getenv('COMPLETION_CACHE_PATH', 'completion_cache.sqlite3'))
+    client = AsyncCompletionClient(os.getenv('APIKEY'), max_concurrency=args.concurrency, requests_per_minute=args.rpm,
+                                   tokens_per_minute=args.tpm, cache=cache)
+    try:
+        summarised, failed = await summarise_file(args.input, args.output, client)
+    finally:
+        await client.close()
+        cache.close()
+    print(f"Summarised {summarised} jobs into {args.output}, {failed} failed. Cache: {cache.stats()}")
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description='Summarise every job in a scraped jobs JSON lines file.')
+    parser.add_argument('input', help='JSON lines file written by pipeline.py')
+    parser.add_argument('--output', default='job_summaries.jsonl', help='JSON lines file the summarised jobs are appended to')
+    parser.add_argument('--concurrency', type=int, default=8, help='maximum number of requests in flight')
+    parser.add_argument('--rpm', type=float, default=500, help='requests per minute allowed by our OpenAI rate limit')
+    parser.add_argument('--tpm', type=float, help='tokens per minute allowed by our OpenAI rate limit')
+    asyncio.run(_main(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
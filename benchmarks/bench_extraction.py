@@ -0,0 +1,387 @@
+"""
+Measures the extraction path on saved Indeed pages, with no live Indeed access.
+
+The search results and job post pages in benchmarks/fixtures (or --fixtures) are replayed by a local HTTP server in
+its own process: every search gets --pages results pages with their own job keys, and each job key is served one of
+the saved job posts. Each backend then scrapes them:
+
+    static  parse_job_page on the saved pages, with the time of each field's lookup
+    http    HttpScraper.crawl_results over the local server
+    async   AsyncCrawler.crawl over the local server
+    chrome  a headless Chrome from driver_pool opening each results page and job post, timing save_job_information
+            and each find_* function (needs Chrome, so not run by default)
+
+and reports per-post and per-field latency percentiles, throughput and peak Python memory (from a second run under
+tracemalloc). Save the results of two commits and diff them:
+
+    $ python benchmarks/bench_extraction.py --output before.json
+    $ python benchmarks/bench_extraction.py --backends static,http,async,chrome --output after.json --compare before.json
+    $ python benchmarks/bench_extraction.py --diff before.json after.json
+
+Drop real saved pages into the fixtures directory as search_*.html and job_*.html to measure them instead.
+The Chrome backend opens pages directly rather than searching from the home page and clicking each card
+(load_and_search and next_job_posting), since those need Indeed itself.
+"""
+import argparse
+import asyncio
+import glob
+import http.server
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+import numpy as np
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from async_crawler import AsyncCrawler  # noqa: E402
+from driver_pool import DriverPool  # noqa: E402
+from find_core_job_details import (JOB_FIELDS, element_text, find_apply_link, find_company,  # noqa: E402
+                                   find_company_rating, find_employment_type, find_job_description, find_job_title,
+                                   find_location, find_salary, parse_job_page, save_job_information, wait_for_job_post)
+from http_scraper import RESULTS_PER_PAGE, HttpScraper, new_http_session  # noqa: E402
+from selector_registry import registry  # noqa: E402
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES_DIR = os.path.join(REPO_DIR, 'benchmarks', 'fixtures')
+
+FIND_FUNCTIONS = {'job_title': find_job_title, 'company': find_company, 'company_rating': find_company_rating,
+                  'location': find_location, 'salary': find_salary, 'employment_type': find_employment_type,
+                  'job_description': find_job_description, 'application_link': find_apply_link}
+
+
+def load_fixtures(directory: str):
+    """
+    This function returns the HTML of the saved search results pages and job posts in the directory.
+    """
+    def read(pattern):
+        pages = []
+        for path in sorted(glob.glob(os.path.join(directory, pattern))):
+            with open(path, encoding='utf-8') as infile:
+                pages.append(infile.read())
+        return pages
+    search_pages, job_pages = read('search_*.html'), read('job_*.html')
+    if not search_pages or not job_pages:
+        raise SystemExit(f"{directory} needs at least one search_*.html and one job_*.html")
+    return search_pages, job_pages
+
+
+def search_query(search_number: int):
+    return f'data analyst {search_number}'
+
+
+def replay_routes(search_pages, job_pages, searches: int, pages: int):
+    """
+    This function returns {(path, key): HTML bytes} for the replay server: ('/jobs', (query, start)) for every results
+    page of every search and ('/viewjob', job key) for every job on them. Job keys are made unique per page and the
+    next page link points at the next replayed page, or is removed from the last one.
+    """
+    routes = {}
+    job_number = 0
+    for search_number in range(searches):
+        query = search_query(search_number)
+        for page_number in range(pages):
+            soup = BeautifulSoup(search_pages[page_number % len(search_pages)], 'html.parser')
+            for card in registry.select(soup, 'job_card'):
+                job_key = f"{card['data-jk']}s{search_number}p{page_number}"
+                card['data-jk'] = job_key
+                card['href'] = '/viewjob?' + urlencode({'jk': job_key})
+                routes['/viewjob', job_key] = job_pages[job_number % len(job_pages)].encode('utf-8')
+                job_number += 1
+            next_link = registry.select_one(soup, 'next_page')
+            if next_link is not None:
+                if page_number + 1 < pages:
+                    next_link['href'] = '/jobs?' + urlencode({'q': query, 'l': '', 'start': (page_number + 1) * RESULTS_PER_PAGE})
+                else:
+                    next_link.decompose()
+            routes['/jobs', (query, page_number * RESULTS_PER_PAGE)] = str(soup).encode('utf-8')
+    registry.reset_stats()
+    return routes
+
+
+def serve_routes(routes: dict, ports, delay: float):
+    """
+    Runs the replay server. Started in its own process so serving pages doesn't take the benchmark's GIL.
+    """
+    class ReplayHandler(http.server.BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # Keep-alive, like Indeed
+        disable_nagle_algorithm = True  # Otherwise the body waits for the headers' delayed ACK, 40 ms a page
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            query = {name: values[0] for name, values in parse_qs(url.query).items()}
+            key = (query.get('q', ''), int(query.get('start', 0))) if url.path == '/jobs' else query.get('jk')
+            body = routes.get((url.path, key))
+            if delay:
+                time.sleep(delay)
+            self.send_response(200 if body is not None else 404)
+            body = body if body is not None else b'Not found'
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), ReplayHandler)
+    ports.put(server.server_address[1])
+    server.serve_forever()
+
+
+class ReplayServer:
+    """
+    The replay server process, e.g. with ReplayServer(routes) as base_url.
+    """
+
+    def __init__(self, routes: dict, delay: float = 0):
+        self.routes = routes
+        self.delay = delay
+        self._process = None
+
+    def __enter__(self):
+        context = multiprocessing.get_context('spawn')
+        ports = context.Queue()
+        self._process = context.Process(target=serve_routes, args=(self.routes, ports, self.delay), daemon=True)
+        self._process.start()
+        return f"http://127.0.0.1:{ports.get(timeout=30)}"
+
+    def __exit__(self, *exc_info):
+        self._process.terminate()
+        self._process.join()
+
+
+def percentiles_ms(seconds):
+    """
+    This function returns the p50, p95 and p99 of a list of durations in milliseconds.
+    """
+    if not len(seconds):
+        return None
+    p50, p95, p99 = np.percentile(seconds, (50, 95, 99)) * 1000
+    return {'p50': float(p50), 'p95': float(p95), 'p99': float(p99)}
+
+
+def bench_static(search_pages, job_pages, repeat: int):
+    """
+    This function parses every saved page repeat times, timing each post and the lookup of each of its fields.
+    """
+    post_times, soup_times, results_times = [], [], []
+    field_times = {field: [] for field in JOB_FIELDS}
+    url = 'https://uk.indeed.com/viewjob?jk=replay'
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for html in job_pages:
+            post_started = time.perf_counter()
+            parse_job_page(html, url)
+            post_times.append(time.perf_counter() - post_started)
+        for html in search_pages:
+            page_started = time.perf_counter()
+            [card['data-jk'] for card in registry.select(BeautifulSoup(html, 'html.parser'), 'job_card')]
+            results_times.append(time.perf_counter() - page_started)
+    seconds = time.perf_counter() - started
+    # The same work as parse_job_page, a step at a time
+    for _ in range(repeat):
+        for html in job_pages:
+            step_started = time.perf_counter()
+            soup = BeautifulSoup(html, 'html.parser')
+            soup_times.append(time.perf_counter() - step_started)
+            for field in JOB_FIELDS:
+                step_started = time.perf_counter()
+                element = registry.select_one(soup, field)
+                if element is not None and field != 'application_link':
+                    element_text(element)
+                field_times[field].append(time.perf_counter() - step_started)
+    return {'posts': len(post_times), 'seconds': seconds, 'posts_per_second': len(post_times) / seconds,
+            'post_ms': percentiles_ms(post_times), 'results_page_ms': percentiles_ms(results_times),
+            'fields_ms': dict({'html_parse': percentiles_ms(soup_times)},
+                              **{field: percentiles_ms(times) for field, times in field_times.items()})}
+
+
+def bench_http(base_url: str, searches: int, max_posts: int):
+    """
+    This function crawls every search over HTTP one after the other, timing each post from the one before.
+    """
+    scraper = HttpScraper(new_http_session(), base_url=base_url)
+    post_times = []
+    started = time.perf_counter()
+    for search_number in range(searches):
+        post_started = time.perf_counter()
+        for _ in scraper.crawl_results(search_query(search_number), '', max_posts):
+            post_times.append(time.perf_counter() - post_started)
+            post_started = time.perf_counter()
+    seconds = time.perf_counter() - started
+    scraper.session.close()
+    return {'posts': len(post_times), 'pages': scraper.http_pages, 'seconds': seconds,
+            'posts_per_second': len(post_times) / seconds, 'post_ms': percentiles_ms(post_times)}
+
+
+def bench_async(base_url: str, searches: int, max_posts: int, concurrency: int):
+    """
+    This function crawls every search at once with the asyncio crawler, with no rate limit.
+    """
+    crawler = AsyncCrawler(base_url, concurrency=concurrency, per_host_concurrency=concurrency, requests_per_second=1e9)
+    arrivals = []
+
+    async def crawl():
+        async for _ in crawler.crawl([(search_query(search_number), '') for search_number in range(searches)], max_posts):
+            arrivals.append(time.perf_counter())
+
+    started = time.perf_counter()
+    asyncio.run(crawl())
+    seconds = time.perf_counter() - started
+    return {'posts': len(arrivals), 'pages': crawler.pages, 'seconds': seconds, 'posts_per_second': len(arrivals) / seconds,
+            'first_post_ms': (arrivals[0] - started) * 1000 if arrivals else None, 'failures': crawler.failures}
+
+
+def bench_chrome(base_url: str, searches: int, max_posts: int):
+    """
+    This function opens every results page and job post in a headless Chrome, timing save_job_information on each
+    post and then every find_* function on the same page.
+    """
+    results_times, post_times = [], []
+    field_times = {field: [] for field in FIND_FUNCTIONS}
+    pool = DriverPool(max_size=1)
+    started = time.perf_counter()
+    try:
+        with pool.driver() as driver:
+            for search_number in range(searches):
+                page_number, scraped = 0, 0
+                while scraped < max_posts:
+                    page_started = time.perf_counter()
+                    driver.get(f"{base_url}/jobs?" + urlencode({'q': search_query(search_number), 'l': '',
+                                                                 'start': page_number * RESULTS_PER_PAGE}))
+                    job_keys = [card.get_attribute('data-jk') for card in registry.find_all(driver, 'job_card')]
+                    has_next_page = registry.find(driver, 'next_page') is not None
+                    results_times.append(time.perf_counter() - page_started)
+                    for job_key in job_keys[:max_posts - scraped]:
+                        post_started = time.perf_counter()
+                        driver.get(f"{base_url}/viewjob?" + urlencode({'jk': job_key}))
+                        save_job_information(driver)
+                        post_times.append(time.perf_counter() - post_started)
+                        wait_for_job_post(driver)
+                        for field, find_function in FIND_FUNCTIONS.items():
+                            field_started = time.perf_counter()
+                            find_function(driver)
+                            field_times[field].append(time.perf_counter() - field_started)
+                        scraped += 1
+                    if not has_next_page or not job_keys:
+                        break
+                    page_number += 1
+    finally:
+        pool.close()
+    seconds = time.perf_counter() - started
+    return {'posts': len(post_times), 'seconds': seconds, 'posts_per_second': len(post_times) / seconds,
+            'post_ms': percentiles_ms(post_times), 'results_page_ms': percentiles_ms(results_times),
+            'fields_ms': {field: percentiles_ms(times) for field, times in field_times.items()}}
+
+
+def peak_memory_mb(function, *args):
+    """
+    This function runs the function again under tracemalloc and returns the peak Python memory it allocated in megabytes.
+    """
+    tracemalloc.start()
+    try:
+        function(*args)
+        return tracemalloc.get_traced_memory()[1] / 1024 / 1024
+    finally:
+        tracemalloc.stop()
+
+
+def flatten(results: dict, prefix: str = ''):
+    """
+    This function returns {'dotted.key': number} for every number in nested results.
+    """
+    numbers = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            numbers.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            numbers[prefix + key] = value
+    return numbers
+
+
+def print_diff(before: dict, after: dict):
+    """
+    This function prints every measurement of two result files side by side with its change.
+    """
+    print(f"Comparing {before.get('commit') or 'before'} with {after.get('commit') or 'after'}")
+    old, new = flatten(before['results']), flatten(after['results'])
+    for key in sorted(old.keys() | new.keys()):
+        old_value, new_value = old.get(key), new.get(key)
+        change = f"{(new_value - old_value) / old_value:+8.1%}" if old_value and new_value is not None else ''
+        print(f"{key:48} {'' if old_value is None else f'{old_value:12.3f}':>12} {'' if new_value is None else f'{new_value:12.3f}':>12} {change}")
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark job extraction by replaying saved Indeed pages.')
+    parser.add_argument('--backends', default='static,http,async', help='comma separated: static, http, async, chrome')
+    parser.add_argument('--fixtures', default=FIXTURES_DIR, help='directory of saved search_*.html and job_*.html pages')
+    parser.add_argument('--searches', type=int, default=4, help='number of searches replayed')
+    parser.add_argument('--pages', type=int, default=5, help='results pages per search')
+    parser.add_argument('--max-posts', type=int, default=50, help='job posts scraped per search')
+    parser.add_argument('--repeat', type=int, default=20, help='times the static backend parses each saved page')
+    parser.add_argument('--concurrency', type=int, default=16, help='pages fetched at once by the async backend')
+    parser.add_argument('--latency-ms', type=float, default=0, help='delay the replay server adds to every response')
+    parser.add_argument('--no-memory', action='store_true', help="skip the tracemalloc runs")
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='results JSON file of an earlier run to diff this one with')
+    parser.add_argument('--diff', nargs=2, metavar=('BEFORE', 'AFTER'), help='diff two results files without running anything')
+    args = parser.parse_args()
+
+    if args.diff:
+        with open(args.diff[0]) as before, open(args.diff[1]) as after:
+            print_diff(json.load(before), json.load(after))
+        return
+
+    search_pages, job_pages = load_fixtures(args.fixtures)
+    backends = [backend.strip() for backend in args.backends.split(',') if backend.strip()]
+    routes = replay_routes(search_pages, job_pages, args.searches, args.pages)
+    results = {}
+    with ReplayServer(routes, args.latency_ms / 1000) as base_url:
+        runs = {'static': (bench_static, search_pages, job_pages, args.repeat),
+                'http': (bench_http, base_url, args.searches, args.max_posts),
+                'async': (bench_async, base_url, args.searches, args.max_posts, args.concurrency),
+                'chrome': (bench_chrome, base_url, args.searches, args.max_posts)}
+        for backend in backends:
+            function, *function_args = runs[backend]
+            registry.reset_stats()
+            results[backend] = function(*function_args)
+            results[backend]['selector_misses'] = {name: name_stats['misses'] for name, name_stats in registry.stats().items()
+                                                   if name_stats['misses']}
+            if not args.no_memory and backend != 'chrome':  # Chrome's memory is in its own processes
+                results[backend]['peak_memory_mb'] = peak_memory_mb(function, *function_args)
+            post_ms = results[backend].get('post_ms') or {}
+            print(f"{backend:7} {results[backend]['posts']:6} posts {results[backend]['posts_per_second']:9.1f} posts/s"
+                  + (f"  post p50 {post_ms['p50']:.2f} ms p95 {post_ms['p95']:.2f} ms" if post_ms else '')
+                  + (f"  peak {results[backend]['peak_memory_mb']:.1f} MB" if 'peak_memory_mb' in results[backend] else ''))
+            for field, field_ms in (results[backend].get('fields_ms') or {}).items():
+                print(f"        {field:18} p50 {field_ms['p50']:.3f} ms  p95 {field_ms['p95']:.3f} ms")
+
+    report = {'commit': git_commit(), 'python': sys.version.split()[0],
+              'config': {'fixtures': [os.path.basename(path) for path in sorted(glob.glob(os.path.join(args.fixtures, '*.html')))],
+                         'searches': args.searches, 'pages': args.pages, 'max_posts': args.max_posts, 'repeat': args.repeat,
+                         'concurrency': args.concurrency, 'latency_ms': args.latency_ms},
+              'results': results}
+    if args.output:
+        with open(args.output, 'w') as outfile:
+            json.dump(report, outfile, indent=2)
+    if args.compare:
+        with open(args.compare) as infile:
+            print_diff(json.load(infile), report)
+
+
+if __name__ == '__main__':
+    main()
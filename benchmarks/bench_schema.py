@@ -0,0 +1,171 @@
+"""
+Checks that every hot query of the app is served by an index at production scale.
+
+Builds the schema plus every migration in a scratch PostgreSQL schema, fills it with synthetic data
+(1M users and 10M jobs by default), then runs EXPLAIN ANALYZE on each hot query and reports the plan.
+
+    $ python benchmarks/bench_schema.py                       # Full size, takes a while
+    $ python benchmarks/bench_schema.py --users 100000 --jobs 1000000 --output schema_bench.json
+
+Exits with status 1 if any hot query sequentially scans one of the app's tables.
+Uses the same DB_* environment variables as the app.
+"""
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import sys
+import time
+
+import psycopg2
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db import (PROFILE_QUERY, SAVE_JOB_QUERY, SAVED_JOBS_NEWEST_QUERY, SAVED_JOBS_OLDEST_QUERY, SEARCH_JOBS_QUERY,  # noqa: E402
+                SEARCH_SAVED_JOBS_QUERY)
+from migrate import migration_files  # noqa: E402
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_SCHEMA = 'role_ready_bench'
+
+# name -> (query, parameters). Parameters may use {user_id}, {user_name} and {job_key} from the sample data.
+HOT_QUERIES = {
+    # A name that is taken, as the unique index turns it away without writing anything
+    'create_account': ("""INSERT INTO users(user_name, user_password) VALUES (%(user_name)s, %(password)s)
+                          ON CONFLICT (user_name) DO NOTHING RETURNING user_id""", {'password': 'password'}),
+    'login': ("SELECT user_id FROM users WHERE user_name = %(user_name)s AND user_password = %(password)s", {'password': 'password'}),
+    # User 1 has saved a twentieth of all the jobs
+    'saved_jobs_first_page': (SAVED_JOBS_NEWEST_QUERY, {'user_id': 1, 'after_date': None, 'after_job_id': None, 'text': None, 'limit': 21}),
+    'saved_jobs_later_page': (SAVED_JOBS_NEWEST_QUERY, {'user_id': 1, 'after_date': datetime.date.today() - datetime.timedelta(days=300),
+                                                        'after_job_id': 0, 'text': None, 'limit': 21}),
+    'saved_jobs_oldest_first': (SAVED_JOBS_OLDEST_QUERY, {'user_id': 1, 'after_date': None, 'after_job_id': None, 'text': None, 'limit': 21}),
+    'save_job': (SAVE_JOB_QUERY, {'job_title': 'Job title', 'company_name': 'Company', 'location': 'Location', 'salary': None,
+                                  'employment_type': None, 'job_description': 'Description', 'company_rating': None,
+                                  'link_to_application': None}),
+    'load_profile': (PROFILE_QUERY, {}),
+    'search_jobs': (SEARCH_JOBS_QUERY, {'query': 'data analyst', 'user_id': None, 'location': 'London',
+                                        'company': None, 'employment_type': None, 'candidates': None, 'limit': 21, 'offset': 0}),
+    'search_broad': (SEARCH_JOBS_QUERY, {'query': 'engineer', 'location': None, 'company': None, 'employment_type': None,
+                                         'candidates': None, 'limit': 21, 'offset': 0}),
+    'search_broad_newest_1000': (SEARCH_JOBS_QUERY, {'query': 'engineer', 'location': None, 'company': None, 'employment_type': None,
+                                                     'candidates': 1000, 'limit': 21, 'offset': 0}),
+    'search_saved_jobs': (SEARCH_SAVED_JOBS_QUERY, {'query': 'analyst', 'location': None, 'company': None, 'employment_type': None,
+                                                    'candidates': None, 'limit': 21, 'offset': 0}),
+}
+
+LOAD_DATA = [
+    """INSERT INTO users(user_name, user_password)
+       SELECT 'user_' || i, 'password' FROM generate_series(1, %(users)s) AS i""",
+    """INSERT INTO jobs(job_key, job_title, company_name, location, salary, employment_type, job_description, company_rating, link_to_application)
+       SELECT 'jk:' || md5(i::text),
+              (ARRAY['Data Analyst', 'Software Engineer', 'Project Manager', 'Nurse', 'Accountant', 'Teacher', 'Sales Executive',
+                     'Data Scientist', 'Warehouse Operative', 'Marketing Manager'])[1 + i %% 10] || ' ' || (i %% 500),
+              'Company ' || (i %% 50000),
+              (ARRAY['London', 'Manchester', 'Leeds', 'Bristol', 'Glasgow', 'Remote'])[1 + i %% 6] || ' ' || (i %% 300),
+              '£' || (20000 + i %% 60000), 'Full-time',
+              'Description of job ' || i || '. ' || (ARRAY['Python and SQL reporting.', 'Stakeholder management and budgeting.',
+                                                            'Customer care and teamwork.', 'Excel, forecasting and audits.',
+                                                            'Cloud platforms and machine learning.'])[1 + i %% 5], round((i %% 50) / 10.0, 1)::text, 'https://uk.indeed.com/viewjob?jk=' || md5(i::text)
+       FROM generate_series(1, %(jobs)s) AS i""",
+    """INSERT INTO users_jobs(user_id, job_id, saved_date)
+       SELECT 1 + (i::bigint * 7919) %% %(users)s, i, current_date - (i %% 365) FROM generate_series(1, %(jobs)s) AS i""",
+    """INSERT INTO users_jobs(user_id, job_id, saved_date)
+       SELECT 1, i, current_date - (i %% 365) FROM generate_series(20, %(jobs)s, 20) AS i
+       ON CONFLICT DO NOTHING""",
+    """INSERT INTO work_experiences(user_id, job_title, company, start_date, end_date, city, country, job_description, position)
+       SELECT u, 'Job ' || n, 'Company ' || n, date '2015-01-01' + n * 365, date '2015-12-31' + n * 365, 'City', 'UK', 'Did things', n
+       FROM generate_series(1, %(users)s) AS u, generate_series(0, 2) AS n""",
+    """INSERT INTO education(user_id, university, degree, graduation_year, grade, position)
+       SELECT u, 'University', 'Degree', 2014, '2:1', 0 FROM generate_series(1, %(users)s) AS u""",
+    """INSERT INTO projects(user_id, start_date, end_date, description, position)
+       SELECT u, date '2020-01-01', date '2020-06-01', 'Project ' || n || ' of user ' || u, n
+       FROM generate_series(1, %(users)s) AS u, generate_series(0, 1) AS n""",
+    """INSERT INTO certifications(user_id, certificate, position)
+       SELECT u, 'Certificate ' || n, n FROM generate_series(1, %(users)s) AS u, generate_series(0, 1) AS n""",
+    """INSERT INTO skills(user_id, skill)
+       SELECT u, ARRAY['SQL', 'Python', 'Excel'] FROM generate_series(1, %(users)s) AS u""",
+]
+
+APP_TABLES = {'users', 'jobs', 'users_jobs', 'work_experiences', 'education', 'projects', 'certifications', 'skills'}
+
+
+def build_schema(cursor, users: int, jobs: int):
+    """
+    This function creates the scratch schema with every migration applied and loads the synthetic data.
+    """
+    cursor.execute(f'DROP SCHEMA IF EXISTS {BENCH_SCHEMA} CASCADE')
+    cursor.execute(f'CREATE SCHEMA {BENCH_SCHEMA}')
+    cursor.execute(f'SET search_path TO {BENCH_SCHEMA}')
+    with open(os.path.join(REPO_DIR, 'role_ready_query.sql')) as infile:
+        cursor.execute(infile.read())
+    for version, path in migration_files():
+        with open(path) as infile:
+            cursor.execute(infile.read())
+    for statement in LOAD_DATA:
+        started = time.perf_counter()
+        cursor.execute(statement, {'users': users, 'jobs': jobs})
+        print(f"Loaded {cursor.rowcount} rows in {time.perf_counter() - started:.1f}s: {statement.split('(')[0].strip()}")
+    cursor.execute('ANALYZE')
+
+
+def plan_nodes(plan: dict):
+    """
+    This function yields every node of an EXPLAIN (FORMAT JSON) plan.
+    """
+    yield plan
+    for child in plan.get('Plans', []):
+        yield from plan_nodes(child)
+
+
+def explain(cursor, query: str, params: dict):
+    """
+    This function runs EXPLAIN ANALYZE on a query and returns its scans, whether it sequentially scans an app table and its run time.
+    """
+    cursor.execute('EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) ' + query, params)
+    result = cursor.fetchone()[0][0]
+    scans = [f"{node['Node Type']} on {node['Relation Name']}" + (f" using {node['Index Name']}" if 'Index Name' in node else '')
+             for node in plan_nodes(result['Plan']) if 'Relation Name' in node]
+    seq_scans = [scan for scan in scans if scan.startswith('Seq Scan') and scan.split(' on ')[1] in APP_TABLES]
+    return {'scans': scans, 'seq_scans': seq_scans, 'execution_ms': result['Execution Time'], 'planning_ms': result['Planning Time']}
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description='EXPLAIN the hot queries of the app against a large synthetic database.')
+    parser.add_argument('--users', type=int, default=1_000_000)
+    parser.add_argument('--jobs', type=int, default=10_000_000)
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--keep', action='store_true', help='keep the scratch schema (and skip reloading it next time with --reuse)')
+    parser.add_argument('--reuse', action='store_true', help='reuse the scratch schema kept by an earlier --keep run')
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(dbname=os.getenv('DB_NAME'), user=os.getenv('DB_USER'), password=os.getenv('DB_PASSWORD'),
+                            host=os.getenv('DB_HOST'), port=os.getenv('DB_PORT'))
+    conn.autocommit = True
+    cursor = conn.cursor()
+    if args.reuse:
+        cursor.execute(f'SET search_path TO {BENCH_SCHEMA}')
+    else:
+        build_schema(cursor, args.users, args.jobs)
+
+    sample = {'user_id': args.users // 2, 'user_name': f'user_{args.users // 2}',
+              'job_key': 'jk:' + hashlib.md5(str(args.jobs // 2).encode()).hexdigest()}
+    results = {}
+    for name, (query, params) in HOT_QUERIES.items():
+        explain(cursor, query, dict(sample, **params))  # Warm the cache so timings compare between runs
+        results[name] = explain(cursor, query, dict(sample, **params))
+        status = 'SEQ SCAN' if results[name]['seq_scans'] else 'ok'
+        print(f"{name:28} {status:8} {results[name]['execution_ms']:8.3f} ms  {'; '.join(results[name]['scans'])}")
+
+    if not args.keep:
+        cursor.execute(f'DROP SCHEMA {BENCH_SCHEMA} CASCADE')
+    conn.close()
+    if args.output:
+        with open(args.output, 'w') as outfile:
+            json.dump({'users': args.users, 'jobs': args.jobs, 'queries': results}, outfile, indent=2)
+    sys.exit(1 if any(result['seq_scans'] for result in results.values()) else 0)
+
+
+if __name__ == '__main__':
+    main()
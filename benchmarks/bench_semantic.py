@@ -0,0 +1,101 @@
+"""
+Measures the semantic index at production scale: build time, top-k query latency and recall, and the cost of adding a
+job once the index is built.
+
+Fills a scratch index with synthetic unit vectors (1M by default) drawn around random topics, like postings for the
+same kind of job, and compares each approximate answer with the exact one from scoring every vector.
+
+    $ python benchmarks/bench_semantic.py
+    $ python benchmarks/bench_semantic.py --jobs 100000 --nprobe 8 --output semantic_bench.json
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from semantic_search import HashingEmbedder, SemanticIndex, normalise  # noqa: E402
+
+
+def synthetic_vectors(count: int, dim: int, topics: int, rng):
+    """
+    This function yields (job_ids, vectors) chunks of unit vectors scattered around random topic directions.
+    """
+    centres = normalise(rng.standard_normal((topics, dim)))
+    for start in range(0, count, 100000):
+        size = min(100000, count - start)
+        vectors = centres[rng.integers(0, topics, size)] + rng.standard_normal((size, dim)).astype(np.float32) * 0.06
+        yield np.arange(start + 1, start + size + 1), normalise(vectors)
+
+
+def percentile_ms(timings, percentile: float):
+    return float(np.percentile(timings, percentile) * 1000)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the semantic index on synthetic job vectors.')
+    parser.add_argument('--jobs', type=int, default=1_000_000)
+    parser.add_argument('--dim', type=int, default=256)
+    parser.add_argument('--topics', type=int, default=5000, help='number of kinds of job the vectors are drawn around')
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--nprobe', type=int, default=16)
+    parser.add_argument('--output', help='write the results to this JSON file')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    directory = tempfile.mkdtemp(prefix='semantic_bench_')
+    try:
+        index = SemanticIndex(os.path.join(directory, 'index'), HashingEmbedder(args.dim))
+        started = time.perf_counter()
+        for job_ids, vectors in synthetic_vectors(args.jobs, args.dim, args.topics, rng):
+            index.add_vectors(job_ids, vectors)
+        load_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        index.build()
+        build_seconds = time.perf_counter() - started
+        print(f"Loaded {args.jobs} vectors in {load_seconds:.1f}s, built {index.list_count} lists in {build_seconds:.1f}s")
+
+        # Queries are jobs of the index itself, as in "jobs like this one"
+        query_ids = rng.choice(np.arange(1, args.jobs + 1), args.queries, replace=False)
+        queries = np.array([index.vector(int(job_id)) for job_id in query_ids])
+        # Probing every list scores every vector, which gives the exact answer
+        exact_started = time.perf_counter()
+        exact = [{match.job_id for match in index.search_vector(query, args.k, nprobe=index.list_count)} for query in queries]
+        exact_seconds = (time.perf_counter() - exact_started) / args.queries
+
+        timings, recalls = [], []
+        for query, expected in zip(queries, exact):
+            started = time.perf_counter()
+            matches = index.search_vector(query, args.k, args.nprobe)
+            timings.append(time.perf_counter() - started)
+            recalls.append(len(expected & {match.job_id for match in matches}) / args.k)
+
+        add_timings = []
+        for job_id, vector in zip(range(args.jobs + 1, args.jobs + 101), normalise(rng.standard_normal((100, args.dim)))):
+            started = time.perf_counter()
+            index.add_vectors([job_id], [vector])
+            add_timings.append(time.perf_counter() - started)
+
+        results = {'jobs': args.jobs, 'dim': args.dim, 'lists': index.list_count, 'nprobe': args.nprobe, 'k': args.k,
+                   'load_seconds': load_seconds, 'build_seconds': build_seconds,
+                   'query_p50_ms': percentile_ms(timings, 50), 'query_p95_ms': percentile_ms(timings, 95),
+                   'exact_query_ms': exact_seconds * 1000, 'recall': float(np.mean(recalls)),
+                   'add_p50_ms': percentile_ms(add_timings, 50), 'add_p95_ms': percentile_ms(add_timings, 95)}
+        print(f"top-{args.k} query p50 {results['query_p50_ms']:.2f} ms, p95 {results['query_p95_ms']:.2f} ms, "
+              f"recall {results['recall']:.3f} (scoring every vector takes {results['exact_query_ms']:.1f} ms)")
+        print(f"adding one job p50 {results['add_p50_ms']:.2f} ms, p95 {results['add_p95_ms']:.2f} ms")
+    finally:
+        shutil.rmtree(directory)
+    if args.output:
+        with open(args.output, 'w') as outfile:
+            json.dump(results, outfile, indent=2)
+
+
+if __name__ == '__main__':
+    main()
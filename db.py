@@ -0,0 +1,514 @@
+import atexit
+import datetime
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import NamedTuple
+
+import psycopg2
+from psycopg2.extras import execute_values
+from psycopg2.pool import PoolError, ThreadedConnectionPool
+
+
+class DatabasePool:
+    """
+    Thread-safe pool of PostgreSQL connections.
+
+    Holds between min_size and max_size connections; checkout() blocks (up to checkout_timeout seconds) when all of
+    them are in use instead of failing. A connection that has been idle for longer than health_check_interval seconds
+    is pinged before it is handed out, and closed or broken connections are thrown away and replaced.
+    """
+
+    def __init__(self, min_size: int = 1, max_size: int = 10, checkout_timeout: float = 30, health_check_interval: float = 30,
+                 **connect_kwargs):
+        self.checkout_timeout = checkout_timeout
+        self.health_check_interval = health_check_interval
+        self._pool = ThreadedConnectionPool(min_size, max_size, **connect_kwargs)
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._last_used = {}  # id(connection) -> time it was returned to the pool
+
+    def checkout(self):
+        """
+        This function hands out a healthy connection. Give it back with checkin().
+        """
+        if not self._slots.acquire(timeout=self.checkout_timeout):
+            raise PoolError(f"No database connection became free within {self.checkout_timeout} seconds")
+        try:
+            while True:
+                conn = self._pool.getconn()
+                if self._is_healthy(conn):
+                    return conn
+                self._pool.putconn(conn, close=True)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def checkin(self, conn, broken: bool = False):
+        """
+        This function returns a connection to the pool, closing it if it is broken.
+        """
+        broken = broken or conn.closed != 0
+        self._last_used[id(conn)] = time.monotonic()
+        try:
+            self._pool.putconn(conn, close=broken)
+        finally:
+            if broken:
+                self._last_used.pop(id(conn), None)
+            self._slots.release()
+
+    @contextmanager
+    def transaction(self):
+        """
+        This function yields a cursor inside one transaction, committing when the with block finishes and rolling back
+        if it raises. The connection goes back to the pool either way.
+        """
+        conn = self.checkout()
+        broken = False
+        try:
+            with conn.cursor() as cursor:
+                yield cursor
+            conn.commit()
+        except BaseException:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                broken = True
+            raise
+        finally:
+            self.checkin(conn, broken)
+
+    def close(self):
+        self._pool.closeall()
+
+    def _is_healthy(self, conn):
+        if conn.closed:
+            return False
+        last_used = self._last_used.get(id(conn))
+        if last_used is not None and time.monotonic() - last_used < self.health_check_interval:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """
+    This function returns the app's connection pool, creating it from the DB_* environment variables the first time.
+    DB_POOL_MIN and DB_POOL_MAX set the pool size.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = DatabasePool(min_size=int(os.getenv('DB_POOL_MIN', '1')),
+                                 max_size=int(os.getenv('DB_POOL_MAX', '10')),
+                                 dbname=os.getenv('DB_NAME'),
+                                 user=os.getenv('DB_USER'),
+                                 password=os.getenv('DB_PASSWORD'),
+                                 host=os.getenv('DB_HOST'),
+                                 port=os.getenv('DB_PORT'))
+            atexit.register(_pool.close)
+        return _pool
+
+def transaction():
+    """
+    This function yields a cursor from the app's connection pool inside one transaction, see DatabasePool.transaction.
+    """
+    return get_pool().transaction()
+
+def fetch_one(query: str, params: tuple = ()):
+    """
+    This function runs a query in its own transaction and returns the first row, or None.
+    """
+    with transaction() as cursor:
+        cursor.execute(query, params)
+        return cursor.fetchone()
+
+def fetch_all(query: str, params: tuple = ()):
+    """
+    This function runs a query in its own transaction and returns every row.
+    """
+    with transaction() as cursor:
+        cursor.execute(query, params)
+        return cursor.fetchall()
+
+
+class WorkExperience(NamedTuple):
+    work_experience_id: int
+    job_title: str
+    company: str
+    start_date: datetime.date
+    end_date: datetime.date
+    city: str
+    country: str
+    job_description: str
+
+class Education(NamedTuple):
+    education_id: int
+    university: str
+    degree: str
+    graduation_year: int
+    grade: str
+
+class Project(NamedTuple):
+    project_id: int
+    start_date: datetime.date
+    end_date: datetime.date
+    description: str
+
+class Certification(NamedTuple):
+    certification_id: int
+    certificate: str
+
+class Profile(NamedTuple):
+    work_experiences: list
+    education: list
+    projects: list
+    certifications: list
+    skills: list
+
+# Every section of the résumé comes back as a JSON array from one query, so the whole profile is one round trip
+PROFILE_QUERY = """
+SELECT
+    (SELECT COALESCE(json_agg(w ORDER BY w.position, w.work_experience_id), '[]')
+     FROM (SELECT work_experience_id, job_title, company, start_date, end_date, city, country, job_description, position
+           FROM work_experiences WHERE user_id = %(user_id)s) AS w),
+    (SELECT COALESCE(json_agg(e ORDER BY e.position, e.education_id), '[]')
+     FROM (SELECT education_id, university, degree, graduation_year, grade, position
+           FROM education WHERE user_id = %(user_id)s) AS e),
+    (SELECT COALESCE(json_agg(p ORDER BY p.position, p.project_id), '[]')
+     FROM (SELECT project_id, start_date, end_date, description, position
+           FROM projects WHERE user_id = %(user_id)s) AS p),
+    (SELECT COALESCE(json_agg(c ORDER BY c.position, c.certification_id), '[]')
+     FROM (SELECT certification_id, certificate, position
+           FROM certifications WHERE user_id = %(user_id)s) AS c),
+    (SELECT skill FROM skills WHERE user_id = %(user_id)s)
+"""
+
+def _to_date(value):
+    return datetime.date.fromisoformat(value) if value else None
+
+def load_profile(user_id: int):
+    """
+    This function loads the user's whole résumé (work experience, education, projects, certifications and skills)
+    in a single query, with every section in the order it was entered.
+    """
+    work_rows, education_rows, project_rows, certification_rows, skills = fetch_one(PROFILE_QUERY, {'user_id': user_id})
+    for row in work_rows + education_rows + project_rows + certification_rows:
+        del row['position']  # Only used for ordering
+    work_experiences = [WorkExperience(**dict(row, start_date=_to_date(row['start_date']), end_date=_to_date(row['end_date'])))
+                        for row in work_rows]
+    education = [Education(**dict(row, graduation_year=int(row['graduation_year']) if row['graduation_year'] is not None else None))
+                 for row in education_rows]
+    projects = [Project(**dict(row, start_date=_to_date(row['start_date']), end_date=_to_date(row['end_date'])))
+                for row in project_rows]
+    certifications = [Certification(**row) for row in certification_rows]
+    return Profile(work_experiences, education, projects, certifications, skills or [])
+
+
+def _blank_to_none(value):
+    """
+    Empty text inputs become NULL rather than an invalid date or number.
+    """
+    return None if isinstance(value, str) and not value.strip() else value
+
+# For each résumé section: the upsert, its ID column, the positions of its natural key in a row and how to turn a session
+# entry into a row. Re-saving an entry with the same key updates it instead of adding a duplicate. A blank start date is part of the work
+# experience key as -infinity, since NULLs never conflict.
+RESUME_SECTIONS = {
+    'work_experiences': ("""
+        INSERT INTO work_experiences(user_id, job_title, company, start_date, end_date, city, country, job_description, position)
+        VALUES %s
+        ON CONFLICT (user_id, job_title, company, COALESCE(start_date, '-infinity'::date)) DO UPDATE
+        SET end_date = EXCLUDED.end_date, city = EXCLUDED.city, country = EXCLUDED.country, job_description = EXCLUDED.job_description,
+            position = EXCLUDED.position
+        RETURNING work_experience_id
+        """,
+        'work_experience_id',
+        (0, 1, 2, 3),
+        lambda entry: (entry['job_title'], entry['company'], _blank_to_none(entry['start_date']), _blank_to_none(entry['end_date']),
+                       entry['city'], entry['country'], entry['job_description'])),
+    'education': ("""
+        INSERT INTO education(user_id, university, degree, graduation_year, grade, position)
+        VALUES %s
+        ON CONFLICT (user_id, university, degree) DO UPDATE
+        SET graduation_year = EXCLUDED.graduation_year, grade = EXCLUDED.grade, position = EXCLUDED.position
+        RETURNING education_id
+        """,
+        'education_id',
+        (0, 1, 2),
+        lambda entry: (entry['university'], entry['degree'], _blank_to_none(entry.get('grad_year')), entry['grade'])),
+    'projects': ("""
+        INSERT INTO projects(user_id, start_date, end_date, description, position)
+        VALUES %s
+        ON CONFLICT (user_id, md5(description)) DO UPDATE
+        SET start_date = EXCLUDED.start_date, end_date = EXCLUDED.end_date, position = EXCLUDED.position
+        RETURNING project_id
+        """,
+        'project_id',
+        (0, 3),
+        lambda entry: (_blank_to_none(entry['start_date']), _blank_to_none(entry['end_date']), entry['description'])),
+    'certifications': ("""
+        INSERT INTO certifications(user_id, certificate, position)
+        VALUES %s
+        ON CONFLICT (user_id, certificate) DO UPDATE
+        SET position = EXCLUDED.position
+        RETURNING certification_id
+        """,
+        'certification_id',
+        (0, 1),
+        lambda entry: (entry['title'],)),
+}
+
+def bulk_save_section(cursor, section: str, user_entries, page_size: int = 1000, user_ids=()):
+    """
+    This function replaces the entries of one résumé section for every user in user_entries, a list of (user_id, entry)
+    pairs, with batched statements on the caller's cursor so it can share a transaction. Entries are upserted on their
+    natural key and positioned in the order given; the user's other rows in the section, e.g. an entry that was removed
+    or had its key edited, are deleted. Users in user_ids lose every row of the section they have no entries for.
+    It returns the number of rows written.
+    """
+    upsert_query, id_column, key_columns, to_row = RESUME_SECTIONS[section]
+    rows = {}
+    positions = {user_id: -1 for user_id in user_ids}
+    for user_id, entry in user_entries:
+        positions[user_id] = positions.get(user_id, -1) + 1
+        row = (user_id,) + to_row(entry) + (positions[user_id],)
+        # The same key twice in one statement is an error in Postgres, so the last entry for a key wins
+        rows[tuple(row[column] for column in key_columns)] = row
+    saved_ids = [row[0] for row in execute_values(cursor, upsert_query, list(rows.values()), page_size=page_size, fetch=True)]
+    if positions:
+        cursor.execute(f"DELETE FROM {section} WHERE user_id = ANY(%s) AND NOT ({id_column} = ANY(%s))",
+                       (list(positions), saved_ids))
+    return len(rows)
+
+def save_resume_section(user_id: int, section: str, entries):
+    """
+    This function replaces the user's entries of one résumé section with entries, in a single transaction.
+    """
+    with transaction() as cursor:
+        return bulk_save_section(cursor, section, ((user_id, entry) for entry in entries), user_ids=[user_id])
+
+def save_resume(user_id: int, work_experiences=(), education=(), projects=(), certifications=(), skills=None):
+    """
+    This function saves the user's whole résumé in a single transaction, so either every section is saved or none is.
+    """
+    with transaction() as cursor:
+        for section, entries in (('work_experiences', work_experiences), ('education', education),
+                                 ('projects', projects), ('certifications', certifications)):
+            bulk_save_section(cursor, section, ((user_id, entry) for entry in entries), user_ids=[user_id])
+        if skills is not None:
+            cursor.execute("""
+            INSERT INTO skills(user_id, skill)
+            VALUES (%s, %s)
+            ON CONFLICT (user_id) DO UPDATE
+            SET skill = EXCLUDED.skill
+            """, (user_id, list(skills)))
+
+
+# A job is stored once however many users save it. Re-saving an unchanged job doesn't rewrite its row, and the job_id
+# comes from the existing row when the upsert had nothing to update.
+SAVE_JOB_QUERY = """
+WITH upserted AS (
+    INSERT INTO jobs(job_key, job_title, company_name, location, salary, employment_type, job_description, company_rating, link_to_application)
+    VALUES (%(job_key)s, %(job_title)s, %(company_name)s, %(location)s, %(salary)s, %(employment_type)s, %(job_description)s,
+            %(company_rating)s, %(link_to_application)s)
+    ON CONFLICT (job_key) DO UPDATE
+    SET job_title = EXCLUDED.job_title, company_name = EXCLUDED.company_name, location = EXCLUDED.location, salary = EXCLUDED.salary,
+        employment_type = EXCLUDED.employment_type, job_description = EXCLUDED.job_description,
+        company_rating = EXCLUDED.company_rating, link_to_application = EXCLUDED.link_to_application
+    WHERE (jobs.job_title, jobs.company_name, jobs.location, jobs.salary, jobs.employment_type, jobs.job_description,
+           jobs.company_rating, jobs.link_to_application)
+          IS DISTINCT FROM
+          (EXCLUDED.job_title, EXCLUDED.company_name, EXCLUDED.location, EXCLUDED.salary, EXCLUDED.employment_type,
+           EXCLUDED.job_description, EXCLUDED.company_rating, EXCLUDED.link_to_application)
+    RETURNING job_id
+)
+SELECT job_id FROM upserted
+UNION ALL
+SELECT job_id FROM jobs WHERE job_key = %(job_key)s
+LIMIT 1
+"""
+
+def save_job(user_id: int, job: dict, saved_date: datetime.date = None):
+    """
+    This function upserts the job on its job_key and saves it for the user, in one transaction, and returns its job_id.
+    job maps each column of the jobs table (job_key, job_title, company_name, ...) to its value.
+    """
+    with transaction() as cursor:
+        cursor.execute(SAVE_JOB_QUERY, job)
+        row = cursor.fetchone()
+        if row is None:
+            # Another session inserted the job after this statement started, so it wasn't in the statement's snapshot
+            cursor.execute('SELECT job_id FROM jobs WHERE job_key = %s', (job['job_key'],))
+            row = cursor.fetchone()
+        cursor.execute("""
+        INSERT INTO users_jobs(user_id, job_id, saved_date)
+        VALUES(%s, %s, %s)
+        ON CONFLICT (user_id, job_id) DO UPDATE
+        SET saved_date = EXCLUDED.saved_date
+        """, (user_id, row[0], saved_date or datetime.date.today()))
+        return row[0]
+
+
+class JobSearchResult(NamedTuple):
+    job_id: int
+    job_title: str
+    company_name: str
+    location: str
+    salary: str
+    employment_type: str
+    link_to_application: str
+    rank: float
+    snippet: str
+
+# Matches come from the GIN index on jobs.search_vector and every one of them is ranked, so the best match is found however
+# old it is. Ranking costs a couple of microseconds a match; `candidates` caps a broad search to its newest matches where
+# that matters more than finding older ones (LIMIT NULL ranks them all). Only the page that is
+# returned gets a snippet, because ts_headline re-parses the description; matched words are [bracketed] as the app shows
+# snippets as plain text. The location and company filters match words through the same index (see job_field_tsquery in migrations/0006_job_search.sql) and are skipped when
+# they have no words. The tsquery is written out rather than shared through a CTE so the planner can estimate how many
+# jobs it matches. {source} is every job, or the jobs the user saved.
+_SEARCH_JOBS_TEMPLATE = """
+WITH matches AS (
+    SELECT j.job_id, j.search_vector
+    FROM {source}
+    WHERE j.search_vector @@ websearch_to_tsquery('english', %(query)s)
+      AND (job_field_tsquery('location', %(location)s) IS NULL OR j.search_vector @@ job_field_tsquery('location', %(location)s))
+      AND (job_field_tsquery('company', %(company)s) IS NULL OR j.search_vector @@ job_field_tsquery('company', %(company)s))
+      AND (%(employment_type)s::TEXT IS NULL OR j.employment_type ILIKE '%%' || %(employment_type)s || '%%')
+    ORDER BY j.job_id DESC
+    LIMIT %(candidates)s
+),
+page AS (
+    SELECT job_id, ts_rank_cd(search_vector, websearch_to_tsquery('english', %(query)s)) AS rank
+    FROM matches
+    ORDER BY rank DESC, job_id DESC
+    LIMIT %(limit)s OFFSET %(offset)s
+)
+SELECT j.job_id, j.job_title, j.company_name, j.location, j.salary, j.employment_type, j.link_to_application, page.rank,
+       ts_headline('english', COALESCE(j.job_description, ''), websearch_to_tsquery('english', %(query)s),
+                   'StartSel=[, StopSel=], MaxWords=30, MinWords=10, MaxFragments=1')
+FROM page
+JOIN jobs AS j ON j.job_id = page.job_id
+ORDER BY page.rank DESC, j.job_id DESC
+"""
+SEARCH_JOBS_QUERY = _SEARCH_JOBS_TEMPLATE.format(source='jobs AS j')
+SEARCH_SAVED_JOBS_QUERY = _SEARCH_JOBS_TEMPLATE.format(
+    source='users_jobs AS u JOIN jobs AS j ON j.job_id = u.job_id AND u.user_id = %(user_id)s')
+
+def search_jobs(query: str, user_id: int = None, location: str = None, company: str = None, employment_type: str = None,
+                page: int = 0, page_size: int = 20, candidates: int = None):
+    """
+    This function searches the title, company, location and description of every job, best matches first, and returns
+    one page of JobSearchResult along with whether there is another page. The query accepts web search syntax
+    ("quoted phrases", -excluded words, or). Give user_id to search only that user's saved jobs; location and company keep
+    only jobs with those words in that field, and employment_type only jobs containing that text. Every match is
+    ranked, unless candidates is given to rank only that many of the newest matches.
+    """
+    if not query or not query.strip():
+        return [], False
+    rows = fetch_all(SEARCH_JOBS_QUERY if user_id is None else SEARCH_SAVED_JOBS_QUERY,
+                     {'query': query, 'user_id': user_id, 'location': _blank_to_none(location), 'company': _blank_to_none(company),
+                      'employment_type': _blank_to_none(employment_type), 'candidates': candidates,
+                      'limit': page_size + 1, 'offset': page * page_size})
+    return [JobSearchResult(*row) for row in rows[:page_size]], len(rows) > page_size
+
+# Scraped jobs that are already stored (saved by a user, or imported before) are left as they are
+IMPORT_JOBS_QUERY = """
+INSERT INTO jobs(job_key, job_title, company_name, location, salary, employment_type, job_description, company_rating, link_to_application)
+VALUES %s
+ON CONFLICT (job_key) DO NOTHING
+"""
+
+def import_jobs(jobs, page_size: int = 1000):
+    """
+    This function adds jobs (dictionaries of jobs table columns, like save_job takes) that aren't stored yet, in batches
+    of page_size rows per statement and one transaction per batch. It returns the number of jobs added.
+    """
+    columns = ('job_key', 'job_title', 'company_name', 'location', 'salary', 'employment_type', 'job_description',
+               'company_rating', 'link_to_application')
+    added = 0
+    batch = {}
+    for job in jobs:
+        batch[job['job_key']] = tuple(job[column] for column in columns)  # A key twice in one statement is an error
+        if len(batch) == page_size:
+            added += _import_batch(list(batch.values()))
+            batch = {}
+    if batch:
+        added += _import_batch(list(batch.values()))
+    return added
+
+def _import_batch(rows):
+    with transaction() as cursor:
+        execute_values(cursor, IMPORT_JOBS_QUERY, rows, page_size=len(rows))
+        return cursor.rowcount
+
+
+class SavedJob(NamedTuple):
+    job_id: int
+    job_title: str
+    company_name: str
+    location: str
+    salary: str
+    link_to_application: str
+    saved_date: datetime.date
+
+# A page of the user's saved jobs starts after the (saved_date, job_id) of the last row of the previous page, so every page
+# is read straight off the (user_id, saved_date DESC, job_id DESC) index however many jobs the user has saved.
+_SAVED_JOBS_TEMPLATE = """
+SELECT j.job_id, j.job_title, j.company_name, j.location, j.salary, j.link_to_application, u.saved_date
+FROM users_jobs AS u
+JOIN jobs AS j ON j.job_id = u.job_id
+WHERE u.user_id = %(user_id)s
+  AND (%(after_date)s::DATE IS NULL OR (u.saved_date, u.job_id) {compare} (%(after_date)s, %(after_job_id)s))
+  AND (%(text)s::TEXT IS NULL OR j.job_title ILIKE '%%' || %(text)s || '%%' OR j.company_name ILIKE '%%' || %(text)s || '%%')
+ORDER BY u.saved_date {direction}, u.job_id {direction}
+LIMIT %(limit)s
+"""
+SAVED_JOBS_NEWEST_QUERY = _SAVED_JOBS_TEMPLATE.format(compare='<', direction='DESC')
+SAVED_JOBS_OLDEST_QUERY = _SAVED_JOBS_TEMPLATE.format(compare='>', direction='ASC')
+
+def saved_jobs_page(user_id: int, after: tuple = None, page_size: int = 20, newest_first: bool = True, text: str = None):
+    """
+    This function returns one page of the user's saved jobs as SavedJob, newest or oldest saves first, along with the
+    cursor of the next page (None on the last page). Pass that cursor as after to get the next page. text keeps only
+    jobs whose title or company contains it.
+    """
+    after_date, after_job_id = after if after is not None else (None, None)
+    rows = fetch_all(SAVED_JOBS_NEWEST_QUERY if newest_first else SAVED_JOBS_OLDEST_QUERY,
+                     {'user_id': user_id, 'after_date': after_date, 'after_job_id': after_job_id, 'text': _blank_to_none(text),
+                      'limit': page_size + 1})
+    jobs = [SavedJob(*row) for row in rows[:page_size]]
+    next_cursor = (jobs[-1].saved_date, jobs[-1].job_id) if len(rows) > page_size else None
+    return jobs, next_cursor
+
+
+class JobListing(NamedTuple):
+    job_id: int
+    job_title: str
+    company_name: str
+    location: str
+    salary: str
+    link_to_application: str
+    job_description: str
+
+def jobs_by_id(job_ids):
+    """
+    This function returns the jobs with the given job_ids as JobListing, in the same order, skipping any that don't exist.
+    """
+    job_ids = list(job_ids)
+    rows = fetch_all("""
+    SELECT job_id, job_title, company_name, location, salary, link_to_application, job_description
+    FROM jobs
+    WHERE job_id = ANY(%s)
+    """, (job_ids,))
+    jobs = {row[0]: JobListing(*row) for row in rows}
+    return [jobs[job_id] for job_id in job_ids if job_id in jobs]
@@ -0,0 +1,192 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import undetected_chromedriver as uc
+from selenium.webdriver.chrome.options import Options
+
+
+def build_chrome_options(headless: bool = True):
+    """
+    This function returns the Chrome options used for scraping (popups and redirections disabled).
+    undetected_chromedriver refuses to reuse an options object, so a fresh one is built for every driver.
+    """
+    chrome_options = Options()
+    chrome_options.add_argument("--disable-popup-blocking")
+    chrome_options.add_argument("--disable-notifications")
+    chrome_options.add_argument("--disable-extensions")
+    chrome_options.add_argument("--disable-infobars")
+    chrome_options.add_argument("--disable-web-security")
+    chrome_options.add_argument("--disable-blink-features=AutomationControlled")
+    if headless:
+        chrome_options.add_argument("--headless=new")
+    return chrome_options
+
+
+def new_chrome_driver():
+    """
+    This function starts a new undetected Chrome driver. Set CHROME_HEADLESS=0 to watch the browser.
+    """
+    headless = os.getenv('CHROME_HEADLESS', '1') != '0'
+    return uc.Chrome(options=build_chrome_options(headless))
+
+
+class DriverPool:
+    """
+    A bounded pool of warm Chrome drivers.
+
+    At most max_size drivers exist at once; checkout() blocks until one is free. Returned drivers are
+    health checked and parked on about:blank, idle drivers are quit after idle_timeout seconds, and drivers
+    checked out for longer than lease_timeout seconds (e.g. a Streamlit session that went away) are reclaimed.
+    """
+
+    def __init__(self, max_size: int = 2, idle_timeout: float = 300, lease_timeout: float = 900,
+                 checkout_timeout: float = 60, driver_factory=new_chrome_driver):
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.lease_timeout = lease_timeout
+        self.checkout_timeout = checkout_timeout
+        self._driver_factory = driver_factory
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._lock = threading.Lock()
+        self._idle = []     # (driver, time it was checked in)
+        self._leases = {}   # id(driver) -> (driver, time it was last used)
+        self._closed = False
+
+    def checkout(self, timeout: float = None):
+        """
+        This function hands out a healthy driver, reusing an idle one where possible.
+        """
+        if self._closed:
+            raise RuntimeError("Driver pool is closed")
+        self.reclaim_stale_leases()
+        if timeout is None:
+            timeout = self.checkout_timeout
+        if not self._slots.acquire(timeout=timeout):
+            raise TimeoutError(f"No Chrome driver became free within {timeout} seconds")
+        try:
+            self.evict_idle()
+            driver = None
+            while driver is None:
+                with self._lock:
+                    candidate = self._idle.pop()[0] if self._idle else None
+                if candidate is None:
+                    driver = self._driver_factory()
+                elif self._is_healthy(candidate):
+                    driver = candidate
+                else:
+                    self._quit(candidate)
+        except BaseException:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._leases[id(driver)] = (driver, time.monotonic())
+        return driver
+
+    def checkin(self, driver, discard: bool = False):
+        """
+        This function returns a driver to the pool. Broken drivers (or discard=True) are quit instead of kept.
+        """
+        with self._lock:
+            lease = self._leases.pop(id(driver), None)
+        if lease is None:
+            # Already reclaimed or never ours, the slot has been released elsewhere
+            return
+        keep = not discard and not self._closed and self._reset(driver)
+        if keep:
+            with self._lock:
+                self._idle.append((driver, time.monotonic()))
+        else:
+            self._quit(driver)
+        self._slots.release()
+        self.evict_idle()
+
+    @contextmanager
+    def driver(self, timeout: float = None):
+        """
+        This function checks out a driver for the duration of a with block.
+        """
+        driver = self.checkout(timeout)
+        try:
+            yield driver
+        except BaseException:
+            self.checkin(driver, discard=True)
+            raise
+        self.checkin(driver)
+
+    def touch(self, driver):
+        """
+        This function marks a checked out driver as still in use so it isn't reclaimed. Returns False if
+        the driver has already been reclaimed and should not be used any more.
+        """
+        with self._lock:
+            if id(driver) not in self._leases:
+                return False
+            self._leases[id(driver)] = (driver, time.monotonic())
+        return True
+
+    def evict_idle(self):
+        """
+        This function quits drivers that have been idle for longer than idle_timeout.
+        """
+        cutoff = time.monotonic() - self.idle_timeout
+        with self._lock:
+            expired = [driver for driver, last_used in self._idle if last_used < cutoff]
+            self._idle = [(driver, last_used) for driver, last_used in self._idle if last_used >= cutoff]
+        for driver in expired:
+            self._quit(driver)
+
+    def reclaim_stale_leases(self):
+        """
+        This function quits drivers that have been checked out for longer than lease_timeout and frees their slots.
+        """
+        cutoff = time.monotonic() - self.lease_timeout
+        with self._lock:
+            stale = [key for key, (driver, last_used) in self._leases.items() if last_used < cutoff]
+            drivers = [self._leases.pop(key)[0] for key in stale]
+        for driver in drivers:
+            self._quit(driver)
+            self._slots.release()
+
+    def stats(self):
+        """
+        This function returns the number of idle and checked out drivers.
+        """
+        with self._lock:
+            return {'idle': len(self._idle), 'in_use': len(self._leases), 'max_size': self.max_size}
+
+    def close(self):
+        """
+        This function quits every driver owned by the pool.
+        """
+        self._closed = True
+        with self._lock:
+            drivers = [driver for driver, _ in self._idle] + [driver for driver, _ in self._leases.values()]
+            self._idle = []
+            self._leases = {}
+        for driver in drivers:
+            self._quit(driver)
+
+    @staticmethod
+    def _is_healthy(driver):
+        try:
+            driver.current_url  # Round trip to the browser, fails if Chrome has died
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _reset(driver):
+        try:
+            driver.get('about:blank')  # Drop the previous page so memory stays flat while idle
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _quit(driver):
+        try:
+            driver.quit()
+        except Exception:
+            pass
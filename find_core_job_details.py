@@ -1,95 +1,98 @@
 from loading_and_instantiate import *
+from adaptive_wait import element_text_or, waiter
+from selector_registry import registry
+from bs4 import Comment, NavigableString
+from urllib.parse import parse_qs, urljoin, urlparse
+import hashlib
+
+# Fields of a job post, each found with the selector chain of the same name in job_selectors.json
+JOB_FIELDS = ('job_title', 'company', 'company_rating', 'location', 'salary', 'employment_type', 'job_description', 'application_link')
+
+# Value used when a field can't be found on the job post
+MISSING_FIELD_VALUES = {'job_title': 'No Job Title',
+                        'company': 'No Company Name',
+                        'company_rating': 'No Rating',
+                        'location': 'No Location',
+                        'salary': 'No Salary',
+                        'employment_type': 'No Employment Type',
+                        'job_description': 'No Job Description'}
+
+def wait_for_job_post(driver, timeout: float = None):
+    """
+    This function waits once for the job post to load, until its title shows up. It returns False if it didn't in time,
+    so whatever has loaded can still be read. The find_* functions below don't wait, so call this first.
+    """
+    return waiter.settle(driver, 'job_post', registry.present('job_title'), timeout=timeout)
+
+def wait_for_results_page(driver, timeout: float = None):
+    """
+    This function waits for a page of search results to load, until its first job card shows up. It always waits the
+    full timeout, since the crawl can't go on without the cards, and returns False if they didn't show up in time.
+    """
+    return waiter.settle(driver, 'results_page', registry.present('job_card'), timeout=timeout, required=True)
+
+def find_field_text(driver, field: str):
+    """
+    This function returns the text of a field on the job post, or its placeholder if it isn't there. It doesn't wait.
+    """
+    return element_text_or(registry.find(driver, field), MISSING_FIELD_VALUES[field])
 
 def find_company(driver):
     """
     This function will return the name of the job on the job post.
     """
-    try:
-        WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.CSS_SELECTOR, '.css-1ioi40n.e19afand0'))) # Page Loads
-        company_name = driver.find_element(By.CSS_SELECTOR, '.css-1ioi40n.e19afand0').text
-    except:
-        company_name = 'No Company Name'
-    return company_name
+    return find_field_text(driver, 'company')
 
 def find_job_title(driver):
     """
     This function will return the job title on the job post.
     """
-    try:
-        WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.CSS_SELECTOR, '.jobsearch-JobInfoHeader-title.css-1t78hkx.e1tiznh50')))
-        job_title = driver.find_element(By.CSS_SELECTOR, '.jobsearch-JobInfoHeader-title.css-1t78hkx.e1tiznh50').text.split('\n')[0]
-    except:
-        job_title = 'No Job Title'
-    return job_title
+    return find_field_text(driver, 'job_title').split('\n')[0]
 
 def find_location(driver):
     """
     This function will return the location of the job on the job posting.
     """
-    try:
-        WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.CSS_SELECTOR, '[data-testid="inlineHeader-companyLocation"]')))
-        location = driver.find_element(By.CSS_SELECTOR, '[data-testid="inlineHeader-companyLocation"]').text
-    except:
-        location = 'No Location'
-    return location
+    return find_field_text(driver, 'location')
 
 def find_salary(driver):
     """
     This function will return the salary on the job description.
     """
-    try:
-        WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.CSS_SELECTOR, '.js-match-insights-provider-tvvxwd.ecydgvn1')))
-        salary = driver.find_element(By.CSS_SELECTOR, '.js-match-insights-provider-tvvxwd.ecydgvn1').text
-    except:
-        salary = 'No Salary'
-    return salary
+    return find_field_text(driver, 'salary')
 
 def find_employment_type(driver):
     """
     This function will return the employment type e.g. part-time, full-time.
     """
-    try:
-        WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.CSS_SELECTOR, '.css-k5flys.eu4oa1w0')))
-        employment_type = driver.find_element(By.CSS_SELECTOR, '.css-k5flys.eu4oa1w0').text
-        if employment_type.startswith('-'):
-            employment_type = employment_type[1:].strip()
-    except:
-        employment_type = 'No Employment Type'
+    employment_type = find_field_text(driver, 'employment_type')
+    if employment_type.startswith('-'):
+        employment_type = employment_type[1:].strip()
     return employment_type
 
 def find_job_description(driver):
     """
     This function return the job description from the job post.
     """
-    try:
-        WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.CSS_SELECTOR, '.jobsearch-JobComponent-description.css-16y4thd.eu4oa1w0')))
-        job_description = driver.find_element(By.CSS_SELECTOR, '.jobsearch-JobComponent-description.css-16y4thd.eu4oa1w0').text
-    except:
-        job_description = 'No Job Description'
-    return job_description
+    return find_field_text(driver, 'job_description')
 
 def find_company_rating(driver):
     """
     The function returns the company rating found on the job post.
     """
-    try:
-        WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.CSS_SELECTOR, '.css-ppxtlp.e1wnkr790')))
-        company_rating = driver.find_element(By.CSS_SELECTOR, '.css-ppxtlp.e1wnkr790').text
-    except:
-        company_rating = 'No Rating'
-    return company_rating
+    return find_field_text(driver, 'company_rating')
 
 def find_apply_link(driver):
     """
     This function will look for the link to apply for the job via company's website. If this can't be found, it will direct you to the job post
     on indeed.
     """
+    element = registry.find(driver, 'application_link')
     try:
-        WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.CSS_SELECTOR, '.css-1234qe1.e8ju0x51')))
-        apply_link = driver.find_element(By.CSS_SELECTOR, '.css-1234qe1.e8ju0x51').get_attribute('href')
-    except:
-        apply_link = driver.current_url
-    return apply_link
+        apply_link = element.get_attribute('href') if element is not None else None
+    except WebDriverException:  # The page changed under us
+        apply_link = None
+    return apply_link or driver.current_url
 
 def self_scroll(driver):
     """
@@ -105,7 +108,7 @@ def click_on_job_post(driver):
     The function will click on the post by the defined sequence.
     """
     global post_number  # Ensure post_number is global here too
-    driver.find_element('xpath', f'/html/body/main/div/div[2]/div/div[5]/div/div[1]/div[5]/div/ul/li[{post_number}]/div/div/div/div/div/div/table/tbody/tr/td[1]/div[1]/h2/a').click()
+    registry.find_all(driver, 'job_card')[post_number - 1].click()
     return
 
 post_number = 1
@@ -119,16 +122,224 @@ def next_job_posting(driver):
     post_number += 1  # Move to the next post by incrementing the post_number
     return
 
-def save_job_information(driver):
+def indeed_job_key(url: str):
+    """
+    This function returns the Indeed job key (the jk or vjk parameter) from a job post URL, or None if it has none.
+    """
+    query = parse_qs(urlparse(url).query)
+    for parameter in ('jk', 'vjk'):
+        if query.get(parameter):
+            return query[parameter][0]
+    return None
+
+def normalise_job_text(text):
+    """
+    This function lower-cases the text and collapses its whitespace, so the same post scraped twice hashes the same.
+    """
+    return ' '.join((text or '').split()).lower()
+
+def job_fingerprint(job_dic: dict):
+    """
+    This function returns the key that identifies a job post however it was found: 'jk:' and its Indeed job key, or
+    'sha256:' and a hash of its normalised title, company, location and description when it has no job key.
+    migrations/0005_job_keys.sql computes the same key in SQL, so keep the two in step.
+    """
+    job_key = job_dic.get('job_key') or indeed_job_key(job_dic.get('application_link') or '')
+    if job_key:
+        return f'jk:{job_key}'
+    content = '\x1f'.join(normalise_job_text(job_dic.get(field)) for field in ('job_title', 'company', 'location', 'job_description'))
+    return 'sha256:' + hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+# Widths of the text columns of the jobs table (role_ready_query.sql); longer scraped values are cut to fit
+JOB_COLUMN_LENGTHS = {'job_title': 50, 'company_name': 50, 'location': 60, 'salary': 25, 'employment_type': 50,
+                      'job_description': 2000, 'company_rating': 10, 'link_to_application': 500}
+
+def job_record(job_dic: dict, job_description: str = None):
+    """
+    This function returns the row of the jobs table for a scraped job dictionary, as db.save_job and db.import_jobs take it.
+    job_description is what gets stored as the description (the app stores its summary), defaulting to the scraped description.
+    """
+    values = {'job_title': job_dic.get('job_title'), 'company_name': job_dic.get('company'), 'location': job_dic.get('location'),
+              'salary': job_dic.get('salary'), 'employment_type': job_dic.get('employment_type'),
+              'job_description': job_description if job_description is not None else job_dic.get('job_description'),
+              'company_rating': job_dic.get('company_rating'), 'link_to_application': job_dic.get('application_link')}
+    record = {column: value[:JOB_COLUMN_LENGTHS[column]] if isinstance(value, str) else value for column, value in values.items()}
+    record['job_key'] = job_fingerprint(job_dic)
+    return record
+
+class CrawlCursor:
+    """
+    Keeps track of where a crawl is on the search results, so several crawls (or sessions) don't share one global position.
+    """
+    def __init__(self, job_title_search: str = '', location_search: str = ''):
+        self.job_title_search = job_title_search
+        self.location_search = location_search
+        self.page_number = 1
+        self.post_number = 1  # Position of the next job card on the current results page, starting at 1
+        self.posts_scraped = 0
+        self.seen_job_keys = set()
+        self.page_job_keys = None  # Job keys on the current results page, when it was fetched over HTTP
+        self.has_next_page = False
+
+    def next_page(self):
+        self.page_number += 1
+        self.post_number = 1
+        self.page_job_keys = None
+
+def go_to_next_results_page(driver, cursor: CrawlCursor, timeout: float = None):
+    """
+    This function opens the next page of search results. It returns False when there are no more pages.
+    """
+    next_link = registry.find(driver, 'next_page')
+    if next_link is None:
+        return False
+    driver.get(next_link.get_attribute('href'))
+    if not wait_for_results_page(driver, timeout): # Page Loads
+        return False
+    cursor.next_page()
+    return True
+
+def next_job_card(driver, cursor: CrawlCursor, timeout: float = None):
+    """
+    This function finds the next job card the crawl hasn't seen yet, moving onto the next results page when this one runs out.
+    It returns the Indeed job key and the card's link element, or (None, None) when there are no results left.
+    """
+    while True:
+        cards = registry.find_all(driver, 'job_card')
+        if cursor.post_number > len(cards):
+            if not go_to_next_results_page(driver, cursor, timeout):
+                return None, None
+            continue
+        card = cards[cursor.post_number - 1]
+        cursor.post_number += 1
+        job_key = card.get_attribute('data-jk')
+        if not job_key or job_key in cursor.seen_job_keys:  # Cards without a job key, such as ads, are skipped
+            continue
+        cursor.seen_job_keys.add(job_key)
+        return job_key, card
+
+def open_job_card(driver, job_key: str, card, timeout: float = None):
+    """
+    This function clicks on a job card and waits for its job post to open.
+    """
+    # Centre the card and click it with JavaScript so sign-up popups can't intercept the click
+    driver.execute_script('arguments[0].scrollIntoView({block: "center"}); arguments[0].click();', card)
+    try:
+        # The job key shows up in the URL once the job post has been opened
+        waiter.wait(driver, 'open_job_card', lambda driver: indeed_job_key(driver.current_url) == job_key, timeout=timeout)
+    except TimeoutException:
+        pass
+
+def open_next_job_post(driver, cursor: CrawlCursor, timeout: float = None):
+    """
+    This function clicks on the next job card the crawl hasn't seen yet.
+    It returns the Indeed job key of the post it opened, or None when there are no results left.
+    """
+    job_key, card = next_job_card(driver, cursor, timeout)
+    if job_key is not None:
+        open_job_card(driver, job_key, card, timeout)
+    return job_key
+
+def next_job_information(driver, cursor: CrawlCursor, cache=None):
+    """
+    This function returns the job dictionary of the next job card on the results, or None when there are no results left.
+    When a job_cache.JobCache is given, a job that was scraped recently is served from it without opening the post.
+    """
+    job_key, card = next_job_card(driver, cursor)
+    if job_key is None:
+        return None
+    if cache is not None:
+        job_dic = cache.get(job_key)
+        if job_dic is not None:
+            return job_dic
+    with waiter.post():
+        open_job_card(driver, job_key, card)
+        job_dic = save_job_information(driver)
+    job_dic['job_key'] = job_key
+    if cache is not None:
+        cache.put(job_key, job_dic)
+    return job_dic
+
+def crawl_results(driver, job_title_search: str, location_search: str, max_posts: int = 100, cursor: CrawlCursor = None, cache=None):
+    """
+    This function searches for the job and location, then yields the job dictionary of every post on the results, following
+    the pagination until max_posts have been scraped. Pass in the cursor of an earlier crawl to carry on where it stopped.
+    """
+    if cursor is None:
+        cursor = CrawlCursor(job_title_search, location_search)
+        load_and_search(driver, job_title_search, location_search)
+        wait_for_results_page(driver)
+    scraped = 0
+    while scraped < max_posts:
+        job_dic = next_job_information(driver, cursor, cache)
+        if job_dic is None:
+            return
+        cursor.posts_scraped += 1
+        scraped += 1
+        yield job_dic
+
+_BLOCK_TAGS = {'address', 'article', 'aside', 'blockquote', 'br', 'dd', 'div', 'dl', 'dt', 'footer', 'form', 'h1', 'h2',
+               'h3', 'h4', 'h5', 'h6', 'header', 'hr', 'li', 'main', 'nav', 'ol', 'p', 'pre', 'section', 'table', 'tr', 'ul'}
+
+def element_text(element):
+    """
+    This function returns the text of a BeautifulSoup element laid out like Selenium's element.text, i.e. one line per block element.
+    """
+    parts = []
+    for node in element.descendants:
+        if isinstance(node, NavigableString):
+            if not isinstance(node, Comment) and node.parent.name not in ('script', 'style'):
+                parts.append(str(node))
+        elif node.name in _BLOCK_TAGS:
+            parts.append('\n')
+    lines = (' '.join(line.split()) for line in ''.join(parts).split('\n'))
+    return '\n'.join(line for line in lines if line)
+
+def parse_job_page(page_source: str, current_url: str):
+    """
+    This function extracts every field of the job post from one snapshot of the page HTML.
+    It returns the same dictionary as save_job_information.
+    """
+    soup = BeautifulSoup(page_source, 'html.parser')
+    job_dic = {}
+    for field in JOB_FIELDS:
+        element = registry.select_one(soup, field)
+        if field == 'application_link':
+            href = element.get('href') if element is not None else None
+            job_dic[field] = urljoin(current_url, href) if href else current_url
+        elif element is None:
+            job_dic[field] = MISSING_FIELD_VALUES[field]
+        else:
+            job_dic[field] = element_text(element)
+    # Indeed renders the "- job post" suffix as a block, which the page source doesn't tell us
+    job_dic['job_title'] = job_dic['job_title'].split('\n')[0].removesuffix('- job post').strip()
+    if job_dic['employment_type'].startswith('-'):
+        job_dic['employment_type'] = job_dic['employment_type'][1:].strip()
+    return job_dic
+
+def save_job_information_single_pass(driver, timeout: float = None):
+    """
+    The function waits once for the job post to load, then grabs the page source and parses all of the fields from it.
+    Missing fields cost nothing instead of a 10 second wait each.
+    """
+    wait_for_job_post(driver, timeout)  # If it times out, whatever has loaded is parsed and missing fields get their placeholders
+    return parse_job_page(driver.page_source, driver.current_url)
+
+def save_job_information(driver, single_pass: bool = True):
     """
-    The function retunr the job description dictionary which contain informations of the job post
+    The function retunr the job description dictionary which contain informations of the job post.
+    By default every field is parsed from one page snapshot, set single_pass=False to look each field up through the driver.
     """
-    job_dic = {'job_title' : find_job_title(driver),
-               'company' : find_company(driver),
-               'company_rating' : find_company_rating(driver),
-               'location' : find_location(driver),
-               'salary' : find_salary(driver),
-               'employment_type' : find_employment_type(driver),
-               'job_description' : find_job_description(driver),
-               'application_link': find_apply_link(driver)}
+    with waiter.post():
+        if single_pass:
+            return save_job_information_single_pass(driver)
+        wait_for_job_post(driver)  # The one wait, the fields are then looked up without waiting
+        job_dic = {'job_title' : find_job_title(driver),
+                   'company' : find_company(driver),
+                   'company_rating' : find_company_rating(driver),
+                   'location' : find_location(driver),
+                   'salary' : find_salary(driver),
+                   'employment_type' : find_employment_type(driver),
+                   'job_description' : find_job_description(driver),
+                   'application_link': find_apply_link(driver)}
     return job_dic
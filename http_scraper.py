@@ -0,0 +1,187 @@
+"""
+Scrapes Indeed over plain HTTP instead of driving Chrome.
+
+Search results and job posts are fetched with a pooled requests session and parsed with the same BeautifulSoup code as
+the Chrome scraper (find_core_job_details.parse_job_page), so the job dictionaries are the same. A search costs a few
+hundred kilobytes of HTML rather than a browser, so one box can run dozens at once. Pages Indeed won't serve to a
+plain HTTP client, such as its bot check, are fetched with Chrome when a fallback is given.
+"""
+import threading
+from urllib.parse import urlencode
+
+import requests
+from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from adaptive_wait import waiter
+from find_core_job_details import CrawlCursor, parse_job_page
+from selector_registry import registry
+
+INDEED_URL = 'https://uk.indeed.com'
+RESULTS_PER_PAGE = 10  # Indeed's start parameter moves on by this much a page
+
+BROWSER_HEADERS = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) '
+                                 'Chrome/124.0.0.0 Safari/537.36',
+                   'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+                   'Accept-Language': 'en-GB,en;q=0.9'}
+
+# Found in the pages Indeed's bot check serves instead of the one asked for
+BLOCKED_PAGE_MARKERS = ('challenge-platform', 'cf-chl', '<title>Just a moment', 'hcaptcha')
+
+
+class ScrapeBlocked(Exception):
+    """
+    Raised when Indeed won't serve a page over plain HTTP and there is no Chrome fallback.
+    """
+
+
+def new_http_session(pool_size: int = 32, retries: int = 2, backoff: float = 0.5):
+    """
+    This function returns a requests session that keeps up to pool_size connections open for reuse, and retries
+    connection errors, 429s and 5xx responses with exponential backoff, honouring Retry-After.
+    """
+    session = requests.Session()
+    session.headers.update(BROWSER_HEADERS)
+    retry = Retry(total=retries, backoff_factor=backoff, status_forcelist=(429, 500, 502, 503, 504), allowed_methods=('GET',),
+                  respect_retry_after_header=True, raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, pool_block=True, max_retries=retry)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+class ChromeFallback:
+    """
+    Fetches a page with a Chrome from a driver_pool.DriverPool for an HttpScraper that was turned away. Chrome's
+    cookies and user agent are then copied into the scraper's session, so once Chrome has passed the bot check the
+    following requests usually get through over HTTP again. Fallbacks running at once on other threads copy them in
+    one at a time.
+    """
+
+    def __init__(self, driver_pool, timeout: float = None):
+        self.driver_pool = driver_pool
+        self.timeout = timeout
+        self._lock = threading.Lock()
+
+    def __call__(self, url: str, session: requests.Session):
+        with self.driver_pool.driver() as driver:
+            driver.get(url)
+            waiter.settle(driver, 'fallback_page', registry.present('job_card', 'job_title'), timeout=self.timeout)  # Parse whatever has loaded, as the Chrome scraper does
+            cookies = driver.get_cookies()
+            user_agent = driver.execute_script('return navigator.userAgent')
+            page_source = driver.page_source
+        with self._lock:
+            for cookie in cookies:
+                session.cookies.set(cookie['name'], cookie['value'], domain=cookie.get('domain'), path=cookie.get('path', '/'))
+            session.headers['User-Agent'] = user_agent
+        return page_source
+
+
+class HttpScraper:
+    """
+    Indeed scraper that fetches pages with a pooled requests session and parses the HTML directly.
+
+    next_job_information and crawl_results work like the Chrome functions of the same name in find_core_job_details,
+    without a driver. fallback is called with (url, session) and returns the page HTML, e.g. ChromeFallback, when a page
+    can't be fetched over HTTP. Safe to share between threads, each crawl having its own CrawlCursor.
+    """
+
+    def __init__(self, session: requests.Session = None, base_url: str = INDEED_URL, timeout: float = 10, fallback=None):
+        self.session = session if session is not None else new_http_session()
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.fallback = fallback
+        self.http_pages = 0      # Pages fetched over HTTP
+        self.fallback_pages = 0  # Pages fetched with the fallback
+        self._lock = threading.Lock()
+
+    def search_url(self, job_title_search: str, location_search: str, page_number: int = 1):
+        return f"{self.base_url}/jobs?" + urlencode({'q': job_title_search, 'l': location_search,
+                                                     'start': (page_number - 1) * RESULTS_PER_PAGE})
+
+    def job_url(self, job_key: str):
+        return f"{self.base_url}/viewjob?" + urlencode({'jk': job_key})
+
+    def fetch(self, url: str):
+        """
+        This function returns the HTML of a page, using the fallback when Indeed turns the request away, or when it
+        still can't be fetched after the session's retries.
+        """
+        try:
+            response = self.session.get(url, timeout=self.timeout)
+            if response.status_code in (403, 429) or any(marker in response.text for marker in BLOCKED_PAGE_MARKERS):
+                reason = f"{url} was turned away with HTTP {response.status_code}"
+            elif response.status_code >= 500 and self.fallback is not None:
+                reason = f"{url} failed with HTTP {response.status_code}"
+            else:
+                response.raise_for_status()
+                with self._lock:
+                    self.http_pages += 1
+                return response.text
+        except (requests.ConnectionError, requests.Timeout) as error:
+            reason = f"{url} could not be fetched: {error}"
+        if self.fallback is None:
+            raise ScrapeBlocked(reason)
+        with self._lock:
+            self.fallback_pages += 1
+        return self.fallback(url, self.session)
+
+    def search_results(self, job_title_search: str, location_search: str, page_number: int = 1):
+        """
+        This function returns the job keys of the cards on a page of search results, and whether there is a next page.
+        """
+        soup = BeautifulSoup(self.fetch(self.search_url(job_title_search, location_search, page_number)), 'html.parser')
+        job_keys = [card.get('data-jk') for card in registry.select(soup, 'job_card')]  # None on cards without one, such as ads
+        return [job_key for job_key in job_keys if job_key], registry.select_one(soup, 'next_page') is not None
+
+    def job_information(self, job_key: str):
+        """
+        This function returns the job dictionary of a job post, the same one save_job_information returns, with its job_key.
+        """
+        url = self.job_url(job_key)
+        job_dic = parse_job_page(self.fetch(url), url)
+        job_dic['job_key'] = job_key
+        return job_dic
+
+    def next_job_information(self, cursor: CrawlCursor, cache=None):
+        """
+        This function returns the job dictionary of the next job card on the results, or None when there are no results left.
+        When a job_cache.JobCache is given, a job that was scraped recently is served from it without fetching the post.
+        """
+        while True:
+            if cursor.page_job_keys is None:
+                cursor.page_job_keys, cursor.has_next_page = self.search_results(cursor.job_title_search, cursor.location_search,
+                                                                                 cursor.page_number)
+            if cursor.post_number > len(cursor.page_job_keys):
+                if not cursor.has_next_page or not cursor.page_job_keys:
+                    return None
+                cursor.next_page()
+                continue
+            job_key = cursor.page_job_keys[cursor.post_number - 1]
+            cursor.post_number += 1
+            if job_key in cursor.seen_job_keys:
+                continue
+            cursor.seen_job_keys.add(job_key)
+            job_dic = cache.get(job_key) if cache is not None else None
+            if job_dic is None:
+                job_dic = self.job_information(job_key)
+                if cache is not None:
+                    cache.put(job_key, job_dic)
+            return job_dic
+
+    def crawl_results(self, job_title_search: str, location_search: str, max_posts: int = 100, cursor: CrawlCursor = None, cache=None):
+        """
+        This function yields the job dictionary of every post on the results of a search, following the pagination until
+        max_posts have been scraped. Pass in the cursor of an earlier crawl to carry on where it stopped.
+        """
+        if cursor is None:
+            cursor = CrawlCursor(job_title_search, location_search)
+        scraped = 0
+        while scraped < max_posts:
+            job_dic = self.next_job_information(cursor, cache)
+            if job_dic is None:
+                return
+            cursor.posts_scraped += 1
+            scraped += 1
+            yield job_dic
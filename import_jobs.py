@@ -0,0 +1,37 @@
+"""
+Loads scraped jobs into the jobs table, so they show up in the app's job search alongside saved jobs.
+
+    $ python import_jobs.py scraped_jobs.jsonl           # Written by pipeline.py
+    $ python import_jobs.py job_summaries.jsonl          # Written by async_llm_client.py, stores the summaries
+
+Jobs already in the table are left as they are, so the file can be imported again after more scraping.
+"""
+import argparse
+
+from dotenv import load_dotenv
+
+from db import import_jobs
+from find_core_job_details import job_record
+from jsonl_sink import read_jsonl
+
+
+def job_records(path: str):
+    """
+    This function yields the jobs table row of every job in a JSON lines file, storing the summary when the job has one.
+    """
+    for job_dic in read_jsonl(path):
+        yield job_record(job_dic, job_dic.get('job_desc_summary'))
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description='Load a JSON lines file of scraped jobs into the jobs table.')
+    parser.add_argument('input', help='JSON lines file written by pipeline.py or async_llm_client.py')
+    parser.add_argument('--batch-size', type=int, default=1000, help='number of jobs written per statement')
+    args = parser.parse_args()
+    added = import_jobs(job_records(args.input), page_size=args.batch_size)
+    print(f"Added {added} new jobs from {args.input}")
+
+
+if __name__ == '__main__':
+    main()
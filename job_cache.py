@@ -0,0 +1,143 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from find_core_job_details import indeed_job_key
+
+
+def job_cache_key(job_key_or_url: str):
+    """
+    This function returns the cache key of a job post: its Indeed job key, or the URL without its fragment when it has none.
+    """
+    if job_key_or_url.startswith(('http://', 'https://')):
+        job_key = indeed_job_key(job_key_or_url)
+        return f'jk:{job_key}' if job_key else 'url:' + job_key_or_url.split('#')[0]
+    return f'jk:{job_key_or_url}'
+
+
+class JobCache:
+    """
+    Cache of scraped job dictionaries keyed by Indeed job key, so a job post that was scraped recently is not scraped again.
+
+    Recently used jobs are kept in an in-memory LRU of memory_size entries in front of an optional SQLite file holding up
+    to max_entries jobs (least recently used are evicted). Entries older than ttl seconds are treated as missing.
+    Safe to share between threads and, through the SQLite file, between processes.
+    """
+
+    def __init__(self, path: str = None, ttl: float = 6 * 3600, max_entries: int = 100000, memory_size: int = 1000):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.memory_size = memory_size
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()  # cache key -> (stored_at, job_dic)
+        self._lock = threading.Lock()
+        self._conn = None
+        self._disk_entries = 0
+        if path is not None:
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('''CREATE TABLE IF NOT EXISTS job_cache (
+                                  cache_key TEXT PRIMARY KEY,
+                                  job_json TEXT NOT NULL,
+                                  stored_at REAL NOT NULL,
+                                  last_access REAL NOT NULL)''')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS job_cache_last_access ON job_cache (last_access)')
+            self._conn.commit()
+            self._disk_entries = self._conn.execute('SELECT COUNT(*) FROM job_cache').fetchone()[0]
+
+    def get(self, job_key_or_url: str):
+        """
+        This function returns a copy of the cached job dictionary, or None if the job isn't cached or has expired.
+        """
+        key = job_cache_key(job_key_or_url)
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and now - entry[0] < self.ttl:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return dict(entry[1])
+            if entry is not None:
+                del self._memory[key]
+            job_dic = self._get_from_disk(key, now)
+            if job_dic is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return dict(job_dic)
+
+    def put(self, job_key_or_url: str, job_dic: dict):
+        """
+        This function stores a scraped job dictionary.
+        """
+        key = job_cache_key(job_key_or_url)
+        now = time.time()
+        job_dic = dict(job_dic)
+        with self._lock:
+            self._remember(key, now, job_dic)
+            if self._conn is None:
+                return
+            exists = self._conn.execute('SELECT 1 FROM job_cache WHERE cache_key = ?', (key,)).fetchone()
+            self._conn.execute('INSERT OR REPLACE INTO job_cache VALUES (?, ?, ?, ?)', (key, json.dumps(job_dic), now, now))
+            if not exists:
+                self._disk_entries += 1
+            if self._disk_entries > self.max_entries:
+                self._evict(self._disk_entries - self.max_entries)
+            self._conn.commit()
+
+    def purge_expired(self):
+        """
+        This function deletes every expired entry and returns how many were removed from the SQLite file.
+        """
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            for key in [key for key, (stored_at, _) in self._memory.items() if stored_at < cutoff]:
+                del self._memory[key]
+            if self._conn is None:
+                return 0
+            removed = self._conn.execute('DELETE FROM job_cache WHERE stored_at < ?', (cutoff,)).rowcount
+            self._conn.commit()
+            self._disk_entries -= removed
+            return removed
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'memory_entries': len(self._memory), 'disk_entries': self._disk_entries}
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _remember(self, key, stored_at, job_dic):
+        self._memory[key] = (stored_at, job_dic)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def _get_from_disk(self, key, now):
+        if self._conn is None:
+            return None
+        row = self._conn.execute('SELECT job_json, stored_at FROM job_cache WHERE cache_key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        if now - row[1] >= self.ttl:
+            self._conn.execute('DELETE FROM job_cache WHERE cache_key = ?', (key,))
+            self._conn.commit()
+            self._disk_entries -= 1
+            return None
+        self._conn.execute('UPDATE job_cache SET last_access = ? WHERE cache_key = ?', (now, key))
+        self._conn.commit()
+        job_dic = json.loads(row[0])
+        self._remember(key, row[1], job_dic)
+        return job_dic
+
+    def _evict(self, count):
+        self._conn.execute('''DELETE FROM job_cache WHERE cache_key IN
+                              (SELECT cache_key FROM job_cache ORDER BY last_access LIMIT ?)''', (count,))
+        self._disk_entries -= count
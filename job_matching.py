@@ -0,0 +1,285 @@
+import argparse
+from typing import NamedTuple
+
+import numpy as np
+from dotenv import load_dotenv
+from scipy import sparse
+
+from db import load_profile
+from jsonl_sink import read_jsonl
+from skill_index import TOKEN_PATTERN, SkillIndex, load_skill_index, skill_key
+
+# Random odd weight for each position in a word; a word's hash is the sum of its bytes times these weights
+_POSITION_WEIGHTS = np.random.default_rng(20240601).integers(1, 2 ** 32, size=64, dtype=np.uint32) | np.uint32(1)
+_PAIR_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+# Keys pack a 40-bit hash of a word or word pair above the 24-bit number of the job it's in
+_ROW_BITS = np.uint64(24)
+_ROW_MASK = np.uint64(2 ** 24 - 1)
+_HASH_MASK = np.uint64(2 ** 40 - 1)
+
+def word_hashes(words):
+    """
+    This function returns the 32-bit hash of each word in a list, working on the bytes of all of them at once rather
+    than on one word at a time.
+    """
+    encoded = [word.encode('utf-8') for word in words]
+    lengths = np.array([len(word) for word in encoded], dtype=np.int64)
+    if not len(lengths):
+        return np.zeros(0, dtype=np.uint32)
+    text = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+    starts = np.cumsum(lengths) - lengths
+    positions = np.minimum(np.arange(len(text)) - np.repeat(starts, lengths), len(_POSITION_WEIGHTS) - 1)
+    hashes = np.add.reduceat(text * _POSITION_WEIGHTS[positions], starts)
+    return hashes ^ lengths.astype(np.uint32)
+
+
+def tokenise(texts):
+    """
+    This function splits lower-cased texts into the words of skill_index.TOKEN_PATTERN and returns the hash of every
+    word of every text, in order, and the number of the text each is in. Each distinct word is only hashed once.
+    """
+    words = [TOKEN_PATTERN.findall(text.lower()) if text else [] for text in texts]
+    vocabulary = {}
+    word_ids = np.array([vocabulary.setdefault(word, len(vocabulary)) for text_words in words for word in text_words], dtype=np.int64)
+    rows = np.repeat(np.arange(len(words), dtype=np.int64), [len(text_words) for text_words in words])
+    return word_hashes(list(vocabulary))[word_ids], rows
+
+
+def _pair_hashes(first, second):
+    """
+    Returns the 40-bit hash of each pair of word hashes. Pairs have the top bit set, so they never equal a single word.
+    """
+    pairs = first * _PAIR_MULTIPLIER ^ second
+    return ((pairs ^ (pairs >> np.uint64(24))) & _HASH_MASK) | np.uint64(2 ** 39)
+
+
+def phrase_hashes(phrase: str):
+    """
+    This function returns the hashes a text must all contain to contain the phrase: its word for one word, or its
+    word pairs for longer phrases.
+    """
+    hashes, _ = tokenise([phrase])
+    hashes = hashes.astype(np.uint64)
+    return hashes if len(hashes) == 1 else _pair_hashes(hashes[:-1], hashes[1:])
+
+
+class JobMatch(NamedTuple):
+    index: int  # Position of the job in the list that was ranked
+    score: float  # Cosine similarity between the résumé and the job, from 0 to 1
+    matched_skills: list  # Skills of the résumé the job asks for
+    missing_skills: list  # Skills the job asks for that the résumé doesn't have
+
+
+class JobMatcher:
+    """
+    Scores how well a résumé fits many job descriptions at once, without calling OpenAI.
+
+    Texts become TF-IDF vectors of their words and word pairs, split with skill_index.TOKEN_PATTERN like skills are and
+    hashed with NumPy.
+    The jobs' vectors are the columns of a SciPy sparse matrix with one column per distinct word or pair hash, built
+    from a single sorted array of (hash, job) keys. Words are told apart only by their 32-bit hashes, so two words that
+    collide share a column: rare, but it can nudge a score or report a skill the job doesn't mention. The IDF comes from the jobs, so words every job uses count for little,
+    and a résumé's score for a job is the cosine similarity of their vectors. The jobs are vectorised once by fit()
+    (and add() as more are scraped), after which each rank() only reads the columns of the résumé's words.
+    Up to 16,777,216 jobs can be added.
+    """
+
+    def __init__(self, skill_index: SkillIndex = None):
+        self.skill_index = skill_index if skill_index is not None else load_skill_index()
+        spellings = sorted(self.skill_index.spellings(), key=lambda spelling: spelling[1])
+        self._skill_phrases = [phrase_hashes(key) for key, _ in spellings]  # Hashes of every spelling of every skill
+        self._skill_phrase_ids = np.array([skill_id for _, skill_id in spellings], dtype=np.int64)  # Skill ID of each spelling
+        self._keys = np.zeros(0, dtype=np.uint64)  # Sorted (hash << 24 | job number) of every word and pair in every job
+        self._counts = np.zeros(0, dtype=np.float32)  # Times each key's word or pair occurs in its job
+        self._job_count = 0
+        self._features = None
+        self._idf = None
+        self._weights = None
+
+    def __len__(self):
+        return self._job_count
+
+    def fit(self, job_texts):
+        """
+        This function replaces the jobs being matched with job_texts and returns the matcher.
+        """
+        self._keys = np.zeros(0, dtype=np.uint64)
+        self._counts = np.zeros(0, dtype=np.float32)
+        self._job_count = 0
+        return self.add(job_texts)
+
+    def add(self, job_texts):
+        """
+        This function adds more jobs to match against, numbered after the ones already added, and returns the matcher.
+        """
+        job_texts = list(job_texts)
+        keys, counts = _count_keys(job_texts, first_row=self._job_count)
+        keys = np.concatenate([self._keys, keys])
+        order = np.argsort(keys, kind='stable')  # Merging two sorted runs
+        self._keys, self._counts = keys[order], np.concatenate([self._counts, counts])[order]
+        self._job_count += len(job_texts)
+        self._weights = None  # Worked out again on the next rank()
+        return self
+
+    def _build(self):
+        """
+        Builds the TF-IDF matrix with a row per job and a column per distinct word or pair, each row scaled to unit
+        length so dot products are cosine similarities.
+        """
+        hashes = self._keys >> _ROW_BITS
+        rows = (self._keys & _ROW_MASK).astype(np.int32)
+        first = np.ones(len(hashes), dtype=bool)
+        first[1:] = hashes[1:] != hashes[:-1]
+        indptr = np.append(np.flatnonzero(first), len(hashes))
+        document_frequency = np.diff(indptr)
+        self._features = hashes[first]
+        self._idf = (np.log((1 + self._job_count) / (1 + document_frequency)) + 1).astype(np.float32)
+        data = np.log1p(self._counts) * np.repeat(self._idf, document_frequency)
+        norms = np.sqrt(np.bincount(rows, weights=data ** 2, minlength=self._job_count)).astype(np.float32)
+        data /= np.maximum(norms, 1e-12)[rows]
+        self._weights = sparse.csc_matrix((data, rows, indptr), shape=(self._job_count, len(self._features)))
+
+    def _columns(self, hashes):
+        """
+        Returns the matrix column of each hash and whether any job has it.
+        """
+        columns = np.minimum(np.searchsorted(self._features, hashes), len(self._features) - 1)
+        return columns, self._features[columns] == hashes
+
+    def rank(self, resume_text: str, skills=(), top_n: int = None):
+        """
+        This function ranks the jobs against the résumé text and returns a JobMatch for each (or the best top_n), best
+        first. skills are the user's skills, which count as part of the résumé and are reported as matched or missing
+        along with the skill vocabulary.
+        """
+        if not self._job_count:
+            return []
+        if self._weights is None:
+            self._build()
+        if not len(self._features):  # No job has a single word, so none can match
+            return [JobMatch(index, 0.0, [], []) for index in range(self._job_count)][:top_n]
+        skills = [skill for skill in skills if skill_key(skill)]
+        resume_keys, resume_counts = _count_keys(['\n'.join([resume_text or ''] + skills)])
+        resume_hashes = resume_keys >> _ROW_BITS
+        columns, known = self._columns(resume_hashes)
+        # Words no job uses can't match anything, but still count towards the résumé's length
+        resume_idf = np.where(known, self._idf[columns], np.log(1 + self._job_count) + 1)
+        resume_weights = np.log1p(resume_counts) * resume_idf
+        resume_weights /= max(np.linalg.norm(resume_weights), 1e-12)
+        scores = self._weights[:, columns[known]] @ resume_weights[known]
+
+        order = np.argsort(-scores, kind='stable')
+        if top_n is not None:
+            order = order[:top_n]
+        matched, missing = self._skill_matches(order, resume_hashes, skills)
+        return [JobMatch(int(index), float(scores[index]), matched[position], missing[position])
+                for position, index in enumerate(order)]
+
+    def _skill_matches(self, order, resume_hashes, skills):
+        """
+        Returns, for each job in order, the user's skills it mentions and the indexed skills it mentions that the
+        résumé doesn't, most mentioned first. Skills are compared by skill ID, so a job asking for Postgres matches a
+        user with PostgreSQL, and every spelling's columns are read in one slice of the matrix.
+        """
+        skill_count = len(self.skill_index)
+        user_ids = [self.skill_index.skill_id(skill) for skill in skills]
+        unknown = [skill for skill, skill_id in zip(skills, user_ids) if skill_id is None]
+        # Skills the index doesn't have are matched by their own words, with the IDs after the index's
+        user_ids = np.array([-1 if skill_id is None else skill_id for skill_id in user_ids], dtype=np.int64)
+        user_ids[user_ids < 0] = np.arange(skill_count, skill_count + len(unknown))
+        phrases = self._skill_phrases + [phrase_hashes(skill) for skill in unknown]
+        phrase_ids = np.concatenate([self._skill_phrase_ids, np.arange(skill_count, skill_count + len(unknown))])
+        if not phrases:
+            return [[] for _ in order], [[] for _ in order]
+        hashes = np.concatenate(phrases)
+        columns, known = self._columns(hashes)
+        present = (self._weights[:, columns][order] > 0).toarray() & known
+        # A spelling is present when all of its hashes are, and a skill when any of its spellings is
+        lengths = np.array([len(phrase) for phrase in phrases])
+        phrase_starts = np.cumsum(lengths) - lengths
+        has_phrase = np.logical_and.reduceat(present, phrase_starts, axis=1)
+        in_resume_phrase = np.logical_and.reduceat(np.isin(hashes, resume_hashes), phrase_starts)
+        skill_starts = np.flatnonzero(np.append(True, phrase_ids[1:] != phrase_ids[:-1]))
+        skill_ids = phrase_ids[skill_starts]
+        has_skill = np.logical_or.reduceat(has_phrase, skill_starts, axis=1)
+        in_resume = np.logical_or.reduceat(in_resume_phrase, skill_starts)
+        user_columns = np.searchsorted(skill_ids, user_ids)
+        missing_columns = np.flatnonzero((skill_ids < skill_count) & ~in_resume & ~np.isin(skill_ids, user_ids))
+        matched, missing = [], []
+        for row in has_skill:
+            matched.append([skill for skill, column in zip(skills, user_columns) if row[column]])
+            missing.append([self.skill_index.names[skill_id] for skill_id in skill_ids[missing_columns[row[missing_columns]]]])
+        return matched, missing
+
+
+def _count_keys(texts, first_row: int = 0):
+    """
+    Returns the sorted (hash << 24 | text number) keys of the words and word pairs in the texts and how many times each
+    occurs.
+    """
+    hashes, rows = tokenise(texts)
+    hashes = hashes.astype(np.uint64)
+    same_text = rows[:-1] == rows[1:]
+    rows = np.concatenate([rows, rows[:-1][same_text]]).astype(np.uint64) + np.uint64(first_row)
+    keys = np.concatenate([hashes, _pair_hashes(hashes[:-1], hashes[1:])[same_text]]) << _ROW_BITS | rows
+    keys.sort()
+    first = np.ones(len(keys), dtype=bool)
+    first[1:] = keys[1:] != keys[:-1]
+    return keys[first], np.diff(np.append(np.flatnonzero(first), len(keys))).astype(np.float32)
+
+
+def text_features(texts):
+    """
+    This function returns the hash of every distinct word and word pair in each text, the number of the text it's in
+    and how many times it occurs there, as three arrays.
+    """
+    keys, counts = _count_keys(texts)
+    return keys >> _ROW_BITS, (keys & _ROW_MASK).astype(np.int64), counts
+
+
+def rank_jobs(resume_text: str, job_texts, skills=(), top_n: int = None, matcher: JobMatcher = None):
+    """
+    This function ranks job descriptions against a résumé in one call, see JobMatcher.rank.
+    """
+    return (matcher or JobMatcher()).fit(job_texts).rank(resume_text, skills, top_n)
+
+
+def profile_text(profile):
+    """
+    This function returns the text of a db.Profile that job descriptions are matched against: job titles and
+    descriptions, degrees, projects and certificates.
+    """
+    parts = []
+    for work_experience in profile.work_experiences:
+        parts += [work_experience.job_title, work_experience.job_description]
+    parts += [education.degree for education in profile.education]
+    parts += [project.description for project in profile.projects]
+    parts += [certification.certificate for certification in profile.certifications]
+    return '\n'.join(part for part in parts if part)
+
+
+def job_text(job_dic: dict):
+    """
+    This function returns the text of a scraped job dictionary that résumés are matched against.
+    """
+    return '\n'.join(job_dic.get(field) or '' for field in ('job_title', 'job_description'))
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Rank a JSON lines file of scraped jobs against a user's résumé.")
+    parser.add_argument('input', help='JSON lines file written by pipeline.py')
+    parser.add_argument('--user-id', type=int, required=True, help='user whose saved résumé is matched')
+    parser.add_argument('--top', type=int, default=20, help='number of jobs to show')
+    args = parser.parse_args()
+
+    jobs = list(read_jsonl(args.input))
+    profile = load_profile(args.user_id)
+    for match in rank_jobs(profile_text(profile), [job_text(job_dic) for job_dic in jobs], profile.skills, top_n=args.top):
+        job_dic = jobs[match.index]
+        print(f"{match.score:.3f}  {job_dic.get('job_title')} at {job_dic.get('company')}  {job_dic.get('application_link')}")
+        print(f"       has: {', '.join(match.matched_skills) or '-'}  missing: {', '.join(match.missing_skills) or '-'}")
+
+
+if __name__ == '__main__':
+    main()
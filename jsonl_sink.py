@@ -0,0 +1,138 @@
+import glob
+import gzip
+import json
+import os
+import threading
+import time
+import zlib
+
+
+class JsonlSink:
+    """
+    Append-only writer that stores one JSON record per line.
+
+    Every record is flushed as soon as it is written, so a crash loses at most the line being written. The file is
+    rotated once it holds max_bytes of (uncompressed) records or is older than max_age seconds, and is gzipped
+    when compress=True. Safe to share between threads.
+    """
+
+    def __init__(self, path: str, max_bytes: int = None, max_age: float = None, compress: bool = False):
+        if compress and not path.endswith('.gz'):
+            path += '.gz'
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.compress = compress
+        self._lock = threading.Lock()
+        self._file = None
+        self._bytes_written = 0
+        self._opened_at = 0
+
+    def write(self, record: dict):
+        """
+        This function appends one record to the file.
+        """
+        line = (json.dumps(record, ensure_ascii=False, default=str) + '\n').encode('utf-8')
+        with self._lock:
+            if self._file is None:
+                self._open()
+            elif self._needs_rotation():
+                self._rotate()
+            self._file.write(line)
+            if self.compress:
+                # Sync flush so every line can be read back from the gzip stream straight away
+                self._file.flush(zlib.Z_SYNC_FLUSH)
+            else:
+                self._file.flush()
+            self._bytes_written += len(line)
+
+    def write_many(self, records):
+        """
+        This function appends every record from an iterable and returns how many were written.
+        """
+        count = 0
+        for record in records:
+            self.write(record)
+            count += 1
+        return count
+
+    def rotated_files(self):
+        """
+        This function returns the rotated files of this sink, oldest first.
+        """
+        return sorted(glob.glob(_rotated_pattern(self.path)))
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if self.compress:
+            self._file = gzip.open(self.path, 'ab')
+        else:
+            self._file = open(self.path, 'ab')
+        # Appending to an existing file carries on its count; a gzip file's compressed size is the best cheap
+        # estimate of what it holds, so restarts can't keep a compressed file from ever rotating
+        self._bytes_written = os.path.getsize(self.path)
+        self._opened_at = time.time()
+
+    def _needs_rotation(self):
+        if self.max_bytes is not None and self._bytes_written >= self.max_bytes:
+            return True
+        return self.max_age is not None and time.time() - self._opened_at >= self.max_age
+
+    def _rotate(self):
+        self._file.close()
+        stem, extension = _split_extension(self.path)
+        now = time.time()
+        stamp = time.strftime('%Y%m%dT%H%M%S', time.gmtime(now)) + f'{now % 1:.6f}'[1:]
+        os.replace(self.path, f'{stem}.{stamp}{extension}')
+        self._open()
+
+
+def read_jsonl(path: str, include_rotated: bool = True):
+    """
+    This function lazily yields the records written by a JsonlSink, starting with the rotated files when include_rotated is set.
+    A line cut short by a crash is skipped.
+    """
+    paths = sorted(glob.glob(_rotated_pattern(path))) if include_rotated else []
+    if os.path.exists(path):
+        paths.append(path)
+    for file_path in paths:
+        opener = gzip.open if file_path.endswith('.gz') else open
+        with opener(file_path, 'rt', encoding='utf-8') as infile:
+            try:
+                for line in infile:
+                    if not line.strip():
+                        continue
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+            except EOFError:
+                continue  # gzip stream cut short by a crash, keep what was readable
+
+
+def _split_extension(path: str):
+    """
+    Splits 'scraped_jobs.jsonl.gz' into ('scraped_jobs', '.jsonl.gz').
+    """
+    directory, name = os.path.split(path)
+    stem, dot, extension = name.partition('.')
+    return os.path.join(directory, stem), dot + extension
+
+
+def _rotated_pattern(path: str):
+    stem, extension = _split_extension(path)
+    return glob.escape(stem) + '.*' + extension
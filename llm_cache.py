@@ -0,0 +1,136 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def normalise_prompt(prompt: str):
+    """
+    This function collapses runs of whitespace, so prompts built from indented f-strings hash the same way.
+    """
+    return ' '.join(prompt.split())
+
+
+def completion_cache_key(prompt: str, model: str, temperature: float):
+    """
+    This function returns the sha256 hex digest identifying a (model, temperature, prompt) request.
+    """
+    payload = json.dumps([model, float(temperature), normalise_prompt(prompt)], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class CompletionCache:
+    """
+    Cache of OpenAI completions keyed on the model, temperature and a hash of the normalised prompt.
+
+    An in-memory LRU of memory_size entries sits in front of an optional SQLite file holding up to max_entries
+    completions. Only requests with a temperature of at most max_temperature are cached, since higher temperatures
+    are meant to give a different answer every time. Safe to share between threads.
+    """
+
+    def __init__(self, path: str = None, memory_size: int = 500, max_entries: int = 50000, max_temperature: float = 0):
+        self.path = path
+        self.memory_size = memory_size
+        self.max_entries = max_entries
+        self.max_temperature = max_temperature
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()  # cache key -> completion
+        self._lock = threading.Lock()
+        self._conn = None
+        self._disk_entries = 0
+        if path is not None:
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('''CREATE TABLE IF NOT EXISTS completion_cache (
+                                  cache_key TEXT PRIMARY KEY,
+                                  model TEXT NOT NULL,
+                                  completion TEXT NOT NULL,
+                                  last_access REAL NOT NULL)''')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS completion_cache_last_access ON completion_cache (last_access)')
+            self._conn.commit()
+            self._disk_entries = self._conn.execute('SELECT COUNT(*) FROM completion_cache').fetchone()[0]
+
+    def cacheable(self, temperature: float):
+        return temperature <= self.max_temperature
+
+    def get(self, prompt: str, model: str, temperature: float):
+        """
+        This function returns the cached completion for the request, or None.
+        """
+        if not self.cacheable(temperature):
+            return None
+        key = completion_cache_key(prompt, model, temperature)
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return self._memory[key]
+            row = None
+            if self._conn is not None:
+                row = self._conn.execute('SELECT completion FROM completion_cache WHERE cache_key = ?', (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute('UPDATE completion_cache SET last_access = ? WHERE cache_key = ?', (time.time(), key))
+            self._conn.commit()
+            self._remember(key, row[0])
+            self.disk_hits += 1
+            return row[0]
+
+    def put(self, prompt: str, model: str, temperature: float, completion: str):
+        """
+        This function stores the completion for the request.
+        """
+        if not self.cacheable(temperature):
+            return
+        key = completion_cache_key(prompt, model, temperature)
+        with self._lock:
+            self._remember(key, completion)
+            if self._conn is None:
+                return
+            exists = self._conn.execute('SELECT 1 FROM completion_cache WHERE cache_key = ?', (key,)).fetchone()
+            self._conn.execute('INSERT OR REPLACE INTO completion_cache VALUES (?, ?, ?, ?)', (key, model, completion, time.time()))
+            if not exists:
+                self._disk_entries += 1
+            if self._disk_entries > self.max_entries:
+                evict = self._disk_entries - self.max_entries
+                self._conn.execute('''DELETE FROM completion_cache WHERE cache_key IN
+                                      (SELECT cache_key FROM completion_cache ORDER BY last_access LIMIT ?)''', (evict,))
+                self._disk_entries -= evict
+            self._conn.commit()
+
+    def get_or_create(self, prompt: str, model: str, temperature: float, create):
+        """
+        This function returns the cached completion, or calls create() for a new one and caches it.
+        """
+        completion = self.get(prompt, model, temperature)
+        if completion is None:
+            completion = create()
+            self.put(prompt, model, temperature, completion)
+        return completion
+
+    def stats(self):
+        with self._lock:
+            requests = self.memory_hits + self.disk_hits + self.misses
+            return {'memory_hits': self.memory_hits,
+                    'disk_hits': self.disk_hits,
+                    'misses': self.misses,
+                    'hit_rate': (self.memory_hits + self.disk_hits) / requests if requests else 0.0,
+                    'memory_entries': len(self._memory),
+                    'disk_entries': self._disk_entries}
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _remember(self, key, completion):
+        self._memory[key] = completion
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
@@ -4,6 +4,7 @@ from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.chrome.options import Options
+from selenium.common.exceptions import TimeoutException, WebDriverException
 
 from bs4 import BeautifulSoup
 import undetected_chromedriver as uc
@@ -12,23 +13,26 @@ import time
 import pandas as pd
 from IPython.display import display, Image
 
+from adaptive_wait import waiter
+from selector_registry import registry
+
 def reject_cookies(driver):
     """
-    This function rejects cookies on the indeed webpage.
+    This function rejects cookies on the indeed webpage. It returns False if the cookie banner didn't show up, e.g.
+    because they were rejected earlier in this browser.
     """
-
-    reject_cookie_button_xpath = '/html/body/div[2]/div[2]/div/div[1]/div/div[2]/div/button[2]'
-    WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.XPATH, reject_cookie_button_xpath))) # Page Loads
-    driver.find_element(By.XPATH, reject_cookie_button_xpath).click()
-    return
+    try:
+        reject_button = waiter.wait(driver, 'cookie_banner', registry.present('cookie_reject'))
+    except TimeoutException:
+        return False
+    reject_button.click()
+    return True
 
 def search_job(driver, job_title_search):
     """
     This function adds job name into the indeed job search box.
     """
-    search_bar_xpath = '/html/body/div[1]/div[1]/div/span/div[4]/div[1]/div/div/div/div/form/div/div[1]/div[1]/div/div/span/input'
-    WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.XPATH, search_bar_xpath))) # Page Loads
-    search_box = driver.find_element(By.XPATH, search_bar_xpath)
+    search_box = waiter.wait(driver, 'search_bar', registry.present('search_bar'), required=True) # Page Loads
     search_box.send_keys(job_title_search)  # Change this dynamically later
     return search_box  # Returning search_box so it can be used later
 
@@ -36,9 +40,7 @@ def search_location(driver,  location_search):
     """
     This function adds location to the indeed location search box.
     """
-    location_input_bar_xpath = '/html/body/div[1]/div[1]/div/span/div[4]/div[1]/div/div/div/div/form/div/div[1]/div[3]/div/div/span/input'
-    WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.XPATH, location_input_bar_xpath))) # Page Loads
-    location_input_bar = driver.find_element(By.XPATH, location_input_bar_xpath)
+    location_input_bar = waiter.wait(driver, 'location_bar', registry.present('location_bar'), required=True) # Page Loads
     location_input_bar.send_keys(location_search)  # Change this dynamically later
     return
 
@@ -48,9 +50,8 @@ def load_and_search(driver, job_title_search, location_search):
     """    
     # Load the Indeed webpage
     driver.get('https://uk.indeed.com/?from=gnav-homepage')
-    time.sleep(1)  # Wait for the page to load
-    
-    # Reject cookies and perform job search
+
+    # Reject cookies and perform job search, each step waiting only until its element shows up
     reject_cookies(driver)
     search_box = search_job(driver, job_title_search)  # Capture the search_box element
     search_location(driver, location_search)
@@ -0,0 +1,72 @@
+"""
+Brings the database schema up to date by applying the SQL files in migrations/ that haven't been applied yet.
+
+    $ psql -f role_ready_query.sql    # Only once, to create the tables
+    $ python migrate.py               # Apply new migrations
+    $ python migrate.py --list        # Show which migrations have been applied
+
+Each migration runs in its own transaction and is recorded in the schema_migrations table.
+"""
+import argparse
+import glob
+import os
+
+from dotenv import load_dotenv
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+# Any constant works, it just stops two deploys from migrating at the same time
+MIGRATION_LOCK_ID = 7_041_992
+
+def migration_files():
+    """
+    This function returns (version, path) for every migration, in the order they must be applied.
+    """
+    paths = sorted(glob.glob(os.path.join(MIGRATIONS_DIR, '*.sql')))
+    return [(os.path.splitext(os.path.basename(path))[0], path) for path in paths]
+
+def applied_versions(cursor):
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS schema_migrations(
+    version VARCHAR(255) PRIMARY KEY,
+    applied_at TIMESTAMP NOT NULL DEFAULT now()
+    )
+    """)
+    cursor.execute('SELECT version FROM schema_migrations')
+    return {row[0] for row in cursor.fetchall()}
+
+def migrate(transaction):
+    """
+    This function applies every pending migration using the given transaction() context manager and returns their versions.
+    """
+    applied = []
+    for version, path in migration_files():
+        with transaction() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(%s)', (MIGRATION_LOCK_ID,))
+            if version in applied_versions(cursor):
+                continue
+            with open(path) as infile:
+                cursor.execute(infile.read())
+            cursor.execute('INSERT INTO schema_migrations(version) VALUES (%s)', (version,))
+        applied.append(version)
+        print(f"Applied {version}")
+    return applied
+
+def main():
+    load_dotenv()
+    from db import transaction
+    parser = argparse.ArgumentParser(description='Apply the pending migrations in migrations/.')
+    parser.add_argument('--list', action='store_true', help='list the migrations and whether they have been applied')
+    args = parser.parse_args()
+
+    if args.list:
+        with transaction() as cursor:
+            applied = applied_versions(cursor)
+        for version, _ in migration_files():
+            print(f"[{'x' if version in applied else ' '}] {version}")
+        return
+    if not migrate(transaction):
+        print("The database is up to date.")
+
+if __name__ == '__main__':
+    main()
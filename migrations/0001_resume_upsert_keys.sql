@@ -0,0 +1,31 @@
+-- Natural keys the résumé bulk save upserts on, so re-saving a section updates rows instead of duplicating them.
+-- Duplicates saved before these keys existed are removed first, keeping the oldest row. Databases created from the
+-- role_ready_query.sql of the first bulk save release already have the keys, so each is dropped if it exists and added again.
+
+DELETE FROM work_experiences AS w
+USING work_experiences AS older
+WHERE w.user_id = older.user_id AND w.job_title = older.job_title AND w.company = older.company
+  AND w.start_date = older.start_date AND w.work_experience_id > older.work_experience_id;
+ALTER TABLE work_experiences DROP CONSTRAINT IF EXISTS work_experiences_user_id_job_title_company_start_date_key;
+ALTER TABLE work_experiences ADD CONSTRAINT work_experiences_user_id_job_title_company_start_date_key
+    UNIQUE (user_id, job_title, company, start_date);
+
+DELETE FROM education AS e
+USING education AS older
+WHERE e.user_id = older.user_id AND e.university = older.university AND e.degree = older.degree
+  AND e.education_id > older.education_id;
+ALTER TABLE education DROP CONSTRAINT IF EXISTS education_user_id_university_degree_key;
+ALTER TABLE education ADD CONSTRAINT education_user_id_university_degree_key UNIQUE (user_id, university, degree);
+
+-- Descriptions are too long for a plain btree key, so projects are matched on a hash of the description
+DELETE FROM projects AS p
+USING projects AS older
+WHERE p.user_id = older.user_id AND md5(p.description) = md5(older.description) AND p.project_id > older.project_id;
+DROP INDEX IF EXISTS projects_user_id_description_key;
+CREATE UNIQUE INDEX projects_user_id_description_key ON projects (user_id, md5(description));
+
+DELETE FROM certifications AS c
+USING certifications AS older
+WHERE c.user_id = older.user_id AND c.certificate = older.certificate AND c.certification_id > older.certification_id;
+ALTER TABLE certifications DROP CONSTRAINT IF EXISTS certifications_user_id_certificate_key;
+ALTER TABLE certifications ADD CONSTRAINT certifications_user_id_certificate_key UNIQUE (user_id, certificate);
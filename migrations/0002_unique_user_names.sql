@@ -0,0 +1,15 @@
+-- Login looks users up by user_name, so it needs an index; making it unique also lets Create Account insert with
+-- ON CONFLICT instead of racing another sign-up past a COUNT check.
+
+-- Names signed up twice before this keep their oldest account; the later ones get '#' and their user_id appended
+-- (cut to fit the column) and are listed in renamed_user_names so their owners can be told their new login.
+CREATE TABLE renamed_user_names AS
+SELECT user_id, user_name AS old_user_name,
+       left(user_name, 25 - length('#' || user_id)) || '#' || user_id AS new_user_name
+FROM (SELECT user_id, user_name, row_number() OVER (PARTITION BY user_name ORDER BY user_id) AS copy FROM users) AS named
+WHERE copy > 1;
+UPDATE users AS u SET user_name = r.new_user_name
+FROM renamed_user_names AS r
+WHERE u.user_id = r.user_id;
+
+ALTER TABLE users ADD CONSTRAINT users_user_name_key UNIQUE (user_name);
@@ -0,0 +1,33 @@
+-- save_job_query never set users_jobs.job_id. It inserted the job and the users_jobs row in one transaction, and rows
+-- written by the same transaction share xmin, so each save is matched back to the job it saved. users_jobs has no link
+-- to match on, so a save is only matched when its transaction wrote exactly one unclaimed job.
+UPDATE users_jobs AS u SET job_id = j.job_id
+FROM jobs AS j
+WHERE u.job_id IS NULL AND u.xmin = j.xmin
+AND NOT EXISTS (SELECT 1 FROM users_jobs AS saved WHERE saved.job_id = j.job_id)
+AND (SELECT count(*) FROM jobs AS same WHERE same.xmin = j.xmin) = 1
+AND (SELECT count(*) FROM users_jobs AS same WHERE same.job_id IS NULL AND same.xmin = u.xmin) = 1;
+
+-- Saves that can't be matched are kept aside, with their transaction, rather than deleted, so they can still be matched by hand
+CREATE TABLE users_jobs_unmatched AS
+SELECT user_id, saved_date, xmin::text::bigint AS saved_xid
+FROM users_jobs
+WHERE job_id IS NULL;
+DELETE FROM users_jobs WHERE job_id IS NULL;
+
+-- Duplicate jobs are left alone here: the same post can be linked with different tracking parameters, so the link
+-- doesn't identify a job. 0005_job_keys folds them on their job key instead.
+
+-- A user saves a job once; the primary key also serves the user's saved jobs lookup and join
+DELETE FROM users_jobs AS u
+USING users_jobs AS other
+WHERE u.user_id = other.user_id AND u.job_id = other.job_id AND u.ctid > other.ctid;
+ALTER TABLE users_jobs ALTER COLUMN user_id SET NOT NULL;
+ALTER TABLE users_jobs ALTER COLUMN job_id SET NOT NULL;
+ALTER TABLE users_jobs ADD PRIMARY KEY (user_id, job_id);
+
+-- The saved jobs view lists a user's jobs newest first
+CREATE INDEX users_jobs_user_id_saved_date_idx ON users_jobs (user_id, saved_date DESC, job_id DESC);
+
+-- Foreign key lookups when a job is deleted or merged
+CREATE INDEX users_jobs_job_id_idx ON users_jobs (job_id);
@@ -0,0 +1,30 @@
+-- Résumé sections come back in the order they were entered, not in whatever order the heap returns them.
+ALTER TABLE work_experiences ADD COLUMN position INT NOT NULL DEFAULT 0;
+ALTER TABLE education ADD COLUMN position INT NOT NULL DEFAULT 0;
+ALTER TABLE projects ADD COLUMN position INT NOT NULL DEFAULT 0;
+ALTER TABLE certifications ADD COLUMN position INT NOT NULL DEFAULT 0;
+
+UPDATE work_experiences AS w SET position = o.position
+FROM (SELECT user_id, work_experience_id, row_number() OVER (PARTITION BY user_id ORDER BY work_experience_id) - 1 AS position
+      FROM work_experiences) AS o
+WHERE w.user_id = o.user_id AND w.work_experience_id = o.work_experience_id;
+
+UPDATE education AS e SET position = o.position
+FROM (SELECT user_id, education_id, row_number() OVER (PARTITION BY user_id ORDER BY education_id) - 1 AS position
+      FROM education) AS o
+WHERE e.user_id = o.user_id AND e.education_id = o.education_id;
+
+UPDATE projects AS p SET position = o.position
+FROM (SELECT user_id, project_id, row_number() OVER (PARTITION BY user_id ORDER BY project_id) - 1 AS position
+      FROM projects) AS o
+WHERE p.user_id = o.user_id AND p.project_id = o.project_id;
+
+UPDATE certifications AS c SET position = o.position
+FROM (SELECT user_id, certification_id, row_number() OVER (PARTITION BY user_id ORDER BY certification_id) - 1 AS position
+      FROM certifications) AS o
+WHERE c.user_id = o.user_id AND c.certification_id = o.certification_id;
+
+CREATE INDEX work_experiences_user_id_position_idx ON work_experiences (user_id, position);
+CREATE INDEX education_user_id_position_idx ON education (user_id, position);
+CREATE INDEX projects_user_id_position_idx ON projects (user_id, position);
+CREATE INDEX certifications_user_id_position_idx ON certifications (user_id, position);
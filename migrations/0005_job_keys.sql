@@ -0,0 +1,36 @@
+-- Jobs are identified by a stable key rather than by their URL, so a post found through different links or saved by many
+-- users is stored once. The key is 'jk:' and the Indeed job key, or 'sha256:' and a hash of the normalised title, company,
+-- location and description (find_core_job_details.job_fingerprint computes the same key in Python).
+ALTER TABLE jobs ADD COLUMN job_key VARCHAR(80);
+
+-- Existing rows only kept the summary, not the scraped description, so a row without a job key may not hash the same as
+-- the post does when it's saved again; that save just adds a new row.
+UPDATE jobs SET job_key = COALESCE(
+    'jk:' || COALESCE(substring(link_to_application FROM '[?&]jk=([^&#]+)'), substring(link_to_application FROM '[?&]vjk=([^&#]+)')),
+    'sha256:' || encode(sha256(convert_to(
+        lower(regexp_replace(btrim(COALESCE(job_title, '')), '\s+', ' ', 'g')) || chr(31) ||
+        lower(regexp_replace(btrim(COALESCE(company_name, '')), '\s+', ' ', 'g')) || chr(31) ||
+        lower(regexp_replace(btrim(COALESCE(location, '')), '\s+', ' ', 'g')) || chr(31) ||
+        lower(regexp_replace(btrim(COALESCE(job_description, '')), '\s+', ' ', 'g')), 'UTF8')), 'hex'));
+
+-- Duplicate jobs are folded into the oldest one. A user who saved more than one copy keeps the latest save date.
+CREATE TEMPORARY TABLE duplicate_job_keys ON COMMIT DROP AS
+SELECT job_id, min(job_id) OVER (PARTITION BY job_key) AS keep_job_id
+FROM jobs;
+DELETE FROM duplicate_job_keys WHERE job_id = keep_job_id;
+INSERT INTO users_jobs(user_id, job_id, saved_date)
+SELECT u.user_id, d.keep_job_id, max(u.saved_date)
+FROM users_jobs AS u
+JOIN duplicate_job_keys AS d ON u.job_id = d.job_id
+GROUP BY u.user_id, d.keep_job_id
+ON CONFLICT (user_id, job_id) DO UPDATE
+SET saved_date = GREATEST(users_jobs.saved_date, EXCLUDED.saved_date);
+DELETE FROM users_jobs AS u USING duplicate_job_keys AS d WHERE u.job_id = d.job_id;
+DELETE FROM jobs AS j USING duplicate_job_keys AS d WHERE j.job_id = d.job_id;
+
+ALTER TABLE jobs ALTER COLUMN job_key SET NOT NULL;
+ALTER TABLE jobs ADD CONSTRAINT jobs_job_key_key UNIQUE (job_key);
+
+-- Databases migrated before 0003_saved_jobs_keys stopped adding it still have the link constraint. The same post can be
+-- linked with different tracking parameters, so the link doesn't identify a job.
+ALTER TABLE jobs DROP CONSTRAINT IF EXISTS jobs_link_to_application_key;
@@ -0,0 +1,5 @@
+-- The saved jobs list pages through (saved_date, job_id), which needs every save to have a date.
+-- Saves recorded without one are treated as saved when this migration ran.
+UPDATE users_jobs SET saved_date = current_date WHERE saved_date IS NULL;
+ALTER TABLE users_jobs ALTER COLUMN saved_date SET DEFAULT current_date;
+ALTER TABLE users_jobs ALTER COLUMN saved_date SET NOT NULL;
@@ -0,0 +1,9 @@
+-- A work experience saved with a blank start date has a NULL start_date, and NULLs never conflict, so re-saving it added
+-- a copy every time. The key now counts a missing start date as one value, -infinity, which the upsert matches on.
+DELETE FROM work_experiences AS w
+USING work_experiences AS older
+WHERE w.user_id = older.user_id AND w.job_title = older.job_title AND w.company = older.company
+  AND w.start_date IS NULL AND older.start_date IS NULL AND w.work_experience_id > older.work_experience_id;
+ALTER TABLE work_experiences DROP CONSTRAINT work_experiences_user_id_job_title_company_start_date_key;
+CREATE UNIQUE INDEX work_experiences_user_id_job_title_company_start_date_key
+    ON work_experiences (user_id, job_title, company, COALESCE(start_date, '-infinity'::date));
@@ -1,21 +1,177 @@
+"""
+Scrapes Indeed for a list of (job title, location) searches, spread across several worker processes.
+
+Each worker process runs its own undetected Chrome, the results are de-duplicated and streamed into one JSON lines file.
+With --backend http the searches run in threads sharing one pooled HTTP session instead (see http_scraper.py), which
+needs no Chrome, so many more can run at once. --backend async fetches the pages of every search from one asyncio work
+queue (see async_crawler.py), kept at the request rate allowed per host.
+
+    $ python pipeline.py queries.csv --workers 4 --max-posts 200 --output scraped_jobs.jsonl --rotate-mb 100 --gzip
+    $ python pipeline.py queries.csv --backend http --workers 32 --chrome-fallback
+    $ python pipeline.py queries.csv --backend async --workers 32 --per-host 8 --rps 10
+
+The queries file is a CSV with a job title and a location on each line, e.g. "Data Analyst,Liverpool".
+"""
 from find_core_job_details import *
-import json
-
-# Setup Chrome options to disable popups and redirections
-chrome_options = Options()
-chrome_options.add_argument("--disable-popup-blocking")
-chrome_options.add_argument("--disable-notifications")
-chrome_options.add_argument("--disable-extensions")
-chrome_options.add_argument("--disable-infobars")
-chrome_options.add_argument("--disable-web-security")
-chrome_options.add_argument("--disable-blink-features=AutomationControlled")
-    
-# Instantiate the driver
-driver = uc.Chrome(options=chrome_options)
-load_and_search(driver, job_title_search, location_search)
-
-# Find the job information
-job_dic = save_job_information(driver)
-
-with open("job_description.json", "w") as outfile: 
-    json.dump(job_dic, outfile)
\ No newline at end of file
+from driver_pool import DriverPool
+from async_crawler import AsyncCrawler
+from http_scraper import ChromeFallback, HttpScraper, new_http_session
+from jsonl_sink import JsonlSink
+from selector_registry import registry
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+import argparse
+import asyncio
+import csv
+import multiprocessing
+import multiprocessing.util
+
+# Each worker process gets its own single driver pool, set up by init_worker
+driver_pool = None
+
+def read_queries(path: str):
+    """
+    This function reads the (job title, location) pairs from the queries file, skipping blank lines, comments and a header row.
+    """
+    queries = []
+    with open(path, newline='') as infile:
+        for row in csv.reader(infile):
+            if not row or not row[0].strip() or row[0].startswith('#'):
+                continue
+            job_title_search = row[0].strip()
+            location_search = row[1].strip() if len(row) > 1 else ''
+            if (job_title_search.lower(), location_search.lower()) == ('job_title', 'location'):
+                continue
+            queries.append((job_title_search, location_search))
+    return queries
+
+def init_worker():
+    """
+    This function starts the driver pool of a worker process and makes sure Chrome is quit when the worker exits.
+    """
+    global driver_pool
+    driver_pool = DriverPool(max_size=1)
+    multiprocessing.util.Finalize(driver_pool, driver_pool.close, exitpriority=10)
+
+def scrape_query(query: tuple, max_posts: int):
+    """
+    This function crawls the results of one search in a worker process. Jobs scraped before an error are still returned.
+    """
+    job_title_search, location_search = query
+    jobs = []
+    try:
+        with driver_pool.driver() as driver:
+            for job_dic in crawl_results(driver, job_title_search, location_search, max_posts):
+                jobs.append(job_dic)
+    except Exception as error:
+        print(f"Search for '{job_title_search}' in '{location_search}' stopped early: {error!r}")
+    print(f"Worker waiting after '{job_title_search}' in '{location_search}': {waiter.summary()}")
+    print(registry.summary())
+    return query, jobs
+
+def scrape_query_http(query: tuple, max_posts: int, scraper: HttpScraper):
+    """
+    This function crawls the results of one search over HTTP. Jobs scraped before an error are still returned.
+    """
+    job_title_search, location_search = query
+    jobs = []
+    try:
+        for job_dic in scraper.crawl_results(job_title_search, location_search, max_posts):
+            jobs.append(job_dic)
+    except Exception as error:
+        print(f"Search for '{job_title_search}' in '{location_search}' stopped early: {error!r}")
+    return query, jobs
+
+def dedup_key(job_dic: dict):
+    """
+    This function returns the key used to spot the same job post found by different searches.
+    """
+    return job_fingerprint(job_dic)
+
+def write_results(results, sink: JsonlSink):
+    """
+    This function writes every new job of the (query, jobs) results to the sink as each search finishes and returns the
+    number of unique jobs written.
+    """
+    seen_keys = set()
+    for (job_title_search, location_search), query_jobs in results:
+        for job_dic in query_jobs:
+            if dedup_key(job_dic) not in seen_keys:
+                seen_keys.add(dedup_key(job_dic))
+                sink.write(job_dic)
+        print(f"'{job_title_search}' in '{location_search}': {len(query_jobs)} jobs, {len(seen_keys)} unique so far")
+    return len(seen_keys)
+
+async def write_crawled_jobs(queries: list, sink: JsonlSink, crawler: AsyncCrawler, max_posts: int = 100):
+    """
+    This function writes every new job of an asyncio crawl of the searches to the sink as soon as it's scraped and
+    returns the number of unique jobs written.
+    """
+    seen_keys = set()
+    async for job_dic in crawler.crawl(queries, max_posts):
+        if dedup_key(job_dic) not in seen_keys:
+            seen_keys.add(dedup_key(job_dic))
+            sink.write(job_dic)
+            if len(seen_keys) % 100 == 0:
+                print(f"{len(seen_keys)} unique jobs so far, {crawler.pages} pages fetched")
+    return len(seen_keys)
+
+def run_pipeline(queries: list, sink: JsonlSink, workers: int = 2, max_posts: int = 100, backend: str = 'chrome',
+                 chrome_fallback: bool = False, per_host: int = 8, requests_per_second: float = 5):
+    """
+    This function fans the searches out across the workers and writes every new job to the sink as each search finishes.
+    Workers are processes with a Chrome each, threads sharing one HTTP session with backend='http', or asyncio tasks
+    sharing one work queue with backend='async', which sends a host at most per_host requests at once and
+    requests_per_second on average. It returns the number of unique jobs written.
+    """
+    if backend == 'async':
+        crawler = AsyncCrawler(concurrency=workers, per_host_concurrency=per_host, requests_per_second=requests_per_second)
+        count = asyncio.run(write_crawled_jobs(queries, sink, crawler, max_posts))
+        print(f"Fetched {crawler.pages} pages, retried {crawler.retries} requests and gave up on {crawler.failures} pages")
+        print(registry.summary())
+        return count
+    if backend == 'http':
+        fallback_pool = DriverPool(max_size=1) if chrome_fallback else None
+        scraper = HttpScraper(new_http_session(pool_size=workers), fallback=ChromeFallback(fallback_pool) if fallback_pool else None)
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(scrape_query_http, query, max_posts, scraper) for query in queries]
+                count = write_results((future.result() for future in as_completed(futures)), sink)
+        finally:
+            if fallback_pool is not None:
+                fallback_pool.close()
+        print(f"Fetched {scraper.http_pages} pages over HTTP and {scraper.fallback_pages} with Chrome")
+        print(registry.summary())
+        return count
+    # Spawn rather than fork, so no worker inherits another process's Chrome or threads
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(processes=workers, initializer=init_worker) as pool:
+        count = write_results(pool.imap_unordered(partial(scrape_query, max_posts=max_posts), queries), sink)
+        pool.close()
+        pool.join()
+    return count
+
+def main():
+    parser = argparse.ArgumentParser(description='Scrape Indeed job posts for a file of job title, location searches.')
+    parser.add_argument('queries', help='CSV file with a job title and a location on each line')
+    parser.add_argument('--workers', type=int, default=2, help='number of searches run at once (processes with their own Chrome, threads with --backend http, or pages fetched at once with --backend async)')
+    parser.add_argument('--backend', choices=['chrome', 'http', 'async'], default='chrome', help='scrape with Chrome, over plain HTTP, or over HTTP with asyncio')
+    parser.add_argument('--chrome-fallback', action='store_true', help='with --backend http, fetch pages Indeed turns away with Chrome')
+    parser.add_argument('--per-host', type=int, default=8, help='with --backend async, number of pages fetched at once from one host')
+    parser.add_argument('--rps', type=float, default=5, help='with --backend async, requests per second allowed to one host')
+    parser.add_argument('--max-posts', type=int, default=100, help='maximum number of job posts to scrape per search')
+    parser.add_argument('--output', default='scraped_jobs.jsonl', help='JSON lines file the de-duplicated jobs are appended to')
+    parser.add_argument('--rotate-mb', type=float, help='start a new output file once this many megabytes have been written')
+    parser.add_argument('--rotate-hours', type=float, help='start a new output file after this many hours')
+    parser.add_argument('--gzip', action='store_true', help='gzip the output')
+    args = parser.parse_args()
+
+    max_bytes = int(args.rotate_mb * 1024 * 1024) if args.rotate_mb else None
+    max_age = args.rotate_hours * 3600 if args.rotate_hours else None
+    with JsonlSink(args.output, max_bytes, max_age, args.gzip) as sink:
+        count = run_pipeline(read_queries(args.queries), sink, args.workers, args.max_posts, args.backend, args.chrome_fallback,
+                             args.per_host, args.rps)
+    print(f"Saved {count} jobs to {sink.path}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+import queue
+import threading
+import time
+from typing import NamedTuple
+
+_END = object()  # Put on the queue after the last job
+
+
+class PrefetchedJob(NamedTuple):
+    job_dic: dict
+    summary: str  # None when the job couldn't be summarised ahead of time
+
+
+class JobPrefetcher:
+    """
+    Scrapes and summarises the next jobs of a search in a background thread while the user reads the current one.
+
+    fetch_job is called with no arguments and returns the next job dictionary, or None when there are no jobs left;
+    summarise returns the summary of a job dictionary. Up to depth jobs are kept ready, so next() usually returns at
+    once. A job someone is already waiting for is handed over as soon as it's scraped, unsummarised, so its summary
+    can be streamed instead. fetch_job is only ever called from the prefetch thread, so it can drive a Selenium driver
+    that nothing else uses until close(). The thread stops on its own when next() hasn't been called for idle_timeout
+    seconds, and the next call to next() starts it again where it stopped.
+    """
+
+    def __init__(self, fetch_job, summarise=None, depth: int = 3, idle_timeout: float = 900):
+        self.depth = depth
+        self.idle_timeout = idle_timeout
+        self.hits = 0    # Jobs that were ready when next() was called
+        self.misses = 0  # Jobs next() had to wait for
+        self.restarts = 0  # Times the thread was started again after stopping for being left unused
+        self._fetch_job = fetch_job
+        self._summarise = summarise
+        self._queue = queue.Queue(maxsize=depth)
+        self._stop = threading.Event()
+        self._last_used = time.monotonic()
+        self._waiting = threading.Event()  # Set while next() waits for a job
+        self._finished = False
+        self._idle = False  # Set when the thread stopped for being left unused rather than at the end of the search
+        self._held = None   # Job scraped by the thread that stopped for being left unused, handed out first on restart
+        self._start()
+
+    def _start(self):
+        self._thread = threading.Thread(target=self._run, name='job-prefetch', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        try:
+            if self._held is not None:
+                held, self._held = self._held, None
+                if not self._put(held):
+                    return
+            while not self._stop.is_set():
+                job_dic = self._fetch_job()
+                if job_dic is None:
+                    break
+                summary = None
+                if self._summarise is not None and not self._waiting.is_set():
+                    try:
+                        summary = self._summarise(job_dic)
+                    except Exception:
+                        pass  # Summarised when it's shown instead
+                if not self._put(PrefetchedJob(job_dic, summary)):
+                    return
+        except Exception as error:
+            self._put(error)
+            return
+        self._put(_END)
+
+    def _put(self, item):
+        """
+        Waits for room on the queue. Returns False if the prefetcher was closed or left unused for idle_timeout first.
+        """
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=1)
+                return True
+            except queue.Full:
+                if time.monotonic() - self._last_used > self.idle_timeout:
+                    self._held = item
+                    self._idle = True
+                    self._stop.set()
+        return False
+
+    @property
+    def ready(self):
+        """
+        Number of jobs that next() can return without waiting.
+        """
+        return self._queue.qsize()
+
+    def next(self, timeout: float = None):
+        """
+        This function returns the next PrefetchedJob, waiting for it if it isn't ready yet, or None when the search has
+        no jobs left. An error raised while scraping is raised here.
+        """
+        self._last_used = time.monotonic()
+        if self._finished:
+            return None
+        try:
+            item = self._queue.get_nowait()
+            self.hits += 1
+        except queue.Empty:
+            if self._idle:
+                # Stopped after being left unused, not at the end of the search, so carry on where it stopped
+                self._thread.join()
+                self._idle = False
+                self._stop.clear()
+                self.restarts += 1
+                self._start()
+            elif not self._thread.is_alive() and self._queue.empty():
+                self._finished = True
+                return None
+            self.misses += 1
+            self._waiting.set()
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                raise TimeoutError(f"The next job wasn't scraped within {timeout} seconds") from None
+            finally:
+                self._waiting.clear()
+        self._last_used = time.monotonic()
+        if item is _END:
+            self._finished = True
+            return None
+        if isinstance(item, Exception):
+            self._finished = True
+            raise item
+        return item
+
+    def next_ready(self):
+        """
+        This function returns the next PrefetchedJob that has already been scraped, without waiting for one or starting
+        the thread again, or None when there isn't one. It lets the jobs scraped so far be shown after whatever
+        fetch_job uses has gone, e.g. a driver the pool reclaimed.
+        """
+        self._last_used = time.monotonic()
+        if self._finished:
+            return None
+        try:
+            item = self._queue.get_nowait()
+        except queue.Empty:
+            if not self._idle:
+                return None
+            self._thread.join()
+            item, self._held = self._held, None
+        if not isinstance(item, PrefetchedJob):
+            self._finished = True  # The end of the search, or an error
+            return None
+        self.hits += 1
+        return item
+
+    def close(self, timeout: float = None):
+        """
+        This function stops prefetching and waits for the job being scraped to finish, so whatever fetch_job uses
+        (such as its driver) is free again once it returns.
+        """
+        self._stop.set()
+        self._finished = True
+        self._held = None
+        while True:
+            try:
+                self._queue.get_nowait()  # Frees a thread waiting to put its last job
+            except queue.Empty:
+                break
+        self._thread.join(timeout)
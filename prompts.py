@@ -0,0 +1,10 @@
+def job_summary_prompt(job_description: str):
+    """
+    This function returns the prompt used to summarise a scraped job post. The app and the bulk summariser share it
+    so a summary made by one is a completion cache hit for the other.
+    """
+    return f"""
+    In 200 words and In a single paragraph, summarise the job post, including all the important details such as company, position, pay, location, projects, skills and tools required. 
+    The job post is provided below, delimited by 3 backticks.
+    ```{job_description}```
+    """
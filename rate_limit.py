@@ -0,0 +1,44 @@
+import asyncio
+import random
+import time
+
+
+class TokenBucket:
+    """
+    asyncio token bucket: holds up to capacity tokens and refills at rate tokens per second.
+    acquire() waits until enough tokens are available, so callers are spread out to the allowed rate.
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1)
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, tokens: float = 1):
+        """
+        This function waits until the bucket holds the tokens and takes them. Requests larger than the capacity
+        take the whole bucket and wait for the rest, rather than waiting forever.
+        """
+        async with self._lock:
+            while True:
+                self._refill()
+                needed = min(tokens, self.capacity)
+                if self._tokens >= needed:
+                    self._tokens -= tokens
+                    return
+                await asyncio.sleep((needed - self._tokens) / self.rate)
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+
+def backoff_delay(attempt: int, base: float = 0.5, cap: float = 30):
+    """
+    This function returns how long to wait before retry number attempt (starting at 0), using exponential backoff
+    with full jitter so clients that failed together don't retry together.
+    """
+    return random.uniform(0, min(cap, base * 2 ** attempt))
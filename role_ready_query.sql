@@ -1,3 +1,4 @@
+-- Baseline schema. Create the tables with this file once, then run `python migrate.py` to apply migrations/.
 CREATE TABLE users(
 user_id SERIAL PRIMARY KEY,
 user_name VARCHAR(25) NOT NULL,
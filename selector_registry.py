@@ -0,0 +1,236 @@
+"""
+The selectors every scraper finds Indeed's page elements with, read from job_selectors.json.
+
+Each element has an ordered chain of selectors, tried until one matches: stable hooks such as data-testid and ids first,
+Indeed's hashed CSS classes after them. A selector is CSS, or XPath when it starts with "xpath:" (Chrome only).
+The file is read again when it changes, at most every check_interval seconds, so a markup change can be fixed while
+the app and crawls keep running. Which selector of each chain matched is counted, so a selector that stopped matching
+shows up as a falling hit rate instead of every lookup timing out.
+
+    $ python selector_registry.py saved_job_page.html saved_results_page.html   # Hit rates over saved pages
+"""
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from typing import NamedTuple
+
+import soupsieve
+from bs4 import BeautifulSoup
+
+SELECTORS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'job_selectors.json')
+
+logger = logging.getLogger(__name__)
+
+
+class Selector(NamedTuple):
+    by: str  # 'css selector' or 'xpath', as Selenium's By takes it
+    value: str
+    compiled: object  # soupsieve pattern for a CSS selector, None for XPath
+
+
+def compile_selectors(config: dict):
+    """
+    This function returns {name: tuple of Selector} for a {name: list of selector strings} config.
+    Raises ValueError if a chain isn't a list of strings or soupsieve.SelectorSyntaxError for invalid CSS.
+    """
+    chains = {}
+    for name, values in config.items():
+        if isinstance(values, str) or not all(isinstance(value, str) for value in values):
+            raise ValueError(f"The selectors of {name} must be a list of strings")
+        chains[name] = tuple(Selector('xpath', value[len('xpath:'):], None) if value.startswith('xpath:')
+                             else Selector('css selector', value, soupsieve.compile(value)) for value in values)
+    return chains
+
+
+class SelectorRegistry:
+    """
+    Fallback chains of selectors by name, reloaded when their file changes, with hit counts per selector.
+
+    select_one and select look in BeautifulSoup pages with the compiled CSS selectors; find and find_all look through a
+    Selenium driver without waiting. Safe to share between threads.
+    """
+
+    def __init__(self, path: str = SELECTORS_PATH, check_interval: float = 2):
+        self.path = path
+        self.check_interval = check_interval
+        self._chains = {}
+        self.load_error = None  # Why the file couldn't be loaded the last time it changed, while the older selectors are kept
+        self._mtime = None
+        self._next_check = 0
+        self._lookups = Counter()  # name -> lookups
+        self._hits = Counter()     # (name, selector) -> lookups it matched
+        self._lock = threading.Lock()
+        self.reload()
+
+    def reload(self):
+        """
+        This function reads the selectors file again if it has changed since it was last read and returns True if it did.
+        A file that can't be read or compiled is logged and kept in load_error, which summary() reports, and the
+        selectors in use are kept.
+        """
+        self._next_check = time.monotonic() + self.check_interval
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+            if mtime == self._mtime:
+                return False
+            self._mtime = mtime  # A broken file is reported once, not at every check
+            with open(self.path, encoding='utf-8') as infile:
+                chains = compile_selectors(json.load(infile))
+        except (OSError, ValueError, soupsieve.SelectorSyntaxError) as error:
+            if not self._chains:
+                raise
+            self.load_error = f"{self.path} couldn't be loaded, keeping the selectors in use: {error!r}"
+            logger.warning(self.load_error)
+            return False
+        self.load_error = None
+        with self._lock:
+            for name, chain in self._chains.items():
+                if chains.get(name) != chain:  # Hit rates start again for the chains that changed
+                    self._lookups.pop(name, None)
+                    for selector in chain:
+                        self._hits.pop((name, selector.value), None)
+            self._chains = chains
+        return True
+
+    def chain(self, name: str):
+        """
+        This function returns the selectors of name in the order they're tried.
+        """
+        if time.monotonic() >= self._next_check:
+            self.reload()
+        return self._chains[name]
+
+    @property
+    def names(self):
+        return list(self._chains)
+
+    def _record(self, name: str, selector: Selector = None):
+        with self._lock:
+            self._lookups[name] += 1
+            if selector is not None:
+                self._hits[name, selector.value] += 1
+
+    def select_one(self, soup, name: str):
+        """
+        This function returns the first element of a BeautifulSoup page matched by the first selector of name's chain
+        that matches, or None.
+        """
+        for selector in self.chain(name):
+            if selector.compiled is not None:
+                element = selector.compiled.select_one(soup)
+                if element is not None:
+                    self._record(name, selector)
+                    return element
+        self._record(name)
+        return None
+
+    def select(self, soup, name: str):
+        """
+        This function returns every element of a BeautifulSoup page matched by the first selector of name's chain that
+        matches anything.
+        """
+        for selector in self.chain(name):
+            if selector.compiled is not None:
+                elements = selector.compiled.select(soup)
+                if elements:
+                    self._record(name, selector)
+                    return elements
+        self._record(name)
+        return []
+
+    def find_all(self, driver, name: str, record: bool = True):
+        """
+        This function returns the Selenium elements matched by the first selector of name's chain that matches
+        anything, without waiting.
+        """
+        for selector in self.chain(name):
+            elements = driver.find_elements(selector.by, selector.value)
+            if elements:
+                if record:
+                    self._record(name, selector)
+                return elements
+        if record:
+            self._record(name)
+        return []
+
+    def find(self, driver, name: str, record: bool = True):
+        """
+        This function returns the first Selenium element matched by name's chain without waiting, or None.
+        """
+        elements = self.find_all(driver, name, record)
+        return elements[0] if elements else None
+
+    def present(self, *names):
+        """
+        This function returns a condition for adaptive_wait that holds the first element found of any of the names.
+        Polling it isn't counted in the hit rates.
+        """
+        def condition(driver):
+            for name in names:
+                element = self.find(driver, name, record=False)
+                if element is not None:
+                    return element
+            return False
+        return condition
+
+    def stats(self):
+        """
+        This function returns {name: {'lookups', 'misses', 'hit_rates': {selector: share of lookups it matched}}}.
+        """
+        with self._lock:
+            lookups, hits = dict(self._lookups), dict(self._hits)
+            chains = dict(self._chains)
+        stats = {}
+        for name, count in sorted(lookups.items()):
+            selector_hits = {selector.value: hits.get((name, selector.value), 0) for selector in chains.get(name, ())}
+            stats[name] = {'lookups': count, 'misses': count - sum(selector_hits.values()),
+                           'hit_rates': {value: selector_count / count for value, selector_count in selector_hits.items()}}
+        return stats
+
+    def summary(self):
+        """
+        This function returns a one-line description of the chains whose first selector didn't match every lookup, and
+        of a selectors file that couldn't be loaded.
+        """
+        parts = [self.load_error] if self.load_error else []
+        for name, name_stats in self.stats().items():
+            first_hit_rate = next(iter(name_stats['hit_rates'].values()), 0)
+            if first_hit_rate < 1:
+                parts.append(f"{name} {first_hit_rate:.0%} first selector, {name_stats['misses']}/{name_stats['lookups']} missed")
+        return 'Selectors: ' + (', '.join(parts) if parts else 'every lookup matched its first selector')
+
+    def reset_stats(self):
+        with self._lock:
+            self._lookups.clear()
+            self._hits.clear()
+
+
+# Shared by the scrapers of this process; set JOB_SELECTORS_PATH to use another file
+registry = SelectorRegistry(os.getenv('JOB_SELECTORS_PATH', SELECTORS_PATH))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Show how often each selector matches on saved Indeed pages.')
+    parser.add_argument('pages', nargs='+', help='saved HTML of job posts and search results pages')
+    parser.add_argument('--selectors', default=registry.path, help='selectors file to check')
+    args = parser.parse_args()
+
+    selectors = SelectorRegistry(args.selectors)
+    for path in args.pages:
+        with open(path, encoding='utf-8') as infile:
+            soup = BeautifulSoup(infile.read(), 'html.parser')
+        for name in selectors.names:
+            if all(selector.compiled is not None for selector in selectors.chain(name)):  # XPath can't be checked here
+                selectors.select_one(soup, name)
+    for name, name_stats in selectors.stats().items():
+        print(f"{name}: matched {name_stats['lookups'] - name_stats['misses']} of {name_stats['lookups']} pages")
+        for value, hit_rate in name_stats['hit_rates'].items():
+            print(f"    {hit_rate:6.1%}  {value}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,497 @@
+"""
+Semantic "jobs like this one" and "jobs that fit my résumé" search over the jobs table.
+
+    $ python semantic_search.py sync              # Embeds the jobs added to the jobs table since the last sync
+    $ python semantic_search.py build             # Re-clusters the index, worth doing after it has grown a lot
+    $ python semantic_search.py similar 123       # Jobs like job 123
+    $ python semantic_search.py resume 7          # Jobs that fit user 7's résumé
+
+Vectors are kept in memory-mapped files named after SEMANTIC_INDEX_PATH. Jobs are embedded with the local HashingEmbedder
+unless EMBEDDING_MODEL names an OpenAI embedding model (such as text-embedding-3-small); an index only holds vectors of
+the embedder it was created with.
+"""
+import argparse
+import json
+import os
+import threading
+from contextlib import contextmanager
+from typing import NamedTuple
+
+import numpy as np
+import openai
+from dotenv import load_dotenv
+from scipy import sparse
+
+from db import fetch_all, load_profile
+from job_matching import phrase_hashes, profile_text, text_features
+
+try:
+    import fcntl
+except ImportError:  # Windows, where only one process should write to an index
+    fcntl = None
+
+SEMANTIC_INDEX_PATH = 'semantic_index'
+
+# Too common to say anything about a job
+STOP_WORDS = ('a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'has', 'have', 'in', 'is', 'it', 'of', 'on',
+              'or', 'our', 'that', 'the', 'their', 'this', 'to', 'we', 'will', 'with', 'you', 'your')
+
+_SIGN_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
+
+def normalise(vectors):
+    """
+    This function returns the rows of vectors scaled to unit length as float32, so dot products are cosine similarities.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+class HashingEmbedder:
+    """
+    Embedder that needs no model or network and always gives a text the same vector.
+
+    Every word and word pair of a text is hashed to one of dim dimensions with a random sign and weighted by how often
+    it occurs, so texts using the same words and phrases point the same way. It finds postings worded alike rather than
+    meaning alike, which is enough for similar job titles and skills and makes the index testable offline.
+    """
+
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+        self.name = f'hashing-{dim}'
+        self._stop_hashes = np.concatenate([phrase_hashes(word) for word in STOP_WORDS])
+
+    def embed(self, texts):
+        """
+        This function returns a unit length float32 row for each text.
+        """
+        texts = list(texts)
+        hashes, rows, counts = text_features(texts)
+        keep = ~np.isin(hashes, self._stop_hashes)
+        mixed = hashes[keep] * _SIGN_MULTIPLIER
+        dimensions = ((mixed >> np.uint64(32)) % np.uint64(self.dim)).astype(np.int64)
+        weights = np.log1p(counts[keep]) * np.where(mixed >> np.uint64(63), -1.0, 1.0)
+        vectors = np.bincount(rows[keep] * self.dim + dimensions, weights=weights, minlength=len(texts) * self.dim)
+        return normalise(vectors.reshape(len(texts), self.dim))
+
+
+class OpenAIEmbedder:
+    """
+    Embedder calling OpenAI's embeddings API, which places texts that mean the same thing close together.
+    """
+
+    def __init__(self, client: openai.OpenAI, model: str = 'text-embedding-3-small', dim: int = 256, batch_size: int = 256):
+        self.client = client
+        self.model = model
+        self.dim = dim
+        self.batch_size = batch_size
+        self.name = f'openai-{model}-{dim}'
+
+    def embed(self, texts):
+        """
+        This function returns a unit length float32 row for each text, asking for batch_size texts per request.
+        """
+        texts = [(text or ' ')[:20000] for text in texts]  # The API rejects empty texts and anything over 8191 tokens
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            response = self.client.embeddings.create(model=self.model, input=texts[start:start + self.batch_size], dimensions=self.dim)
+            vectors += [item.embedding for item in response.data]
+        return normalise(np.array(vectors, dtype=np.float32).reshape(len(texts), self.dim))
+
+
+def make_embedder():
+    """
+    This function returns the OpenAI embedder when EMBEDDING_MODEL is set, otherwise the HashingEmbedder.
+    """
+    model = os.getenv('EMBEDDING_MODEL')
+    if model:
+        return OpenAIEmbedder(openai.OpenAI(api_key=os.getenv('APIKEY')), model)
+    return HashingEmbedder()
+
+
+class SemanticMatch(NamedTuple):
+    job_id: int
+    score: float  # Cosine similarity, from -1 to 1
+
+
+class SemanticIndex:
+    """
+    Approximate nearest neighbour index of job vectors, stored in memory-mapped float32 files so it opens instantly and
+    only the parts a query reads are paged in.
+
+    build() clusters the vectors with k-means into about sqrt(n) lists and stores each list contiguously, and a query
+    only scores the vectors of the nprobe lists whose centroids are closest to it (an inverted file index). Jobs added
+    later are appended to the files and to the list of their closest centroid, so new jobs are found straight away;
+    rebuild once they make up a large part of the index. Until the first build every vector is scored.
+    Safe to share between threads and, on systems with fcntl, between processes: writes take a lock file and readers
+    reopen the index when another process has changed it.
+    """
+
+    def __init__(self, path: str = SEMANTIC_INDEX_PATH, embedder=None):
+        self.path = path
+        self.embedder = embedder if embedder is not None else HashingEmbedder()
+        self.dim = self.embedder.dim
+        self._lock = threading.RLock()
+        self._load()
+
+    def __len__(self):
+        with self._lock:
+            self._refresh()
+            return int(np.count_nonzero(self._ids[:self.count] >= 0))
+
+    @property
+    def list_count(self):
+        """
+        Number of lists the last build clustered the vectors into, 0 before the first build.
+        """
+        return 0 if self._centroids is None else len(self._centroids)
+
+    def _file(self, suffix: str):
+        return f'{self.path}.{suffix}'
+
+    def _load(self):
+        """
+        Opens the files of the index, or starts an empty one.
+        """
+        try:
+            with open(self._file('json')) as infile:
+                meta = json.load(infile)
+            self._meta_mtime = os.stat(self._file('json')).st_mtime_ns
+        except FileNotFoundError:
+            meta = {'embedder': self.embedder.name, 'count': 0, 'base_count': 0, 'capacity': 0, 'lists': 0, 'synced_job_id': 0}
+            self._meta_mtime = None
+        if meta['embedder'] != self.embedder.name:
+            raise ValueError(f"{self.path} holds {meta['embedder']} vectors, not {self.embedder.name} ones")
+        self.count = meta['count']  # Vectors in the files, including removed ones
+        self.base_count = meta['base_count']  # Vectors sorted into lists by the last build; the rest were added since
+        self.synced_job_id = meta.get('synced_job_id', 0)  # Every job up to this one has been read from the jobs table by sync_jobs
+        self._centroids = np.load(self._file('centroids.npy')) if meta['lists'] else None
+        self._map(meta['capacity'])
+        self._index_positions()
+
+    @contextmanager
+    def _writing(self):
+        """
+        Holds the thread lock and the index's lock file while it's written to, reading any changes made by others first.
+        """
+        with self._lock, open(self._file('lock'), 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            self._refresh()
+            yield
+
+    def _refresh(self):
+        """
+        Reopens the index when another process has changed it.
+        """
+        try:
+            mtime = os.stat(self._file('json')).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime != self._meta_mtime:
+            self._load()
+
+    def _map(self, capacity: int):
+        """
+        Memory-maps the vector, job ID and list files with room for capacity vectors, growing them when needed.
+        """
+        self.capacity = capacity
+        for suffix, dtype, shape in (('vectors', np.float32, (capacity, self.dim)), ('ids', np.int64, (capacity,)),
+                                     ('lists', np.int32, (capacity,))):
+            if not capacity:
+                setattr(self, '_' + suffix, np.zeros(shape, dtype=dtype))
+                continue
+            with open(self._file(suffix), 'ab') as outfile:
+                size = np.dtype(dtype).itemsize * int(np.prod(shape))
+                if outfile.tell() < size:
+                    outfile.truncate(size)
+            setattr(self, '_' + suffix, np.memmap(self._file(suffix), dtype=dtype, mode='r+', shape=shape))
+
+    def _index_positions(self):
+        """
+        Builds the lookups from job ID to position: a sorted array for the built part and a dict for jobs added since.
+        """
+        base_ids = np.asarray(self._ids[:self.base_count])
+        self._base_order = np.argsort(base_ids, kind='stable')
+        self._base_ids = base_ids[self._base_order]
+        tail_ids = self._ids[self.base_count:self.count].tolist()
+        self._tail_positions = {job_id: position for position, job_id in enumerate(tail_ids, self.base_count) if job_id >= 0}
+        self._offsets = None
+        if self._centroids is not None:
+            self._offsets = np.searchsorted(self._lists[:self.base_count], np.arange(len(self._centroids) + 1))
+        self._tail_lists = None
+
+    def _write_meta(self):
+        for mapped in (self._vectors, self._ids, self._lists):
+            if isinstance(mapped, np.memmap):
+                mapped.flush()
+        meta = {'embedder': self.embedder.name, 'count': self.count, 'base_count': self.base_count, 'capacity': self.capacity,
+                'lists': self.list_count, 'synced_job_id': self.synced_job_id}
+        with open(self._file('json.tmp'), 'w') as outfile:
+            json.dump(meta, outfile)
+        os.replace(self._file('json.tmp'), self._file('json'))
+        self._meta_mtime = os.stat(self._file('json')).st_mtime_ns
+
+    def _position(self, job_id: int):
+        """
+        Returns the position of the job's vector, or None if it isn't in the index.
+        """
+        position = self._tail_positions.get(job_id)
+        if position is None:
+            found = np.searchsorted(self._base_ids, job_id)
+            if found < len(self._base_ids) and self._base_ids[found] == job_id:
+                position = int(self._base_order[found])
+        return position if position is not None and self._ids[position] == job_id else None
+
+    def vector(self, job_id: int):
+        """
+        This function returns a copy of the job's vector, or None if it isn't in the index.
+        """
+        with self._lock:
+            self._refresh()
+            position = self._position(job_id)
+            return None if position is None else np.array(self._vectors[position])
+
+    def missing(self, job_ids):
+        """
+        This function returns the job IDs that aren't in the index, in the order given.
+        """
+        with self._lock:
+            self._refresh()
+            return [job_id for job_id in job_ids if self._position(job_id) is None]
+
+    def mark_synced(self, job_id: int):
+        """
+        This function records that every job of the jobs table up to job_id has been synced. Adding jobs doesn't move
+        this on, so jobs the app adds as they're saved can't hide older ones that were never embedded.
+        """
+        with self._writing():
+            self.synced_job_id = max(self.synced_job_id, int(job_id))
+            self._write_meta()
+
+    def add(self, job_ids, texts, batch_size: int = 10000):
+        """
+        This function embeds the texts and adds them under job_ids, replacing the vectors of jobs already in the index.
+        """
+        job_ids, texts = list(job_ids), list(texts)
+        for start in range(0, len(texts), batch_size):
+            self.add_vectors(job_ids[start:start + batch_size], self.embedder.embed(texts[start:start + batch_size]))
+
+    def add_vectors(self, job_ids, vectors):
+        """
+        This function adds already embedded vectors under job_ids, replacing the vectors of jobs already in the index.
+        """
+        job_ids = np.asarray(job_ids, dtype=np.int64)
+        vectors = normalise(np.reshape(vectors, (len(job_ids), self.dim)))
+        # A job given twice keeps its last vector
+        _, last = np.unique(job_ids[::-1], return_index=True)
+        keep = np.sort(len(job_ids) - 1 - last)
+        job_ids, vectors = job_ids[keep], vectors[keep]
+        with self._writing():
+            self._remove(job_ids)
+            end = self.count + len(job_ids)
+            if end > self.capacity:
+                self._map(max(2 * self.capacity, end, 1024))
+            self._vectors[self.count:end] = vectors
+            self._ids[self.count:end] = job_ids
+            self._lists[self.count:end] = -1 if self._centroids is None else _nearest(vectors, self._centroids)
+            self._tail_positions.update(zip(job_ids.tolist(), range(self.count, end)))
+            self.count = end
+            self._tail_lists = None
+            self._write_meta()
+
+    def remove(self, job_ids):
+        """
+        This function removes jobs from the index. Their space is reclaimed by the next build().
+        """
+        with self._writing():
+            self._remove(np.asarray(job_ids, dtype=np.int64))
+            self._write_meta()
+
+    def _remove(self, job_ids):
+        for job_id in job_ids.tolist():
+            position = self._position(job_id)
+            if position is not None:
+                self._ids[position] = -1
+                self._tail_positions.pop(job_id, None)
+
+    def build(self, lists: int = None, iterations: int = 10, sample_size: int = 100000, seed: int = 0):
+        """
+        This function clusters the vectors into lists (about the square root of the number of jobs by default) and
+        rewrites the files with each list stored contiguously, dropping removed jobs. Returns the index.
+        """
+        with self._writing():
+            live = np.flatnonzero(np.asarray(self._ids[:self.count]) >= 0)
+            if not len(live):
+                return self
+            lists = min(lists or max(1, int(round(np.sqrt(len(live))))), len(live))
+            rng = np.random.default_rng(seed)
+            sample = np.sort(rng.choice(live, min(len(live), max(sample_size, lists)), replace=False))
+            centroids = _kmeans(np.asarray(self._vectors[sample]), lists, iterations, rng)
+            chunks = np.array_split(live, max(1, len(live) // 65536))
+            assignment = np.concatenate([_nearest(np.asarray(self._vectors[chunk]), centroids) for chunk in chunks])
+            order = np.argsort(assignment, kind='stable')
+
+            for suffix, source, values in (('vectors', self._vectors, None), ('ids', self._ids, None),
+                                           ('lists', self._lists, assignment[order])):
+                rewritten = np.memmap(self._file(suffix + '.tmp'), dtype=source.dtype, mode='w+', shape=source.shape)
+                for start in range(0, len(live), 65536):
+                    chunk = slice(start, min(start + 65536, len(live)))
+                    rewritten[chunk] = values[chunk] if values is not None else source[live[order[chunk]]]
+                rewritten.flush()
+                del rewritten
+                os.replace(self._file(suffix + '.tmp'), self._file(suffix))
+            np.save(self._file('centroids.tmp.npy'), centroids)
+            os.replace(self._file('centroids.tmp.npy'), self._file('centroids.npy'))
+            self.count = self.base_count = len(live)
+            self._centroids = centroids
+            self._map(self.capacity)
+            self._index_positions()
+            self._write_meta()
+            return self
+
+    def _tail(self):
+        """
+        Returns the positions of the vectors added since the last build grouped by list, and where each list starts.
+        """
+        if self._tail_lists is None:
+            tail_lists = np.asarray(self._lists[self.base_count:self.count])
+            order = np.argsort(tail_lists, kind='stable')
+            self._tail_lists = (order + self.base_count, np.searchsorted(tail_lists[order], np.arange(len(self._centroids) + 1)))
+        return self._tail_lists
+
+    def search_vector(self, vector, k: int = 10, nprobe: int = 16, exclude=()):
+        """
+        This function returns the k jobs whose vectors are closest to vector as SemanticMatch, best first, scoring the
+        jobs in the nprobe closest lists. More lists find more of the true nearest jobs and take longer.
+        """
+        query = normalise(np.reshape(vector, (1, self.dim)))[0]
+        with self._lock:
+            self._refresh()
+            if self._centroids is None:
+                positions = np.arange(self.count)
+                scores = np.asarray(self._vectors[:self.count]) @ query
+            else:
+                probed = np.argsort(-(self._centroids @ query))[:nprobe]
+                tail_positions, tail_offsets = self._tail()
+                added = np.sort(np.concatenate([tail_positions[tail_offsets[cluster]:tail_offsets[cluster + 1]] for cluster in probed]))
+                positions = np.concatenate([np.arange(self._offsets[cluster], self._offsets[cluster + 1]) for cluster in probed] + [added])
+                scores = np.concatenate([np.asarray(self._vectors[self._offsets[cluster]:self._offsets[cluster + 1]]) @ query
+                                         for cluster in probed] + [np.asarray(self._vectors[added]) @ query])
+            job_ids = np.asarray(self._ids[positions])
+        valid = job_ids >= 0
+        if len(exclude):
+            valid &= ~np.isin(job_ids, list(exclude))
+        job_ids, scores = job_ids[valid], scores[valid]
+        best = np.argpartition(-scores, k)[:k] if len(scores) > k else np.arange(len(scores))
+        best = best[np.argsort(-scores[best], kind='stable')]
+        return [SemanticMatch(int(job_ids[i]), float(scores[i])) for i in best]
+
+    def search(self, text: str, k: int = 10, nprobe: int = 16, exclude=()):
+        """
+        This function returns the k jobs closest to a text, such as a résumé, as SemanticMatch, best first.
+        """
+        return self.search_vector(self.embedder.embed([text])[0], k, nprobe, exclude)
+
+    def similar_jobs(self, job_id: int, k: int = 10, nprobe: int = 16):
+        """
+        This function returns the k jobs most like the given one as SemanticMatch, best first, or [] if it isn't in the index.
+        """
+        vector = self.vector(job_id)
+        return [] if vector is None else self.search_vector(vector, k, nprobe, exclude=[job_id])
+
+
+def _nearest(vectors, centroids, chunk_size: int = 16384):
+    """
+    Returns the index of the closest centroid to each vector.
+    """
+    return np.concatenate([np.argmax(vectors[start:start + chunk_size] @ centroids.T, axis=1)
+                           for start in range(0, len(vectors), chunk_size)] or [np.zeros(0, dtype=np.int64)]).astype(np.int32)
+
+
+def _kmeans(vectors, clusters: int, iterations: int, rng):
+    """
+    Returns unit length centroids of clusters of the vectors, found by spherical k-means.
+    """
+    centroids = vectors[rng.choice(len(vectors), clusters, replace=False)]
+    for _ in range(iterations):
+        assignment = _nearest(vectors, centroids)
+        members = sparse.csr_matrix((np.ones(len(vectors), dtype=np.float32), (assignment, np.arange(len(vectors)))),
+                                    shape=(clusters, len(vectors)))
+        sums = np.asarray(members @ vectors)
+        empty = np.flatnonzero(np.bincount(assignment, minlength=clusters) == 0)
+        sums[empty] = vectors[rng.choice(len(vectors), len(empty), replace=False)]  # Restart empty clusters from random vectors
+        centroids = normalise(sums)
+    return centroids
+
+
+def job_embedding_text(job_title: str, job_description: str):
+    """
+    This function returns the text of a job that is embedded.
+    """
+    return '\n'.join(part for part in (job_title, job_description) if part)
+
+
+def resume_embedding_text(profile):
+    """
+    This function returns the text of a db.Profile that is embedded: its résumé text and skills.
+    """
+    return '\n'.join([profile_text(profile)] + list(profile.skills))
+
+
+def sync_jobs(index: SemanticIndex, batch_size: int = 1000):
+    """
+    This function embeds the jobs of the jobs table added since the last sync that aren't in the index yet, and returns
+    how many it added. Its place in the table is kept in the index, apart from the jobs the app adds as they're saved.
+    """
+    last_job_id = index.synced_job_id
+    added = 0
+    while True:
+        job_ids = [row[0] for row in fetch_all('SELECT job_id FROM jobs WHERE job_id > %s ORDER BY job_id LIMIT %s',
+                                               (last_job_id, batch_size))]
+        if not job_ids:
+            return added
+        missing = index.missing(job_ids)
+        if missing:
+            rows = fetch_all('SELECT job_id, job_title, job_description FROM jobs WHERE job_id = ANY(%s) ORDER BY job_id', (missing,))
+            index.add([row[0] for row in rows], [job_embedding_text(row[1], row[2]) for row in rows])
+            added += len(rows)
+        last_job_id = job_ids[-1]
+        index.mark_synced(last_job_id)
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description='Keep and query the semantic index of the jobs table.')
+    parser.add_argument('--index', default=os.getenv('SEMANTIC_INDEX_PATH', SEMANTIC_INDEX_PATH), help='path the index files are named after')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('sync', help='embed the jobs added since the last sync')
+    build_parser = commands.add_parser('build', help='re-cluster the index')
+    build_parser.add_argument('--lists', type=int, help='number of clusters, about sqrt(jobs) by default')
+    similar_parser = commands.add_parser('similar', help='jobs like a job')
+    similar_parser.add_argument('job_id', type=int)
+    resume_parser = commands.add_parser('resume', help="jobs that fit a user's résumé")
+    resume_parser.add_argument('user_id', type=int)
+    args = parser.parse_args()
+
+    index = SemanticIndex(args.index, make_embedder())
+    if args.command == 'sync':
+        print(f"Added {sync_jobs(index)} jobs, the index holds {len(index)}")
+    elif args.command == 'build':
+        index.build(args.lists)
+        print(f"Clustered {len(index)} jobs into {index.list_count} lists")
+    else:
+        if args.command == 'similar':
+            matches = index.similar_jobs(args.job_id)
+        else:
+            profile = load_profile(args.user_id)
+            matches = index.search(resume_embedding_text(profile))
+        titles = dict((row[0], row[1:]) for row in fetch_all('SELECT job_id, job_title, company_name FROM jobs WHERE job_id = ANY(%s)',
+                                                               ([match.job_id for match in matches],)))
+        for match in matches:
+            job_title, company_name = titles.get(match.job_id, ('?', '?'))
+            print(f"{match.score:.3f}  {match.job_id:>8}  {job_title} at {company_name}")
+
+
+if __name__ == '__main__':
+    main()
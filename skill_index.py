@@ -0,0 +1,302 @@
+"""
+Builds the dictionary of skills used for skill suggestions, for normalising the skills users enter and for finding the
+skills a job asks for.
+
+    $ python skill_index.py scraped_jobs.jsonl                            # Written by pipeline.py
+    $ python skill_index.py scraped_jobs*.jsonl --from-db --min-count 5   # Also learns skills users have entered
+
+The skills are the phrases job posts list, e.g. "Python, SQL and Tableau", that enough posts list. SKILL_SYNONYMS only
+decides what a skill is called, so "PowerBI" and "Microsoft Power BI" are both counted as Power BI. Every skill has a
+canonical name, the other ways it's written and the number of scraped jobs that mention it. Skills are numbered from the
+most to the least mentioned, so a skill's ID also orders suggestions.
+"""
+import argparse
+import bisect
+import json
+import os
+import re
+from collections import Counter
+from typing import NamedTuple
+
+import numpy as np
+from dotenv import load_dotenv
+
+from db import fetch_all
+from jsonl_sink import read_jsonl
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9+#\x80-\U0010ffff]+(?:\.[a-z0-9\x80-\U0010ffff][a-z0-9+#\x80-\U0010ffff]*)*")  # Keeps c++, c#, node.js and 3.5 whole
+_ANY_CASE_TOKEN_PATTERN = re.compile(TOKEN_PATTERN.pattern, re.IGNORECASE)
+
+SKILL_INDEX_PATH = 'skill_index.json'
+
+# Canonical name -> other ways job posts write it. Any skill can be written in any case or with different punctuation.
+SKILL_SYNONYMS = {
+    'Python': ('python3',), 'SQL': ('t-sql', 'tsql', 'pl/sql'), 'Excel': ('microsoft excel', 'ms excel', 'advanced excel'),
+    'Power BI': ('powerbi', 'microsoft power bi'), 'Tableau': (), 'Java': (), 'JavaScript': ('js', 'ecmascript'),
+    'TypeScript': (), 'C++': ('cpp',), 'C#': ('csharp', 'c sharp'), 'Golang': ('go lang',), 'Rust': (), 'HTML': ('html5',),
+    'CSS': ('css3',), 'React': ('react.js', 'reactjs'), 'Node.js': ('nodejs', 'node js'), 'Django': (), 'Flask': (),
+    'AWS': ('amazon web services',), 'Azure': ('microsoft azure',), 'GCP': ('google cloud', 'google cloud platform'),
+    'Docker': (), 'Kubernetes': ('k8s',), 'Terraform': (), 'Linux': (), 'Git': ('github', 'gitlab'), 'CI/CD': ('continuous integration',),
+    'REST APIs': ('rest api', 'restful apis', 'restful api'), 'Spark': ('apache spark', 'pyspark'), 'Hadoop': (),
+    'Airflow': ('apache airflow',), 'Snowflake': (), 'PostgreSQL': ('postgres',), 'MySQL': (), 'MongoDB': ('mongo',),
+    'Machine learning': ('ml',), 'Deep learning': (), 'Statistics': ('statistical analysis',),
+    'Data analysis': ('data analytics',), 'Data visualisation': ('data visualization',), 'ETL': (), 'Pandas': (),
+    'NumPy': (), 'TensorFlow': (), 'PyTorch': (), 'Agile': (), 'Scrum': (), 'Jira': (), 'Microsoft Office': ('ms office',),
+    'PowerPoint': (), 'Project management': (), 'Stakeholder management': (), 'Communication': ('communication skills',),
+    'Leadership': (), 'Teamwork': ('team work', 'team player'), 'Problem solving': (), 'Time management': (),
+    'Customer service': ('customer care',), 'Sales': (), 'Marketing': (), 'SEO': ('search engine optimisation', 'search engine optimization'),
+    'Copywriting': (), 'Budgeting': (), 'Forecasting': (), 'Accounting': (), 'Bookkeeping': (), 'Payroll': (),
+    'SAP': (), 'Salesforce': (), 'Recruitment': ('recruiting',), 'Photoshop': ('adobe photoshop',), 'Figma': (),
+    'UX design': ('user experience design',), 'Cyber security': ('cybersecurity', 'information security'),
+    'Safeguarding': (), 'First aid': (), 'Driving licence': ('driving license', 'full uk driving licence'),
+    'Forklift': ('flt',), 'Health and safety': ('health & safety',),
+}
+
+
+# Aliases this short and made only of letters are also ordinary words or abbreviations ('ml' is also millilitres), so
+# they're only read as the skill in a job post when written in capitals
+SHORT_ALIAS_LENGTH = 3
+
+# Words trimmed off the ends of a listed phrase, so "experience with SQL" and "strong Excel skills" list SQL and Excel
+LIST_FILLER_WORDS = frozenset('''
+a an and or the of in on for to with as at by from into is are be will you your our we us this that these it its
+etc e.g i.e eg ie such like including include includes plus other similar related relevant
+experience experienced knowledge proficiency proficient skills skill understanding ability familiarity
+strong good excellent solid sound proven advanced basic working hands-on demonstrable
+'''.split())
+
+_ITEM_SEPARATOR_PATTERN = re.compile(r"[,()]|\band\b|\bor\b", re.IGNORECASE)
+_SEGMENT_SEPARATOR_PATTERN = re.compile(r"[\n\r;:•·|]+|\.\s")
+
+def skill_key(skill: str):
+    """
+    This function returns the normalised form of a skill that its spellings are compared by: lower-case words separated by single spaces.
+    """
+    return ' '.join(TOKEN_PATTERN.findall((skill or '').lower()))
+
+
+class Skill(NamedTuple):
+    name: str  # Canonical name shown to users
+    frequency: int  # Number of scraped jobs that mention the skill
+    aliases: tuple  # Other ways of writing the skill
+
+
+class SkillIndex:
+    """
+    Dictionary of skills with an integer ID each, numbered from the most to the least mentioned in job posts.
+
+    Exact lookups go through a dict of every spelling's skill_key. Autocomplete searches a sorted array of the spellings
+    and every word they contain onwards, so "learn" finds "Machine learning" with two binary searches.
+    """
+
+    def __init__(self, skills, documents: int = 0):
+        self.skills = sorted(skills, key=lambda skill: (-skill.frequency, skill_key(skill.name)))
+        self.names = [skill.name for skill in self.skills]
+        self.frequencies = np.array([skill.frequency for skill in self.skills], dtype=np.int64)
+        self.documents = documents  # Number of job posts the frequencies were counted over
+        self._ids = {}  # skill_key of every spelling -> skill ID
+        for skill_id, skill in enumerate(self.skills):
+            for spelling in (skill.name,) + tuple(skill.aliases):
+                key = skill_key(spelling)
+                if key:
+                    self._ids.setdefault(key, skill_id)
+        names = {skill_key(skill.name) for skill in self.skills}
+        self._short_aliases = {key for key in self._ids if len(key) <= SHORT_ALIAS_LENGTH and key.isalpha() and key not in names}
+        self._max_words = max((len(key.split()) for key in self._ids), default=1)
+        prefixes = sorted({(' '.join(words[start:]), skill_id) for key, skill_id in self._ids.items()
+                           for words in [key.split()] for start in range(len(words))})
+        self._prefix_keys = [prefix for prefix, _ in prefixes]
+        self._prefix_ids = np.array([skill_id for _, skill_id in prefixes], dtype=np.int32)
+
+    def __len__(self):
+        return len(self.skills)
+
+    def skill_id(self, skill: str):
+        """
+        This function returns the ID of a skill from any of its spellings, or None if it isn't in the index.
+        """
+        return self._ids.get(skill_key(skill))
+
+    def spellings(self):
+        """
+        This function returns (skill_key, skill ID) for every spelling of every skill.
+        """
+        return list(self._ids.items())
+
+    def canonical(self, skill: str):
+        """
+        This function returns the canonical name of a skill, or the skill with its whitespace tidied if it isn't in the index.
+        """
+        skill_id = self.skill_id(skill)
+        return self.names[skill_id] if skill_id is not None else ' '.join(skill.split())
+
+    def canonical_skills(self, skills):
+        """
+        This function returns the canonical names of a list of skills in the same order, dropping blanks and repeats.
+        """
+        names, seen = [], set()
+        for skill in skills:
+            name = self.canonical(skill)
+            if name and skill_key(name) not in seen:
+                seen.add(skill_key(name))
+                names.append(name)
+        return names
+
+    def ids(self, skills):
+        """
+        This function returns the sorted IDs of the skills that are in the index.
+        """
+        return np.unique(np.array([skill_id for skill_id in map(self.skill_id, skills) if skill_id is not None], dtype=np.int32))
+
+    def suggest(self, prefix: str, limit: int = 10):
+        """
+        This function returns the names of up to limit skills with a word starting with prefix, most mentioned first.
+        """
+        key = skill_key(prefix)
+        if not key:
+            return self.names[:limit]
+        start = bisect.bisect_left(self._prefix_keys, key)
+        end = bisect.bisect_left(self._prefix_keys, key + '\U0010ffff', start)
+        return [self.names[skill_id] for skill_id in np.unique(self._prefix_ids[start:end])[:limit]]
+
+    def find_ids(self, text: str, spellings: list = None):
+        """
+        This function returns the sorted IDs of the skills mentioned in a text, preferring the longest spelling at each
+        word (so "machine learning" isn't also read as "learning"). Short aliases only count when written in capitals,
+        see SHORT_ALIAS_LENGTH. When spellings is given, the text's own spelling of each mention is counted in
+        spellings[skill ID].
+        """
+        words = _ANY_CASE_TOKEN_PATTERN.findall(text or '')
+        keys = [word.lower() for word in words]
+        found = set()
+        position = 0
+        while position < len(keys):
+            for length in range(min(self._max_words, len(keys) - position), 0, -1):
+                key = ' '.join(keys[position:position + length])
+                skill_id = self._ids.get(key)
+                if key in self._short_aliases and not words[position].isupper():
+                    skill_id = None
+                if skill_id is not None:
+                    found.add(skill_id)
+                    if spellings is not None:
+                        spellings[skill_id][' '.join(words[position:position + length])] += 1
+                    position += length
+                    break
+            else:
+                position += 1
+        return np.array(sorted(found), dtype=np.int32)
+
+    def save(self, path: str):
+        """
+        This function writes the index to a JSON file.
+        """
+        with open(path, 'w', encoding='utf-8') as outfile:
+            json.dump({'documents': self.documents, 'skills': [skill._asdict() for skill in self.skills]}, outfile, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path: str):
+        """
+        This function reads an index written by save().
+        """
+        with open(path, encoding='utf-8') as infile:
+            data = json.load(infile)
+        return cls([Skill(skill['name'], skill['frequency'], tuple(skill['aliases'])) for skill in data['skills']], data['documents'])
+
+
+def load_skill_index(path: str = SKILL_INDEX_PATH):
+    """
+    This function loads the skill index built by this script, or the built-in SKILL_SYNONYMS without frequencies
+    when it hasn't been built yet.
+    """
+    if path and os.path.exists(path):
+        return SkillIndex.load(path)
+    return SkillIndex([Skill(name, 0, aliases) for name, aliases in SKILL_SYNONYMS.items()])
+
+
+def listed_phrases(text: str, max_words: int = 3):
+    """
+    This function returns every short phrase a text lists with at least two others, e.g. "Python, SQL and Tableau".
+    The sentence around the list is cut off at the filler words next to it ("We need experience with Python" lists
+    Python), and an item in the middle of the list with filler words in it isn't a phrase.
+    """
+    phrases = []
+    for segment in _SEGMENT_SEPARATOR_PATTERN.split(text or ''):
+        items = []
+        for item in _ITEM_SEPARATOR_PATTERN.split(segment):
+            runs = [[]]  # Runs of words between filler words
+            for word in _ANY_CASE_TOKEN_PATTERN.findall(item):
+                if word.lower() not in LIST_FILLER_WORDS:
+                    runs[-1].append(word)
+                elif runs[-1]:
+                    runs.append([])
+            runs = [run for run in runs if run]
+            if runs:
+                items.append(runs)
+        if len(items) < 3:
+            continue
+        items[0], items[-1] = items[0][-1:], items[-1][:1]
+        phrases += [' '.join(runs[0]) for runs in items
+                    if len(runs) == 1 and len(runs[0]) <= max_words and any(word.isalpha() for word in runs[0])]
+    return phrases
+
+
+def build_skill_index(job_descriptions, synonyms: dict = SKILL_SYNONYMS, extra_skills=(), min_count: int = 1,
+                      min_documents: int = 5):
+    """
+    This function returns the SkillIndex of the skills job descriptions ask for: every phrase (see listed_phrases)
+    that at least min_documents descriptions list, and the extra_skills (such as the skills users have entered)
+    that at least min_count descriptions mention. A phrase that is a spelling of a skill in synonyms is counted as
+    that skill, under its canonical name, so "T-SQL" and "SQL" are listed by two descriptions between them; other
+    skills are named after their most common spelling in the descriptions.
+    """
+    descriptions = list(job_descriptions)  # Read twice: once for the phrases they list, then to count every mention
+    canonical = SkillIndex([Skill(name, 0, tuple(aliases)) for name, aliases in synonyms.items()])
+    listed = Counter()
+    for description in descriptions:
+        listed.update({skill_key(canonical.canonical(phrase)) for phrase in listed_phrases(description)})
+
+    candidates = {}  # skill_key of the canonical name -> Skill
+    for spelling in [key for key, documents in listed.items() if documents >= min_documents] + list(extra_skills):
+        skill_id = canonical.skill_id(spelling)
+        skill = canonical.skills[skill_id] if skill_id is not None else Skill(spelling, 0, ())
+        if skill_key(skill.name):
+            candidates.setdefault(skill_key(skill.name), skill)
+
+    index = SkillIndex(candidates.values())
+    frequencies = np.zeros(len(index), dtype=np.int64)
+    spellings = [Counter() for _ in range(len(index))]
+    for description in descriptions:
+        frequencies[index.find_ids(description, spellings)] += 1
+
+    skills = []
+    for skill_id, skill in enumerate(index.skills):
+        if frequencies[skill_id] < min_count:
+            continue
+        if skill.name in synonyms:
+            skills.append(Skill(skill.name, int(frequencies[skill_id]), skill.aliases))
+        else:
+            skills.append(Skill(spellings[skill_id].most_common(1)[0][0], int(frequencies[skill_id]), ()))
+    return SkillIndex(skills, len(descriptions))
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description='Build the skill index from JSON lines files of scraped jobs.')
+    parser.add_argument('inputs', nargs='+', help='JSON lines files written by pipeline.py')
+    parser.add_argument('--output', default=SKILL_INDEX_PATH, help='where to write the index')
+    parser.add_argument('--from-db', action='store_true', help="also add the skills users have saved when jobs mention them")
+    parser.add_argument('--min-count', type=int, default=3, help='number of jobs that must mention a user-entered skill')
+    parser.add_argument('--min-documents', type=int, default=5, help='number of jobs that must list a phrase for it to be a skill')
+    args = parser.parse_args()
+
+    extra_skills = [row[0] for row in fetch_all('SELECT DISTINCT unnest(skill) FROM skills')] if args.from_db else ()
+    descriptions = (job_dic.get('job_description') or '' for path in args.inputs for job_dic in read_jsonl(path))
+    index = build_skill_index(descriptions, extra_skills=extra_skills, min_count=args.min_count, min_documents=args.min_documents)
+    index.save(args.output)
+    print(f"Wrote {len(index)} skills counted over {index.documents} jobs to {args.output}")
+    for name, frequency in list(zip(index.names, index.frequencies))[:20]:
+        print(f"{frequency:8} {name}")
+
+
+if __name__ == '__main__':
+    main()
@@ -14,6 +14,17 @@ import atexit
 import textwrap
 from find_core_job_details import *
 from streamlit_functions import *
+from db import fetch_one, get_pool, jobs_by_id, load_profile, save_job, save_resume_section, saved_jobs_page, search_jobs, transaction
+from driver_pool import DriverPool
+from http_scraper import ChromeFallback, HttpScraper, new_http_session
+from jsonl_sink import JsonlSink
+from job_matching import JobMatcher, job_text, profile_text
+from job_cache import JobCache
+from llm_cache import CompletionCache
+from prefetch import JobPrefetcher
+from prompts import job_summary_prompt
+from semantic_search import SemanticIndex, job_embedding_text, make_embedder, resume_embedding_text
+from skill_index import load_skill_index
 from PIL import Image
 from streamlit_tags import st_tags
 from dotenv import load_dotenv
@@ -28,172 +39,227 @@ load_dotenv()
 # Get the current date
 current_date = datetime.date.today()
 
-# Retrieve the PostgreSQL environment variables
-DB_NAME = os.getenv('DB_NAME')
-DB_USER = os.getenv('DB_USER')
-DB_PASSWORD = os.getenv('DB_PASSWORD')
-DB_HOST = os.getenv('DB_HOST')
-DB_PORT = os.getenv('DB_PORT')
+# Retrieve the openai apikey, the PostgreSQL environment variables are read by db.py
 APIKEY = os.getenv('APIKEY')
 
-# Connect to PostgreSQL database
-conn = psycopg2.connect(
-    dbname=DB_NAME,
-    user=DB_USER,
-    password=DB_PASSWORD,
-    host=DB_HOST,
-    port=DB_PORT
-)
+# PostgreSQL is reached through db.py's thread-safe connection pool, shared by every session
+get_pool()
 
 # Object for using openai 
 client = openai.OpenAI(api_key = APIKEY)
 
 
-# Setup Chrome options to disable popups and redirections
-chrome_options = Options()
-chrome_options.add_argument("--disable-popup-blocking")
-chrome_options.add_argument("--disable-notifications")
-chrome_options.add_argument("--disable-extensions")
-chrome_options.add_argument("--disable-infobars")
-chrome_options.add_argument("--disable-web-security")
-chrome_options.add_argument("--disable-blink-features=AutomationControlled")
+# Shared pool of warm Chrome drivers, created once per server process and shared by every session. A search holds its
+# driver while the user reads through it, so a session left open gives its driver back after CHROME_LEASE_TIMEOUT
+# seconds without a click, and a search waits CHROME_CHECKOUT_TIMEOUT seconds for a driver before asking to try again.
+@st.cache_resource
+def get_driver_pool():
+    pool = DriverPool(max_size=int(os.getenv('CHROME_POOL_SIZE', '2')),
+                      lease_timeout=float(os.getenv('CHROME_LEASE_TIMEOUT', '300')),
+                      checkout_timeout=float(os.getenv('CHROME_CHECKOUT_TIMEOUT', '15')))
+    atexit.register(pool.close)
+    return pool
+
+driver_pool = get_driver_pool()
+
+# With SCRAPER_BACKEND=http searches are fetched over one pooled HTTP session shared by every session, and Chrome from
+# the driver pool is only used for pages Indeed won't serve over plain HTTP
+use_http_scraper = os.getenv('SCRAPER_BACKEND', 'chrome') == 'http'
+
+@st.cache_resource
+def get_http_scraper():
+    return HttpScraper(new_http_session(), fallback=ChromeFallback(driver_pool))
+
+http_scraper = get_http_scraper() if use_http_scraper else None
+
+# Every scraped job is appended to one JSON lines file shared by all sessions
+@st.cache_resource
+def get_jobs_sink():
+    sink = JsonlSink(os.getenv('SCRAPED_JOBS_PATH', 'scraped_jobs.jsonl'), max_bytes=100 * 1024 * 1024)
+    atexit.register(sink.close)
+    return sink
+
+jobs_sink = get_jobs_sink()
+
+# Jobs scraped in the last few hours by any session are served from this cache instead of the browser
+@st.cache_resource
+def get_job_cache():
+    cache = JobCache(os.getenv('JOB_CACHE_PATH', 'job_cache.sqlite3'), ttl=float(os.getenv('JOB_CACHE_TTL', 6 * 3600)))
+    atexit.register(cache.close)
+    return cache
+
+job_cache = get_job_cache()
+
+# Temperature 0 completions are reused across reruns and sessions instead of asking OpenAI again
+@st.cache_resource
+def get_completion_cache():
+    cache = CompletionCache(os.getenv('COMPLETION_CACHE_PATH', 'completion_cache.sqlite3'))
+    atexit.register(cache.close)
+    return cache
+
+completion_cache = get_completion_cache()
+
+# Skill names, spellings and how often jobs ask for them, built by skill_index.py from scraped job descriptions
+@st.cache_resource
+def get_skill_index():
+    return load_skill_index(os.getenv('SKILL_INDEX_PATH', 'skill_index.json'))
+
+skill_index = get_skill_index()
+
+# Vectors of the saved and imported jobs for "jobs like this one" searches, kept up to date by semantic_search.py sync
+@st.cache_resource
+def get_semantic_index():
+    return SemanticIndex(os.getenv('SEMANTIC_INDEX_PATH', 'semantic_index'), make_embedder())
+
+semantic_index = get_semantic_index()
 
 # Defining functions
 
-def get_completion(prompt: str, model="gpt-4o-mini", temperature=0):
+def get_completion(prompt: str, model="gpt-4o-mini", temperature=0, stream=False):
     """
-    return openAI's response to given prompt as a string
+    return openAI's response to given prompt as a string, served from the completion cache when the same prompt was asked before.
+    With stream=True a generator of text chunks is returned instead, see stream_completion
     """
+    if stream:
+        return stream_completion(prompt, model, temperature)
+    cached_completion = completion_cache.get(prompt, model, temperature)
+    if cached_completion is not None:
+        return cached_completion
     messages = [{"role": "user", "content": prompt}]
     response = client.chat.completions.create(
         model=model,
         messages=messages,
         temperature = temperature
     )
-    return response.choices[0].message.content
+    completion = response.choices[0].message.content
+    completion_cache.put(prompt, model, temperature, completion)
+    return completion
+
+def stream_completion(prompt: str, model="gpt-4o-mini", temperature=0):
+    """
+    yield openAI's response to given prompt a few tokens at a time as they arrive, or all at once if it is in the completion cache
+    """
+    cached_completion = completion_cache.get(prompt, model, temperature)
+    if cached_completion is not None:
+        yield cached_completion
+        return
+    messages = [{"role": "user", "content": prompt}]
+    response = client.chat.completions.create(
+        model=model,
+        messages=messages,
+        temperature = temperature,
+        stream = True
+    )
+    chunks = []
+    for chunk in response:
+        if chunk.choices and chunk.choices[0].delta.content:
+            chunks.append(chunk.choices[0].delta.content)
+            yield chunk.choices[0].delta.content
+    # Only a completed response is cached
+    completion_cache.put(prompt, model, temperature, ''.join(chunks))
+
+def write_stream_html(chunks, template: str = "<p style='color: white;'>{}</p>"):
+    """
+    Function renders streamed text into a placeholder as it arrives, keeping the app's styling, and returns the full text
+    """
+    placeholder = st.empty()
+    text = ''
+    for chunk in chunks:
+        text += chunk
+        placeholder.markdown(template.format(text), unsafe_allow_html=True)
+    return text
 
 
 def insert_user(username: str, password: str):
     """
-    insert new username and password into PostgreSQL database
+    insert new username and password into PostgreSQL database, returning the new user_id or None if the username is taken
     """
-    # Parameterized query to prevent SQL injection
+    # Parameterized query to prevent SQL injection. The unique user_name decides between two sign-ups racing for a name.
     sql_query = '''
     INSERT INTO users (user_name, user_password)
     VALUES (%s, %s)
+    ON CONFLICT (user_name) DO NOTHING
+    RETURNING user_id
     '''
-    cursor = conn.cursor()
-    cursor.execute(sql_query, (username, password))
-    conn.commit()  # Commit the transaction
-    st.success(f"Account created for {username}!")
-    cursor.close() # closes cursor object
+    result = fetch_one(sql_query, (username, password))
+    return result[0] if result else None
 
-def insert_work_exp_entry(user_id: int, work_experience: dict):
-    """
-    Function inserts inputted work experience information for user into database
+def load_resume_entries(user_id: int):
     """
-    user_id = st.session_state['user_id']
-    insert_query = """
-    INSERT INTO work_experiences(user_id, job_title, company, start_date, end_date, city, country, job_description)
-    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+    Function fills the résumé tabs with the user's saved entries, since saving a section replaces everything saved in it
     """
-    cursor = conn.cursor()
-    cursor.execute(insert_query, (user_id, work_experience['job_title'], work_experience['company'], work_experience['start_date'], work_experience['end_date'],work_experience['city'],
-                                  work_experience['country'],work_experience['job_description']))
-    conn.commit()
-    cursor.close()
+    profile = load_profile(user_id)
+    date_text = lambda date: date.isoformat() if date else ''
+    st.session_state.work_experiences = {
+        f"saved_{entry.work_experience_id}": {"job_title": entry.job_title, "company": entry.company, "start_date": date_text(entry.start_date),
+                                              "end_date": date_text(entry.end_date), "city": entry.city or '', "country": entry.country or '',
+                                              "job_description": entry.job_description or ''}
+        for entry in profile.work_experiences}
+    st.session_state.education_entries = {
+        f"saved_{entry.education_id}": {"university": entry.university, "degree": entry.degree,
+                                        "grad_year": str(entry.graduation_year) if entry.graduation_year is not None else '', "grade": entry.grade or ''}
+        for entry in profile.education}
+    st.session_state.projects = {
+        f"saved_{entry.project_id}": {"start_date": date_text(entry.start_date), "end_date": date_text(entry.end_date), "description": entry.description}
+        for entry in profile.projects}
+    st.session_state.certifications = {f"saved_{entry.certification_id}": {"title": entry.certificate} for entry in profile.certifications}
+    st.session_state.skills = list(profile.skills)
 
-def insert_education_entry(user_id: int, education: dict):
+def insert_skills_query(user_id: int, skills_list: list):
     """
-    Function inserts inputted education information for user into database
+    Function inserts users inputted skills into database, each under its canonical name from the skill index
     """
-    user_id = st.session_state['user_id']
+    # psycopg2 sends a Python list as a PostgreSQL array, quoting each skill
+    skills_array = skill_index.canonical_skills(skills_list)
     insert_query = """
-    INSERT INTO education(user_id, university, degree, graduation_year, grade)
-    VALUES (%s, %s, %s, %s, %s)
+    INSERT INTO skills(user_id, skill)
+    VALUES (%s, %s)
+    ON CONFLICT (user_id) DO UPDATE
+    SET skill = EXCLUDED.skill
     """
-    cursor = conn.cursor()
-    cursor.execute(insert_query, (user_id, education['university'], education['degree'], education['grad_year'], education['grade']))
-    conn.commit()
-    cursor.close()
+    with transaction() as cursor:
+        cursor.execute(insert_query,(user_id, skills_array))
 
-def insert_project_entry(user_id: int, project: dict):
+def save_job_query(user_id: int, job_dic: dict):
     """
-    Function inserts inputted project information for user into database
+    Saves current displayed job to database for user and adds it to the semantic index
     """
-    user_id = st.session_state['user_id']
-    insert_query = """
-    INSERT INTO projects(user_id, start_date, end_date, description)
-    VALUES (%s, %s, %s, %s)
-    """
-    cursor = conn.cursor()
-    cursor.execute(insert_query, (user_id, project['start_date'], project['end_date'], project['description']))
-    conn.commit()
-    cursor.close()
+    job = job_record(job_dic, st.session_state['job_desc_summary'])
+    job_id = save_job(user_id, job, current_date)
+    semantic_index.add([job_id], [job_embedding_text(job['job_title'], job['job_description'])])
 
-def insert_certification_entry(user_id: int, certification: dict):
-    """
-    Function inserts inputted certifications for user into database
+def summarise_job(job_dic: dict):
     """
-    user_id = st.session_state['user_id']
-    insert_query = """
-    INSERT INTO certifications(user_id, certificate)
-    VALUES (%s, %s)
+    Function returns the summary of a scraped job's description shown in the Job Details
     """
-    cursor = conn.cursor()
-    cursor.execute(insert_query, (user_id, certification['title']))
-    conn.commit()
-    cursor.close()
+    return get_completion(job_summary_prompt(job_dic['job_description']))
 
-def insert_skills_query(user_id: int, skills_list: list):
+def show_next_job(prefetcher: JobPrefetcher):
     """
-    Function inserts users inputted skills into database
+    Function displays the next job of the search from the prefetch queue. Returns False when the search has no jobs left
     """
-    # Convert the Python list to the PostgreSQL array format
-    skills_array = '{' + ','.join(f'"{skill}"' for skill in skills_list) + '}'
-    insert_query = """
-    INSERT INTO skills(user_id, skill)
-    VALUES (%s, %s)
-    ON CONFLICT (user_id) DO UPDATE
-    SET skill = EXCLUDED.skill
-    """
-    cursor = conn.cursor()
-    cursor.execute(insert_query,(user_id, skills_array))
-    conn.commit()
-    cursor.close()
+    prefetched = prefetcher.next()
+    if prefetched is None:
+        return False
+    show_prefetched_job(prefetched)
+    return True
 
-def save_job_query(user_id: int, job_dic: dict):
+def show_prefetched_job(prefetched):
     """
-    Saves current displayed job to database for user
+    Function displays a job taken from the prefetch queue
     """
-    insert_query_1 = """
-    INSERT INTO jobs(job_title, company_name, location, salary, employment_type, job_description, company_rating, link_to_application)
-    VALUES(%s, %s, %s, %s, %s, %s, %s, %s)
-    """
-    insert_query_2 = """
-    INSERT INTO users_jobs(user_id, saved_date)
-    VALUES(%s, %s)
-    """
-    cursor = conn.cursor()
-    cursor.execute(insert_query_1, (job_dic['job_title'], job_dic['company'], job_dic['location'], job_dic['salary'], job_dic['employment_type'],
-                                    st.session_state['job_desc_summary'], job_dic['company_rating'], job_dic['application_link']))
-    cursor.execute(insert_query_2, (user_id, current_date))
-    conn.commit()
-    cursor.close()
-
-def display_job_details():
+    st.session_state['job_dic'] = prefetched.job_dic
+    jobs_sink.write(prefetched.job_dic)
+    display_job_details(prefetched.summary)
+
+def display_job_details(job_desc_summary: str = None):
     """
-    Function to display the current web-scraped job from Indeed into Streamlit app
+    Function to display the current web-scraped job from Indeed into Streamlit app. The summary is written by OpenAI
+    while it's shown unless it was made ahead of time
     """
     job_dic = st.session_state['job_dic']
     job_description = job_dic['job_description']
-    job_description_prompt = f"""
-    In 200 words and In a single paragraph, summarise the job post, including all the important details such as company, position, pay, location, projects, skills and tools required. 
-    The job post is provided below, delimited by 3 backticks.
-    ```{job_description}```
-    """
-    job_desc_summary = get_completion(job_description_prompt)
-    st.session_state['job_desc_summary'] = job_desc_summary
+    job_description_prompt = job_summary_prompt(job_description)
 
     with st.expander("Job Details", expanded=True):
         # Job Title
@@ -218,89 +284,18 @@ def display_job_details():
 
         #Job description
         st.markdown("<h2 style='color: lightgrey; font-weight: bold; text-decoration: underline;'>Job Description</h2>", unsafe_allow_html=True)
-        st.markdown(f"<p style='color: white;'>{job_desc_summary}</p>", unsafe_allow_html=True)
+        if job_desc_summary is None:
+            # The summary is streamed in as OpenAI writes it, so the rest of the job shows straight away
+            job_desc_summary = write_stream_html(get_completion(job_description_prompt, stream=True))
+        else:
+            st.markdown(f"<p style='color: white;'>{job_desc_summary}</p>", unsafe_allow_html=True)
+        st.session_state['job_desc_summary'] = job_desc_summary
         #st.markdown(f"<p style='color: white;'>{job_dic['job_description']}</p>", unsafe_allow_html=True)
         
         # Application link
         st.markdown("<h2 style='color: lightgrey; font-weight: bold; text-decoration: underline;'>Apply Here</h2>", unsafe_allow_html=True)
         st.markdown(f"<a href='{job_dic['application_link']}' target='_blank' style='color: white;'>{job_dic['application_link']}</a>", unsafe_allow_html=True)
 
-def count_sql_entries(select_count_query: str):
-    """
-    Finds count of entries for user whether it be work experiences, education, etc based on query inputted into function
-    """
-    cursor = conn.cursor()
-    cursor.execute(select_count_query, (st.session_state['user_id'],))
-    result = cursor.fetchone()
-    cursor.close()
-    return result[0]
-
-def return_work_exp(n:int):
-    return_work_exp_query = """
-    SELECT * FROM work_experiences WHERE user_id = %s OFFSET %s LIMIT 1
-    """
-    cursor = conn.cursor()
-    cursor.execute(return_work_exp_query, (st.session_state['user_id'],n))
-    result = cursor.fetchone()
-    cursor.close()
-    return result
-
-def return_education(n:int):
-    return_education_query = """
-    SELECT * FROM education WHERE user_id = %s OFFSET %s LIMIT 1
-    """
-    cursor = conn.cursor()
-    cursor.execute(return_education_query, (st.session_state['user_id'],n))
-    result = cursor.fetchone()
-    cursor.close()
-    return result
-
-def return_projects(n:int):
-    return_projects_query = """
-    SELECT * FROM projects WHERE user_id = %s OFFSET %s LIMIT 1
-    """
-    cursor = conn.cursor()
-    cursor.execute(return_projects_query, (st.session_state['user_id'],n))
-    result = cursor.fetchone()
-    cursor.close()
-    return result
-
-def return_certifications(n:int):
-    return_certifications_query = """
-    SELECT * FROM certifications WHERE user_id = %s OFFSET %s LIMIT 1
-    """
-    cursor = conn.cursor()
-    cursor.execute(return_certifications_query, (st.session_state['user_id'],n))
-    result = cursor.fetchone()
-    cursor.close()
-    return result
-
-def return_skills():
-    return_skills_query = """
-    SELECT skill FROM skills WHERE user_id = %s
-    """
-    cursor = conn.cursor()
-    cursor.execute(return_skills_query, (st.session_state['user_id'],))
-    result = cursor.fetchone()
-    cursor.close()
-    return result[0]
-
-def return_saved_jobs():
-    """Return saved jobs for user_id from PostgreSQL
-    """
-    return_saved_jobs_query = """
-    select j.job_title, j.company_name, j.link_to_application  from jobs as j
-    join users_jobs as u on j.job_id = u.job_id
-    where u.user_id = %s;
-    """
-    cursor = conn.cursor()
-    cursor.execute(return_saved_jobs_query, (st.session_state['user_id'],))
-    results = cursor.fetchall()
-    cursor.close()
-    return results
-
-
-
 def write_center(pdf, text : str, y_pos : float):
   """Adds the title to the PDF at the specified position.
 
@@ -444,16 +439,10 @@ with tab1:
 
     # Button to create account and add user to PostgreSQL database
     if st.button("Create Account"):
-        cursor = conn.cursor()
-        select_user_count_query = """SELECT COUNT(user_name) from users 
-        WHERE user_name = %s """
-        cursor.execute(select_user_count_query, (username,))
-        result = cursor.fetchone()
-        num_of_users = result[0]
-        if num_of_users == 0:
-            insert_user(username, password)
+        if insert_user(username, password) is not None:
+            st.success(f"Account created for {username}!")
         else:
-            st.error("Account already exists")
+            st.error("That username is taken, please choose another one")
     
 
     # Login section
@@ -474,25 +463,26 @@ with tab1:
             SELECT user_id FROM users
             WHERE user_name = %s AND user_password = %s
             '''
-            cursor = conn.cursor()
-            cursor.execute(login_query, (username_login, password_login))
-            result = cursor.fetchone()
+            result = fetch_one(login_query, (username_login, password_login))
             
             if result:
                 # Store user_id in session state if login is successful
                 state["user_id"] = result[0]
+                load_resume_entries(result[0])
                 st.success(f"Welcome back, {username_login}!")
             else:
                 st.error("Invalid username or password.")
-            
-            cursor.close()
 
     with col2:
     
         if "user_id" in st.session_state:
             # Display the logout button if the user is logged in
             if st.button("Logout"):
-                # Clear the session state to log out the user
+                # Stop prefetching and hand the scraping driver back to the pool, then clear the session state to log out the user
+                if st.session_state.get('prefetcher'):
+                    st.session_state.pop('prefetcher').close()
+                if st.session_state.get('driver'):
+                    driver_pool.checkin(st.session_state['driver'])
                 for key in st.session_state.keys():
                     del st.session_state[key]
                 st.success("You have been logged out.")
@@ -560,8 +550,7 @@ with tab2:
             # Button to save all education entries to the database
             if st.button("Save Work Experiences to Database"):
                 user_id = st.session_state["user_id"]
-                for work_experience in st.session_state.work_experiences.values():
-                    insert_work_exp_entry(user_id, work_experience)
+                save_resume_section(user_id, 'work_experiences', st.session_state.work_experiences.values())  # One transaction, re-saving updates rather than duplicates
                 st.success("All work experiences have been saved to the database.")
 
     else:
@@ -611,8 +600,7 @@ with tab2:
             # Button to save all education entries to the database
             if st.button("Save Education Entries to Database"):
                 user_id = st.session_state["user_id"]
-                for education in st.session_state.education_entries.values():
-                    insert_education_entry(user_id, education)
+                save_resume_section(user_id, 'education', st.session_state.education_entries.values())
                 st.success("All education entries have been saved to the database.")
 
     else:
@@ -660,8 +648,7 @@ with tab2:
                  # Button to save all education entries to the database
             if st.button("Save Projects to Database"): ######
                 user_id = st.session_state["user_id"]
-                for project in st.session_state.projects.values():
-                    insert_project_entry(user_id, project)
+                save_resume_section(user_id, 'projects', st.session_state.projects.values())
                 st.success("All project entries have been saved to the database.")
 
     else:
@@ -695,8 +682,7 @@ with tab2:
 
             if st.button("Save Certifications to Database"):
                 user_id = st.session_state["user_id"]
-                for certification in st.session_state.certifications.values():
-                    insert_certification_entry(user_id, certification)
+                save_resume_section(user_id, 'certifications', st.session_state.certifications.values())
                 st.success("All certifications have been saved to the database.")
 
     else:
@@ -714,7 +700,7 @@ with tab2:
                 label='',
                 text='Add a skill...',
                 value=st.session_state.skills,
-                suggestions=[], 
+                suggestions=skill_index.names[:500],  # Most asked for skills first
                 maxtags=20,  # Limit to 20 skills
                 key='skills_input'
             )
@@ -731,6 +717,7 @@ with tab2:
             if st.button("Save Skills to Database"):
                 user_id = st.session_state["user_id"]
                 insert_skills_query(user_id,st.session_state.skills)
+                st.session_state.skills = skill_index.canonical_skills(st.session_state.skills)
                 st.success("Your skills have been saved to the database.")
     else:
         st.info("Please log in to add your skills.")
@@ -741,34 +728,59 @@ with tab3:
     location_search = st.text_input("Location", placeholder="Enter location")
 
     if st.button("Job Search"):
-        # Instantiate the driver
-        driver = uc.Chrome(options=chrome_options)
-
-        load_and_search(driver, job_title_search, location_search)
-        
-
-        # Find the job information
-        job_dic = save_job_information(driver)
-
-        # Save job_dic to session state so it can be accessed outside this block
-        st.session_state['job_dic'] = job_dic
-        st.session_state['driver'] = driver
-
-        with open("job_description.json", "w") as outfile: 
-            json.dump(job_dic, outfile)
-
-        display_job_details()
+        # Stop prefetching the previous search, then give its driver back before taking a warm one from the pool
+        if st.session_state.get('prefetcher'):
+            st.session_state.pop('prefetcher').close()
+        if st.session_state.get('driver'):
+            driver_pool.checkin(st.session_state.pop('driver'))
+
+        # Each session keeps its own position on the search results
+        crawl_cursor = CrawlCursor(job_title_search, location_search)
+        st.session_state['crawl_cursor'] = crawl_cursor
+
+        fetch_job = None
+        if use_http_scraper:
+            fetch_job = lambda: http_scraper.next_job_information(crawl_cursor, job_cache)
+        else:
+            try:
+                driver = driver_pool.checkout()
+            except TimeoutError:
+                st.error("Every browser is busy with other searches right now. Please click 'Job Search' again in a minute.")
+            else:
+                st.session_state['driver'] = driver
+                load_and_search(driver, job_title_search, location_search)
+                wait_for_results_page(driver)
+                fetch_job = lambda: next_job_information(driver, crawl_cursor, job_cache)
+
+        if fetch_job is not None:
+            # The next few jobs are scraped and summarised in the background while the user reads the current one.
+            # From here on only the prefetch thread uses the driver. It stops when the search is left idle, well before
+            # the pool could reclaim the driver from under it
+            prefetcher = JobPrefetcher(fetch_job, summarise_job, depth=int(os.getenv('PREFETCH_DEPTH', '3')),
+                                       idle_timeout=driver_pool.lease_timeout / 2)
+            st.session_state['prefetcher'] = prefetcher
+
+            if not show_next_job(prefetcher):
+                st.error("No jobs were found for this search.")
         
             
     if st.button("➡️ Next Job"):
         driver = st.session_state.get('driver')
-        if driver:
-            # Get the next job posting and save it to session state
-            next_job_posting(driver)  # Scrolls to the next job in the job listing
-            job_dic = save_job_information(driver)  # Fetch the new job details
-            st.session_state['job_dic'] = job_dic
-
-            display_job_details()
+        prefetcher = st.session_state.get('prefetcher')
+        if prefetcher and (use_http_scraper or (driver and driver_pool.touch(driver))):
+            # Usually already scraped and summarised, so it shows straight away. A prefetcher left idle carries on where it stopped
+            if not show_next_job(prefetcher):
+                st.info("There are no more jobs for this search.")
+        elif prefetcher:
+            # The search's driver was reclaimed by the pool after being left idle. The jobs it already scraped are
+            # still shown before the search expires
+            prefetched = prefetcher.next_ready()
+            if prefetched is not None:
+                show_prefetched_job(prefetched)
+            else:
+                st.session_state.pop('prefetcher').close()
+                st.session_state.pop('driver', None)
+                st.warning("This search expired after being left idle. Please click 'Job Search' to start it again.")
         else:
             st.error("Please start the job search first by clicking 'Job Search'.")
                     
@@ -795,47 +807,47 @@ with tab3:
         cv_data['mobile_number'] = st.session_state.mobile_number 
         cv_data['email'] = st.session_state.email
        
+        # Load the user's whole résumé in one query
+        profile = load_profile(st.session_state['user_id'])
+
         # Store all work experience user info in cv_data dictionary 
-        for i in range(count_sql_entries('SELECT COUNT(work_experience_id) FROM work_experiences WHERE user_id = %s')):
-            cv_data[f'work_experience_{i+1}_job_title'] = return_work_exp(i)[2]
-            cv_data[f'work_experience_{i+1}_company'] = return_work_exp(i)[3]
-            cv_data[f'work_experience_{i+1}_start_date'] = return_work_exp(i)[4]
-            cv_data[f'work_experience_{i+1}_end_date'] = return_work_exp(i)[5]
-            cv_data[f'work_experience_{i+1}_city'] = return_work_exp(i)[6]
-            cv_data[f'work_experience_{i+1}_country'] = return_work_exp(i)[7]
-            cv_data[f'work_experience_{i+1}_description'] = return_work_exp(i)[8]
+        for i, work_experience in enumerate(profile.work_experiences):
+            cv_data[f'work_experience_{i+1}_job_title'] = work_experience.job_title
+            cv_data[f'work_experience_{i+1}_company'] = work_experience.company
+            cv_data[f'work_experience_{i+1}_start_date'] = work_experience.start_date
+            cv_data[f'work_experience_{i+1}_end_date'] = work_experience.end_date
+            cv_data[f'work_experience_{i+1}_city'] = work_experience.city
+            cv_data[f'work_experience_{i+1}_country'] = work_experience.country
+            cv_data[f'work_experience_{i+1}_description'] = work_experience.job_description
 
         # Joining all work experiences descriptions into one string for tailored CV creation
-        for i in range(count_sql_entries('SELECT COUNT(work_experience_id) FROM work_experiences WHERE user_id = %s')):
-            cv_data['work_exp_description_joined'] = 'NEXT JOB: '.join(cv_data[f'work_experience_{i+1}_description'])
+        cv_data['work_exp_description_joined'] = ' NEXT JOB: '.join(work_experience.job_description for work_experience in profile.work_experiences)
         
         # Store all education user info in cv_data dictionary 
-        for i in range(count_sql_entries('SELECT COUNT(education_id) FROM education WHERE user_id = %s')):
-            cv_data[f'education_{i+1}_university'] = return_education(i)[2]
-            cv_data[f'education_{i+1}_degree'] = return_education(i)[3]
-            cv_data[f'education_{i+1}_grad_year'] = return_education(i)[4]
-            cv_data[f'education_{i+1}_grade'] = return_education(i)[5]
+        for i, education in enumerate(profile.education):
+            cv_data[f'education_{i+1}_university'] = education.university
+            cv_data[f'education_{i+1}_degree'] = education.degree
+            cv_data[f'education_{i+1}_grad_year'] = education.graduation_year
+            cv_data[f'education_{i+1}_grade'] = education.grade
 
         # Joining all education degree titles into one string for tailored CV creation
-        for i in range(count_sql_entries('SELECT COUNT(education_id) FROM education WHERE user_id = %s')):
-            cv_data['educations_degrees_joined'] = 'NEXT DEGREE: '.join(cv_data[f'education_{i+1}_degree'])
+        cv_data['educations_degrees_joined'] = ' NEXT DEGREE: '.join(education.degree for education in profile.education)
 
         # Store all project user info in cv_data dictionary 
-        for i in range(count_sql_entries('SELECT COUNT(project_id) FROM projects WHERE user_id = %s')):
-            cv_data[f'project_{i+1}_start_date'] = return_projects(i)[2]
-            cv_data[f'project_{i+1}_end_date'] = return_projects(i)[3]
-            cv_data[f'project_{i+1}_description'] = return_projects(i)[4]
+        for i, project in enumerate(profile.projects):
+            cv_data[f'project_{i+1}_start_date'] = project.start_date
+            cv_data[f'project_{i+1}_end_date'] = project.end_date
+            cv_data[f'project_{i+1}_description'] = project.description
 
         # Joining all project descriptions into one string for tailored CV creation
-        for i in range(count_sql_entries('SELECT COUNT(project_id) FROM projects WHERE user_id = %s')):
-            cv_data['projects_descriptions_joined'] = 'NEXT JOB: '.join(cv_data[f'project_{i+1}_description'])
+        cv_data['projects_descriptions_joined'] = ' NEXT JOB: '.join(project.description for project in profile.projects)
 
         # Store all certification user info in cv_data dictionary
-        for i in range(count_sql_entries('SELECT COUNT(certification_id) FROM certifications WHERE user_id = %s')):
-            cv_data[f'certification_{i+1}'] = return_certifications(i)[2]
+        for i, certification in enumerate(profile.certifications):
+            cv_data[f'certification_{i+1}'] = certification.certificate
 
         # Create one string containing all skills separated by commas and store in cv_data dictionary
-        cv_data['skills'] = ', '.join(return_skills())
+        cv_data['skills'] = ', '.join(profile.skills)
 
         # Store summarised job_description that user is applying for in cv_data dictionary
         cv_data['application_job_description']  =  st.session_state['job_desc_summary']
@@ -846,7 +858,9 @@ with tab3:
             {cv_data['application_job_description']}.
             {cv_data['full_name']}'s full set of skills and descriptions of their previous work experience roles are given following this delimited by three backticks respectively:
             ```{cv_data['skills']}``` , ```{cv_data['work_exp_description_joined']}```. ```{cv_data['educations_degrees_joined']}```, ```{cv_data['projects_descriptions_joined']}```"""
-        cv_data['profile'] = get_completion(cv_profile_prompt)
+        # Show the profile as it is written, the PDF needs the whole of it
+        st.markdown('<h4 style="color: white;">Your CV Profile:</h4>', unsafe_allow_html=True)
+        cv_data['profile'] = write_stream_html(get_completion(cv_profile_prompt, stream=True))
         
         # Create a new PDF document
         pdf = canvas.Canvas('prototype_cv.pdf')
@@ -897,7 +911,7 @@ with tab3:
         draw_divider(pdf, current_line)
         current_line += new_line
 
-        for i in range(count_sql_entries('SELECT COUNT(work_experience_id) FROM work_experiences WHERE user_id = %s')):
+        for i in range(len(profile.work_experiences)):
             pdf.setFont("Helvetica-Bold", 10) # change font
             # Display work experience job title and company
             pdf.drawString(margin_start, current_line, cv_data[f'work_experience_{i+1}_job_title'] + ", " + cv_data[f'work_experience_{i+1}_company'] + ", ")
@@ -906,8 +920,9 @@ with tab3:
 
             pdf.setFont("Helvetica-Oblique", 10) # change font
 
-            # Display start and end date of work experience on same line as preious in italic
-            pdf.drawString(start_pos, current_line, (cv_data[f'work_experience_{i+1}_start_date']).strftime("%Y-%m-%d") + " - " + (cv_data[f'work_experience_{i+1}_end_date']).strftime("%Y-%m-%d"))
+            # Display start and end date of work experience on same line as preious in italic, leaving out a start date that was left blank
+            start_date, end_date = cv_data[f'work_experience_{i+1}_start_date'], cv_data[f'work_experience_{i+1}_end_date']
+            pdf.drawString(start_pos, current_line, (start_date.strftime("%Y-%m-%d") + " - " if start_date else "") + (end_date.strftime("%Y-%m-%d") if end_date else "Present"))
             pdf.setFont("Helvetica", 10) # back to original font
             current_line += new_line_s
 
@@ -925,7 +940,7 @@ with tab3:
         pdf.drawString(margin_start, current_line, "EDUCATION")
         draw_divider(pdf, current_line)
 
-        for i in range(count_sql_entries('SELECT COUNT(education_id) FROM education WHERE user_id = %s')):
+        for i in range(len(profile.education)):
             current_line += new_line
             # Display university name
             pdf.drawString(margin_start, current_line, cv_data[f'education_{i+1}_university'] + ", ")
@@ -944,7 +959,7 @@ with tab3:
         draw_divider(pdf, current_line)
         current_line += new_line
 
-        for i in range(count_sql_entries('SELECT COUNT(project_id) FROM projects WHERE user_id = %s')):
+        for i in range(len(profile.projects)):
             # Configure and display each project description line by line
             wrapped_project_text = textwrap.wrap(cv_data[f'project_{i+1}_description'], width=int(max_width/4.75))
             for line in wrapped_project_text:
@@ -960,7 +975,7 @@ with tab3:
         draw_divider(pdf, current_line)
 
         # Display each certification
-        for i in range(count_sql_entries('SELECT COUNT(certification_id) FROM certifications WHERE user_id = %s')):
+        for i in range(len(profile.certifications)):
             current_line += new_line
             pdf.drawString(margin_start, current_line, cv_data[f'certification_{i+1}'])
 
@@ -982,24 +997,94 @@ with tab3:
         print('pdf ready')
 
 with tab4:
+    # Search saved and scraped jobs
+    st.markdown("<h2 style='color: white;'>Search Jobs</h2>", unsafe_allow_html=True)
+    search_text = st.text_input("Search", placeholder='e.g. "data analyst" python -senior', key="job_search_text")
+    location_search_input = st.text_input("Location", placeholder="Any location", key="job_search_location")
+    search_saved_only = st.checkbox("Only my saved jobs", key="job_search_saved_only")
+    search_params = (search_text, location_search_input, search_saved_only)
+    if st.session_state.get('job_search_params') != search_params:
+        # A new search starts from its first page
+        st.session_state['job_search_params'] = search_params
+        st.session_state['job_search_page'] = 0
+    if search_text.strip():
+        if search_saved_only and st.session_state.get('user_id') is None:
+            st.error("Log in to search your saved jobs.")
+        else:
+            search_page = st.session_state['job_search_page']
+            search_results, has_next_page = search_jobs(search_text, user_id=st.session_state.get('user_id') if search_saved_only else None,
+                                                        location=location_search_input, page=search_page)
+            if search_results:
+                st.dataframe(pd.DataFrame({'Job Title': [result.job_title for result in search_results],
+                                           'Company': [result.company_name for result in search_results],
+                                           'Location': [result.location for result in search_results],
+                                           'Salary': [result.salary for result in search_results],
+                                           'Match': [result.snippet for result in search_results],
+                                           'Job Link': [result.link_to_application for result in search_results]}))
+            else:
+                st.write("No jobs match your search.")
+            previous_column, page_column, next_column = st.columns(3)
+            if previous_column.button("Previous", disabled=search_page == 0, key="job_search_previous"):
+                st.session_state['job_search_page'] = search_page - 1
+                st.experimental_rerun()
+            page_column.write(f"Page {search_page + 1}")
+            if next_column.button("Next", disabled=not has_next_page, key="job_search_next"):
+                st.session_state['job_search_page'] = search_page + 1
+                st.experimental_rerun()
+
+    # Saved jobs, a page at a time
+    st.markdown("<h2 style='color: white;'>Saved Jobs</h2>", unsafe_allow_html=True)
     if st.button('Display Saved Jobs'):
-        # Initialise lists as empty
-        job_title_list = []
-        company_list = []
-        job_link_list = []
-        # Return list of saved jobs for user
-        for i in return_saved_jobs():
-            #append list with each job title, company and job_link
-            job_title_list.append(i[0])
-            company_list.append(i[1]) 
-            job_link_list.append(i[2])
-        saved_job_df=pd.DataFrame({
-            'Job Title': job_title_list,
-            'Company': company_list,
-            'Job Link': job_link_list
-            })
-        
-        st.dataframe(saved_job_df)
+        st.session_state['show_saved_jobs'] = True
+    if st.session_state.get('show_saved_jobs') and st.session_state.get('user_id') is None:
+        st.error("Log in to see your saved jobs.")
+    elif st.session_state.get('show_saved_jobs'):
+        saved_sort = st.selectbox("Sort by", ["Newest first", "Oldest first"], key="saved_jobs_sort")
+        saved_filter = st.text_input("Filter", placeholder="Job title or company", key="saved_jobs_filter")
+        saved_params = (saved_sort, saved_filter)
+        if st.session_state.get('saved_jobs_params') != saved_params:
+            # Cursors of the pages seen so far, so Previous can go back; a new sort or filter starts again
+            st.session_state['saved_jobs_params'] = saved_params
+            st.session_state['saved_jobs_cursors'] = [None]
+        saved_cursors = st.session_state['saved_jobs_cursors']
+        saved_jobs, next_cursor = saved_jobs_page(st.session_state['user_id'], after=saved_cursors[-1],
+                                                  newest_first=saved_sort == "Newest first", text=saved_filter)
+        if saved_jobs:
+            st.dataframe(pd.DataFrame([(job.job_title, job.company_name, job.location, job.saved_date, job.link_to_application)
+                                       for job in saved_jobs],
+                                      columns=['Job Title', 'Company', 'Location', 'Saved', 'Job Link']))
+        else:
+            st.write("No saved jobs.")
+        previous_column, page_column, next_column = st.columns(3)
+        if previous_column.button("Previous", disabled=len(saved_cursors) == 1, key="saved_jobs_previous"):
+            saved_cursors.pop()
+            st.experimental_rerun()
+        page_column.write(f"Page {len(saved_cursors)}")
+        if next_column.button("Next", disabled=next_cursor is None, key="saved_jobs_next"):
+            saved_cursors.append(next_cursor)
+            st.experimental_rerun()
+
+        # Jobs like one of this page's, or like the user's whole résumé, from the semantic index
+        similar_to = st.selectbox("Find jobs like", [None] + saved_jobs, key="similar_jobs_to",
+                                  format_func=lambda job: "Your résumé" if job is None else f"{job.job_title} at {job.company_name}")
+        if st.button("Find Similar Jobs"):
+            if similar_to is None:
+                matches = semantic_index.search(resume_embedding_text(load_profile(st.session_state['user_id'])))
+            else:
+                matches = semantic_index.similar_jobs(similar_to.job_id)
+            similar_jobs = jobs_by_id([match.job_id for match in matches])
+            if similar_jobs:
+                # Best fit with the résumé first, with the skills each job asks for that the user has and is missing
+                profile = load_profile(st.session_state['user_id'])
+                fits = JobMatcher(skill_index).fit([job_text(job._asdict()) for job in similar_jobs]).rank(profile_text(profile), profile.skills)
+                st.dataframe(pd.DataFrame([(similar_jobs[fit.index].job_title, similar_jobs[fit.index].company_name,
+                                            similar_jobs[fit.index].location, similar_jobs[fit.index].salary, f"{fit.score:.0%}",
+                                            ', '.join(fit.matched_skills), ', '.join(fit.missing_skills),
+                                            similar_jobs[fit.index].link_to_application)
+                                           for fit in fits],
+                                          columns=['Job Title', 'Company', 'Location', 'Salary', 'Fit', 'Your Skills', 'Missing Skills', 'Job Link']))
+            else:
+                st.write("No similar jobs found yet.")
             
         
     
@@ -1008,8 +1093,6 @@ with tab4:
 
 
 
-# Close PostgreSQL connection
-atexit.register(lambda: conn.close())
 
 
     
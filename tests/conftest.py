@@ -0,0 +1,235 @@
+"""
+Shared fixtures: the saved pages in benchmarks/fixtures replayed by a local HTTP server, and a stand-in for a Chrome
+driver that loads pages from it, so the scrapers run end to end without Indeed or a browser.
+"""
+import http.cookiejar
+import http.server
+import os
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from urllib.parse import parse_qs, urljoin, urlsplit
+
+import pytest
+import soupsieve
+from bs4 import BeautifulSoup
+from selenium.common.exceptions import WebDriverException
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+from benchmarks.bench_extraction import FIXTURES_DIR, load_fixtures, replay_routes, search_query  # noqa: E402
+from find_core_job_details import element_text  # noqa: E402
+
+SEARCH_PAGES = 2  # Results pages of every replayed search, 10 job cards each
+BOT_CHECK_PAGE = b'<html><head><title>Just a moment...</title></head><body><div id="challenge-platform"></div></body></html>'
+BROWSER_USER_AGENT = 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) HeadlessChrome/124.0.0.0 Safari/537.36'
+
+
+class PageServer:
+    """
+    The replay server of bench_extraction in a thread of the test process, with scripted responses.
+
+    /jobs?q=&start= serves a results page; with vjk= as well it's the same page with that job's post opened beside the
+    cards, as Indeed does when a card is clicked, so a browser can crawl it. /viewjob?jk= serves the job post on its own.
+    script(route, *responses) serves (status, headers) responses for a route before its page. With bot_check set,
+    clients without the passed_check cookie get Indeed's bot check page, and browsers get the page and the cookie.
+    Every request is recorded, along with the most that were in flight at once.
+    """
+
+    def __init__(self, routes: dict, delay: float = 0):
+        self.routes = routes
+        self.delay = delay
+        self.bot_check = False
+        self.requests = []  # (route, time it arrived, headers)
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._scripted = {}
+        self._lock = threading.Lock()
+        self._server = None
+
+    def script(self, route, *responses):
+        self._scripted.setdefault(route, []).extend(responses)
+
+    def requests_for(self, route):
+        return [request for request in self.requests if request[0] == route]
+
+    def __enter__(self):
+        self._server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def _respond(self, route, query, headers):
+        """
+        Returns the (status, headers, body) of a request.
+        """
+        with self._lock:
+            self.requests.append((route, time.monotonic(), headers))
+            scripted = self._scripted.get(route)
+            if scripted:
+                status, response_headers = scripted.pop(0)
+                return status, response_headers, f'HTTP {status}'.encode('utf-8')
+        if self.bot_check and 'passed_check=1' not in headers.get('Cookie', ''):
+            if 'HeadlessChrome' not in headers.get('User-Agent', ''):
+                return 200, {}, BOT_CHECK_PAGE
+            cookie = {'Set-Cookie': 'passed_check=1; Path=/'}
+        else:
+            cookie = {}
+        body = self.routes.get(route)
+        if body is None:
+            return 404, {}, b'Not found'
+        if route[0] == '/jobs' and query.get('vjk'):
+            job_post = self.routes.get(('/viewjob', query['vjk']))
+            if job_post is None:
+                return 404, {}, b'Not found'
+            post_body = BeautifulSoup(job_post, 'html.parser').body.decode_contents().encode('utf-8')
+            body = body.replace(b'</body>', b'<div id="jobsearch-ViewjobPaneWrapper">' + post_body + b'</div></body>')
+        return 200, cookie, body
+
+    def _handler(self):
+        page_server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                url = urlsplit(self.path)
+                query = {name: values[0] for name, values in parse_qs(url.query).items()}
+                key = (query.get('q', ''), int(query.get('start', 0))) if url.path == '/jobs' else query.get('jk')
+                with page_server._lock:
+                    page_server.in_flight += 1
+                    page_server.max_in_flight = max(page_server.max_in_flight, page_server.in_flight)
+                try:
+                    if page_server.delay:
+                        time.sleep(page_server.delay)
+                    status, headers, body = page_server._respond((url.path, key), query, dict(self.headers))
+                finally:
+                    with page_server._lock:
+                        page_server.in_flight -= 1
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+
+class HttpElement:
+    """
+    A Selenium WebElement of an HttpDriver page.
+    """
+
+    def __init__(self, driver, tag):
+        self._driver = driver
+        self._tag = tag
+
+    @property
+    def text(self):
+        return element_text(self._tag)
+
+    def get_attribute(self, name: str):
+        value = self._tag.get(name)
+        if name == 'href' and value is not None:
+            return urljoin(self._driver.current_url, value)  # Selenium returns the absolute URL
+        return ' '.join(value) if isinstance(value, list) else value
+
+    def click(self):
+        if self._tag.name == 'a' and self._tag.get('href'):
+            self._driver.get(self.get_attribute('href'))
+
+
+class HttpDriver:
+    """
+    Stands in for a Chrome driver: loads pages over HTTP, keeping their cookies, without running their scripts.
+    Clicking a link, or running a script that clicks one, follows it. CSS selectors only.
+    """
+
+    def __init__(self):
+        self._url = 'about:blank'
+        self.page_source = '<html><head></head><body></body></html>'
+        self.quit_called = False
+        self.healthy = True
+        self._cookies = http.cookiejar.CookieJar()
+        self._opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(self._cookies))
+        self._soup = BeautifulSoup(self.page_source, 'html.parser')
+
+    def _check(self):
+        if self.quit_called or not self.healthy:
+            raise WebDriverException('Chrome is not reachable')
+
+    @property
+    def current_url(self):
+        self._check()
+        return self._url
+
+    def get(self, url: str):
+        self._check()
+        if url == 'about:blank':
+            self._url, self.page_source = url, '<html><head></head><body></body></html>'
+        else:
+            request = urllib.request.Request(url, headers={'User-Agent': BROWSER_USER_AGENT})
+            try:
+                with self._opener.open(request, timeout=10) as response:
+                    self._url, self.page_source = response.geturl(), response.read().decode('utf-8')
+            except urllib.error.HTTPError as error:
+                self._url, self.page_source = url, error.read().decode('utf-8')
+        self._soup = BeautifulSoup(self.page_source, 'html.parser')
+
+    def find_elements(self, by: str, value: str):
+        self._check()
+        if by != 'css selector':
+            return []
+        return [HttpElement(self, tag) for tag in soupsieve.select(value, self._soup)]
+
+    def execute_script(self, script: str, *args):
+        self._check()
+        if 'navigator.userAgent' in script:
+            return BROWSER_USER_AGENT
+        if '.click()' in script:
+            args[0].click()
+        return None
+
+    def get_cookies(self):
+        return [{'name': cookie.name, 'value': cookie.value, 'domain': cookie.domain, 'path': cookie.path}
+                for cookie in self._cookies]
+
+    def quit(self):
+        self.quit_called = True
+
+
+@pytest.fixture(scope='session')
+def fixture_pages():
+    return load_fixtures(FIXTURES_DIR)
+
+
+@pytest.fixture
+def routes(fixture_pages):
+    return replay_routes(*fixture_pages, searches=2, pages=SEARCH_PAGES)
+
+
+@pytest.fixture
+def page_server(routes):
+    with PageServer(routes) as server:
+        yield server
+
+
+@pytest.fixture
+def query():
+    return search_query(0)
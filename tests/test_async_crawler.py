@@ -0,0 +1,125 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+import async_crawler
+from async_crawler import AsyncCrawler, crawl_jobs
+from benchmarks.bench_extraction import search_query
+from conftest import PageServer
+from find_core_job_details import parse_job_page
+from rate_limit import TokenBucket
+from selector_registry import SelectorRegistry, registry
+
+
+def crawl(crawler, queries, max_posts: int = 100):
+    async def collect():
+        return [job_dic async for job_dic in crawler.crawl(queries, max_posts)]
+    return asyncio.run(collect())
+
+
+def test_crawl_matches_the_saved_pages(page_server, routes):
+    crawler = AsyncCrawler(page_server.url, requests_per_second=1000)
+    jobs = crawl(crawler, [(search_query(0), ''), (search_query(1), '')])
+
+    job_keys = [key for path, key in routes if path == '/viewjob']
+    assert sorted(job_dic['job_key'] for job_dic in jobs) == sorted(job_keys)
+    for job_dic in jobs:
+        url = crawler.job_url(job_dic['job_key'])
+        assert job_dic == dict(parse_job_page(routes['/viewjob', job_dic['job_key']].decode('utf-8'), url),
+                               job_key=job_dic['job_key'])
+    assert crawler.pages == len(jobs) + 4
+    assert crawler.failures == 0
+
+
+def test_requests_to_a_host_are_capped(routes):
+    with PageServer(routes, delay=0.05) as server:
+        crawler = AsyncCrawler(server.url, concurrency=16, per_host_concurrency=3, requests_per_second=1000)
+        jobs = crawl(crawler, [(search_query(0), ''), (search_query(1), '')])
+    assert len(jobs) == 40
+    assert server.max_in_flight == 3
+
+
+def test_token_bucket_spreads_requests_to_its_rate():
+    async def take(bucket, count):
+        started = time.monotonic()
+        for _ in range(count):
+            await bucket.acquire()
+        return time.monotonic() - started
+
+    # The first capacity tokens are there at once, the other 20 come at 40 a second
+    seconds = asyncio.run(take(TokenBucket(40, capacity=5), 25))
+    assert 0.45 <= seconds < 0.75
+
+
+def test_requests_to_a_host_keep_to_its_rate(page_server, query):
+    crawler = AsyncCrawler(page_server.url, concurrency=8, per_host_concurrency=8, requests_per_second=20)
+    jobs = crawl(crawler, [(query, '')], max_posts=15)
+    arrivals = sorted(arrived for _, arrived, _ in page_server.requests)
+    assert len(jobs) == 15
+    # 8 requests may go at once, then the bucket refills at 20 a second
+    assert arrivals[-1] - arrivals[0] >= (len(arrivals) - 8) / 20 * 0.9
+
+
+def test_too_many_requests_is_retried_after_retry_after(page_server, routes, query):
+    route = ('/jobs', (query, 0))
+    page_server.script(route, (429, {'Retry-After': '0.5'}))
+    crawler = AsyncCrawler(page_server.url, requests_per_second=1000)
+
+    jobs = crawl(crawler, [(query, '')], max_posts=5)
+
+    first, second = [arrived for _, arrived, _ in page_server.requests_for(route)]
+    assert second - first >= 0.5
+    assert len(jobs) == 5
+    assert crawler.retries == 1
+    assert crawler.failures == 0
+
+
+def test_pages_are_given_up_on_after_max_retries(page_server, routes, query):
+    job_key = next(key for path, key in routes if path == '/viewjob' and key.endswith('s0p0'))
+    page_server.script(('/viewjob', job_key), *[(503, {'Retry-After': '0'})] * 3)
+    crawler = AsyncCrawler(page_server.url, requests_per_second=1000, max_retries=2)
+
+    jobs = crawl(crawler, [(query, '')], max_posts=10)
+
+    assert job_key not in {job_dic['job_key'] for job_dic in jobs}
+    assert len(jobs) == 9
+    assert crawler.failures == 1
+    assert len(page_server.requests_for(('/viewjob', job_key))) == 3
+
+
+def test_jobs_found_by_several_queries_are_scraped_once(routes):
+    # A second query whose results are the first query's
+    other_query = 'data analyst again'
+    for (path, key), body in list(routes.items()):
+        if path == '/jobs' and key[0] == search_query(0):
+            routes['/jobs', (other_query, key[1])] = body
+    with PageServer(routes) as server:
+        crawler = AsyncCrawler(server.url, requests_per_second=1000)
+        jobs = crawl(crawler, [(search_query(0), ''), (other_query, ''), (search_query(0), 'Liverpool')])
+    job_keys = [job_dic['job_key'] for job_dic in jobs]
+    assert len(job_keys) == len(set(job_keys)) == 20
+    assert all(len(server.requests_for(('/viewjob', job_key))) == 1 for job_key in job_keys)
+
+
+def test_crawl_jobs_can_be_left_early(page_server, query):
+    jobs = crawl_jobs([(query, '')], max_posts=100, base_url=page_server.url, requests_per_second=1000)
+    assert next(jobs)['job_key']
+    jobs.close()  # Cancels the requests still in flight and closes the loop
+    with pytest.raises(StopIteration):
+        next(jobs)
+
+
+def test_cards_without_a_job_key_are_skipped(page_server, routes, query, tmp_path, monkeypatch):
+    # Selectors that also match a card without data-jk, like an ad among the results
+    selectors = tmp_path / 'job_selectors.json'
+    with open(registry.path, encoding='utf-8') as infile:
+        selectors.write_text(json.dumps(dict(json.load(infile), job_card=['a.jcs-JobTitle'])))
+    monkeypatch.setattr(async_crawler, 'registry', SelectorRegistry(str(selectors)))
+    html = routes['/jobs', (query, 0)].decode('utf-8')
+    job_keys, has_next_page = async_crawler._parse_results_page(html)
+    with_ad = html.replace('<a class="jcs-JobTitle', '<a class="jcs-JobTitle" href="/ad">Ad</a><a class="jcs-JobTitle', 1)
+
+    assert async_crawler._parse_results_page(with_ad) == (job_keys, has_next_page)
+    assert len(job_keys) == 10
@@ -0,0 +1,185 @@
+import asyncio
+import http.server
+import json
+import re
+import threading
+import time
+
+import openai
+import pytest
+
+from async_llm_client import AsyncCompletionClient
+
+
+class StubOpenAI:
+    """
+    A local stand-in for the OpenAI chat completions endpoint, answering every prompt with 'Summary of ' and the prompt.
+
+    script(marker, *responses) serves (status, headers) error responses first to prompts containing marker. A prompt
+    containing 'sleep=<seconds>' is answered after that long. Every request is recorded, along with the most that were in
+    flight at once.
+    """
+
+    def __init__(self):
+        self.requests = []  # (prompt, time it arrived)
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._scripted = []
+        self._lock = threading.Lock()
+        self._server = None
+
+    def script(self, marker: str, *responses):
+        self._scripted.append((marker, list(responses)))
+
+    def requests_for(self, marker: str):
+        return [arrived for prompt, arrived in self.requests if marker in prompt]
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self._server.server_address[1]}/v1"
+
+    def __enter__(self):
+        self._server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _respond(self, prompt: str):
+        """
+        Returns the (status, headers, body) of a request.
+        """
+        with self._lock:
+            self.requests.append((prompt, time.monotonic()))
+            for marker, responses in self._scripted:
+                if marker in prompt and responses:
+                    status, headers = responses.pop(0)
+                    return status, headers, {'error': {'message': f'HTTP {status}', 'type': 'stub_error', 'code': None}}
+        delay = re.search(r'sleep=([\d.]+)', prompt)
+        if delay:
+            time.sleep(float(delay.group(1)))
+        return 200, {}, {'id': 'chatcmpl-stub', 'object': 'chat.completion', 'created': int(time.time()), 'model': 'gpt-4o-mini',
+                         'choices': [{'index': 0, 'finish_reason': 'stop',
+                                      'message': {'role': 'assistant', 'content': 'Summary of ' + prompt}}],
+                         'usage': {'prompt_tokens': 1, 'completion_tokens': 1, 'total_tokens': 2}}
+
+    def _handler(self):
+        stub = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                with stub._lock:
+                    stub.in_flight += 1
+                    stub.max_in_flight = max(stub.max_in_flight, stub.in_flight)
+                try:
+                    status, headers, body = stub._respond(request['messages'][0]['content'])
+                finally:
+                    with stub._lock:
+                        stub.in_flight -= 1
+                body = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+
+@pytest.fixture
+def stub():
+    with StubOpenAI() as server:
+        yield server
+
+
+def run(client, coroutine):
+    async def run_and_close():
+        try:
+            return await coroutine
+        finally:
+            await client.close()
+    return asyncio.run(run_and_close())
+
+
+def test_rate_limits_are_retried_after_retry_after(stub):
+    stub.script('busy', (429, {'Retry-After': '0.5'}))
+    client = AsyncCompletionClient('test-key', base_url=stub.base_url)
+
+    assert run(client, client.complete('busy prompt')) == 'Summary of busy prompt'
+    first, second = stub.requests_for('busy')
+    assert second - first >= 0.5
+
+
+def test_server_errors_are_retried_with_backoff(stub):
+    stub.script('flaky', (500, {}), (503, {}))
+    client = AsyncCompletionClient('test-key', base_url=stub.base_url, max_retries=2)
+
+    assert run(client, client.complete('flaky prompt')) == 'Summary of flaky prompt'
+    assert len(stub.requests_for('flaky')) == 3
+
+
+def test_errors_are_raised_once_the_retries_run_out(stub):
+    stub.script('down', *[(503, {'Retry-After': '0'})] * 3)
+    client = AsyncCompletionClient('test-key', base_url=stub.base_url, max_retries=2)
+
+    with pytest.raises(openai.InternalServerError):
+        run(client, client.complete('down prompt'))
+    assert len(stub.requests_for('down')) == 3
+
+
+def test_requests_in_flight_never_exceed_max_concurrency(stub):
+    client = AsyncCompletionClient('test-key', base_url=stub.base_url, max_concurrency=3, requests_per_minute=60_000)
+    prompts = [f'prompt {number} sleep=0.05' for number in range(20)]
+
+    assert run(client, client.complete_many(prompts)) == ['Summary of ' + prompt for prompt in prompts]
+    assert stub.max_in_flight == 3
+
+
+def test_requests_keep_to_requests_per_minute(stub):
+    # max_concurrency requests may go at once, then 20 a second
+    client = AsyncCompletionClient('test-key', base_url=stub.base_url, max_concurrency=2, requests_per_minute=1200)
+    run(client, client.complete_many([f'prompt {number}' for number in range(12)]))
+    arrivals = sorted(arrived for _, arrived in stub.requests)
+    assert arrivals[-1] - arrivals[0] >= (12 - 2) / 20 * 0.9
+
+
+def test_requests_keep_to_tokens_per_minute(stub):
+    # Each prompt is estimated at 302.25 tokens, so the bucket's 5 seconds of 1,200 tokens a second hold the first 19
+    # and the rest wait for their share of the refill
+    client = AsyncCompletionClient('test-key', base_url=stub.base_url, max_concurrency=32, requests_per_minute=60_000,
+                                   tokens_per_minute=72_000)
+    run(client, client.complete_many([f'prompt {number:02}' for number in range(24)]))
+    arrivals = sorted(arrived for _, arrived in stub.requests)
+    assert arrivals[-1] - arrivals[0] >= (24 * 302.25 - 6000) / 1200 * 0.8
+
+
+def test_complete_many_returns_the_results_in_order(stub):
+    # Later prompts are answered first
+    client = AsyncCompletionClient('test-key', base_url=stub.base_url, requests_per_minute=60_000)
+    prompts = [f'prompt {number} sleep={0.02 * (8 - number)}' for number in range(8)]
+    assert run(client, client.complete_many(prompts)) == ['Summary of ' + prompt for prompt in prompts]
+
+
+def test_a_request_that_cant_succeed_fails_only_its_own_item(stub):
+    stub.script('Broken posting', (400, {}))
+    client = AsyncCompletionClient('test-key', base_url=stub.base_url, requests_per_minute=60_000)
+    job_dics = [{'job_description': 'Data analyst posting'}, {'job_description': 'Broken posting'},
+                {'job_description': 'Engineer posting'}]
+
+    summaries = run(client, client.summarise_jobs(job_dics))
+
+    assert isinstance(summaries[1], openai.BadRequestError)
+    assert 'Data analyst posting' in summaries[0] and 'Engineer posting' in summaries[2]
+    assert len(stub.requests_for('Broken posting')) == 1  # Not retried
@@ -0,0 +1,123 @@
+import os
+import threading
+from urllib.parse import urlencode
+
+import pytest
+from bs4 import BeautifulSoup
+
+from conftest import HttpDriver, PageServer
+from driver_pool import DriverPool, new_chrome_driver
+from find_core_job_details import CrawlCursor, crawl_results, parse_job_page, wait_for_results_page
+from http_scraper import RESULTS_PER_PAGE
+from selector_registry import registry
+
+# Set RUN_CHROME_TESTS=1 to also crawl with a real headless Chrome
+DRIVER_FACTORIES = [pytest.param(HttpDriver, id='http'),
+                    pytest.param(new_chrome_driver, id='chrome', marks=pytest.mark.skipif(
+                        os.getenv('RUN_CHROME_TESTS') != '1', reason='needs Chrome, set RUN_CHROME_TESTS=1'))]
+
+
+def open_cards_beside_results(routes):
+    """
+    Points every job card at its results page with the job opened beside the cards, as Indeed's cards do, so a
+    crawl clicking through them stays on the results.
+    """
+    for (path, key), body in list(routes.items()):
+        if path != '/jobs':
+            continue
+        soup = BeautifulSoup(body, 'html.parser')
+        query, start = key
+        for card in registry.select(soup, 'job_card'):
+            card['href'] = '/jobs?' + urlencode({'q': query, 'l': '', 'start': start, 'vjk': card['data-jk']})
+        routes[path, key] = str(soup).encode('utf-8')
+    return routes
+
+
+@pytest.fixture
+def results_server(routes):
+    with PageServer(open_cards_beside_results(routes)) as server:
+        yield server
+
+
+def test_checkin_reuses_the_driver_and_parks_it(page_server):
+    created = []
+    pool = DriverPool(max_size=1, driver_factory=lambda: created.append(HttpDriver()) or created[-1])
+    driver = pool.checkout()
+    driver.get(page_server.url + '/jobs?q=x')
+    pool.checkin(driver)
+    assert driver.current_url == 'about:blank'
+    assert pool.checkout() is driver
+    assert len(created) == 1
+    assert pool.stats() == {'idle': 0, 'in_use': 1, 'max_size': 1}
+    pool.close()
+    assert driver.quit_called
+
+
+def test_checkout_waits_for_a_free_driver():
+    pool = DriverPool(max_size=1, driver_factory=HttpDriver)
+    driver = pool.checkout()
+    with pytest.raises(TimeoutError):
+        pool.checkout(timeout=0.1)
+    threading.Timer(0.1, pool.checkin, (driver,)).start()
+    assert pool.checkout(timeout=5) is driver
+    pool.close()
+
+
+def test_dead_drivers_are_replaced():
+    pool = DriverPool(max_size=1, driver_factory=HttpDriver)
+    driver = pool.checkout()
+    pool.checkin(driver)
+    driver.healthy = False
+    replacement = pool.checkout()
+    assert replacement is not driver
+    assert driver.quit_called
+    pool.close()
+
+
+def test_stale_leases_are_reclaimed():
+    pool = DriverPool(max_size=1, lease_timeout=0, driver_factory=HttpDriver)
+    driver = pool.checkout()
+    replacement = pool.checkout(timeout=1)  # The abandoned lease is reclaimed to make room
+    assert replacement is not driver
+    assert driver.quit_called
+    assert not pool.touch(driver)
+    pool.lease_timeout = 900
+    pool.checkin(driver)  # A reclaimed driver coming back doesn't free a second slot
+    with pytest.raises(TimeoutError):
+        pool.checkout(timeout=0.1)
+    pool.close()
+
+
+@pytest.mark.parametrize('driver_factory', DRIVER_FACTORIES)
+def test_crawl_results_follows_the_cards_and_pages(results_server, routes, query, driver_factory):
+    pool = DriverPool(max_size=1, driver_factory=driver_factory)
+    try:
+        with pool.driver() as driver:
+            driver.get(f"{results_server.url}/jobs?" + urlencode({'q': query, 'l': '', 'start': 0}))
+            assert wait_for_results_page(driver)
+            cursor = CrawlCursor(query, '')
+            jobs = list(crawl_results(driver, query, '', max_posts=100, cursor=cursor))
+    finally:
+        pool.close()
+
+    job_keys = [key for path, key in routes if path == '/viewjob' and key.endswith(('s0p0', 's0p1'))]
+    assert [job_dic['job_key'] for job_dic in jobs] == job_keys
+    assert cursor.page_number == 2
+    for job_dic in jobs:
+        expected = parse_job_page(routes['/viewjob', job_dic['job_key']].decode('utf-8'), '')
+        assert {field: job_dic[field] for field in expected if field != 'application_link'} == \
+               {field: value for field, value in expected.items() if field != 'application_link'}
+        assert job_dic['application_link'].startswith(('http://127.0.0.1', 'https://'))
+
+
+def test_crawl_results_stops_at_max_posts(results_server, query):
+    pool = DriverPool(max_size=1, driver_factory=HttpDriver)
+    with pool.driver() as driver:
+        driver.get(f"{results_server.url}/jobs?" + urlencode({'q': query, 'l': '', 'start': 0}))
+        cursor = CrawlCursor(query, '')
+        first = list(crawl_results(driver, query, '', max_posts=RESULTS_PER_PAGE + 3, cursor=cursor))
+        rest = list(crawl_results(driver, query, '', max_posts=100, cursor=cursor))
+    pool.close()
+    assert len(first) == RESULTS_PER_PAGE + 3
+    assert len(rest) == RESULTS_PER_PAGE - 3
+    assert not {job_dic['job_key'] for job_dic in first} & {job_dic['job_key'] for job_dic in rest}
@@ -0,0 +1,116 @@
+import pytest
+import requests
+
+from conftest import HttpDriver, PageServer
+from driver_pool import DriverPool
+from find_core_job_details import CrawlCursor, parse_job_page
+from http_scraper import RESULTS_PER_PAGE, ChromeFallback, HttpScraper, ScrapeBlocked, new_http_session
+
+
+def job_keys_of_search(routes, search_number: int = 0):
+    return [key for path, key in routes if path == '/viewjob' and key.endswith((f's{search_number}p0', f's{search_number}p1'))]
+
+
+def test_crawl_results_matches_the_saved_pages(page_server, routes, query):
+    scraper = HttpScraper(new_http_session(), base_url=page_server.url)
+    jobs = list(scraper.crawl_results(query, '', max_posts=100))
+
+    assert [job_dic['job_key'] for job_dic in jobs] == job_keys_of_search(routes)
+    for job_dic in jobs:
+        url = scraper.job_url(job_dic['job_key'])
+        assert job_dic == dict(parse_job_page(routes['/viewjob', job_dic['job_key']].decode('utf-8'), url),
+                               job_key=job_dic['job_key'])
+    assert scraper.http_pages == len(jobs) + 2  # Every post and both results pages
+    assert scraper.fallback_pages == 0
+
+
+def test_crawl_results_stops_at_max_posts_and_resumes(page_server, query):
+    scraper = HttpScraper(new_http_session(), base_url=page_server.url)
+    cursor = CrawlCursor(query, '')
+    first = list(scraper.crawl_results(query, '', max_posts=RESULTS_PER_PAGE + 3, cursor=cursor))
+    rest = list(scraper.crawl_results(query, '', max_posts=100, cursor=cursor))
+    assert len(first) == RESULTS_PER_PAGE + 3
+    assert len(rest) == RESULTS_PER_PAGE - 3
+    assert cursor.posts_scraped == 2 * RESULTS_PER_PAGE
+
+
+def test_errors_are_retried_honouring_retry_after(page_server, routes, query):
+    job_key = job_keys_of_search(routes)[0]
+    page_server.script(('/viewjob', job_key), (503, {'Retry-After': '0'}), (502, {}))
+    scraper = HttpScraper(new_http_session(retries=2, backoff=0), base_url=page_server.url)
+
+    job_dic = scraper.job_information(job_key)
+
+    assert job_dic['job_key'] == job_key
+    assert len(page_server.requests_for(('/viewjob', job_key))) == 3
+    assert scraper.http_pages == 1
+
+
+def test_errors_are_raised_once_the_retries_run_out(page_server, routes):
+    job_key = job_keys_of_search(routes)[0]
+    page_server.script(('/viewjob', job_key), *[(500, {})] * 3)
+    scraper = HttpScraper(new_http_session(retries=2, backoff=0), base_url=page_server.url)
+    with pytest.raises(requests.HTTPError):
+        scraper.job_information(job_key)
+    assert len(page_server.requests_for(('/viewjob', job_key))) == 3
+
+
+def test_blocked_pages_raise_without_a_fallback(page_server, query):
+    page_server.bot_check = True
+    scraper = HttpScraper(new_http_session(), base_url=page_server.url)
+    with pytest.raises(ScrapeBlocked):
+        next(scraper.crawl_results(query, '', max_posts=1))
+
+
+def test_blocked_pages_are_fetched_with_chrome_then_http_again(page_server, routes, query):
+    page_server.bot_check = True
+    pool = DriverPool(max_size=1, driver_factory=HttpDriver)
+    scraper = HttpScraper(new_http_session(), base_url=page_server.url, fallback=ChromeFallback(pool, timeout=1))
+
+    jobs = list(scraper.crawl_results(query, '', max_posts=100))
+    pool.close()
+
+    assert [job_dic['job_key'] for job_dic in jobs] == job_keys_of_search(routes)
+    assert scraper.fallback_pages == 1  # The bot check cookie Chrome got lets the session through
+    assert scraper.http_pages == len(jobs) + 1
+    assert 'HeadlessChrome' in scraper.session.headers['User-Agent']
+
+
+def test_too_many_requests_falls_back_after_the_retries(page_server, routes):
+    job_key = job_keys_of_search(routes)[0]
+    page_server.script(('/viewjob', job_key), *[(429, {'Retry-After': '0'})] * 2)
+    pool = DriverPool(max_size=1, driver_factory=HttpDriver)
+    scraper = HttpScraper(new_http_session(retries=1, backoff=0), base_url=page_server.url, fallback=ChromeFallback(pool, timeout=1))
+
+    job_dic = scraper.job_information(job_key)
+    pool.close()
+
+    assert job_dic['job_title'] == parse_job_page(routes['/viewjob', job_key].decode('utf-8'), '')['job_title']
+    assert scraper.fallback_pages == 1
+    assert len(page_server.requests_for(('/viewjob', job_key))) == 3  # Two over HTTP, then Chrome's
+
+
+def test_server_errors_fall_back_after_the_retries(page_server, routes):
+    job_key = job_keys_of_search(routes)[0]
+    page_server.script(('/viewjob', job_key), *[(503, {})] * 2)
+    pool = DriverPool(max_size=1, driver_factory=HttpDriver)
+    scraper = HttpScraper(new_http_session(retries=1, backoff=0), base_url=page_server.url, fallback=ChromeFallback(pool, timeout=1))
+
+    job_dic = scraper.job_information(job_key)
+    pool.close()
+
+    assert job_dic['job_title'] == parse_job_page(routes['/viewjob', job_key].decode('utf-8'), '')['job_title']
+    assert scraper.fallback_pages == 1
+
+
+def test_timeouts_fall_back(routes):
+    job_key = job_keys_of_search(routes)[0]
+    pool = DriverPool(max_size=1, driver_factory=HttpDriver)
+    with PageServer(routes, delay=0.5) as server:
+        scraper = HttpScraper(new_http_session(retries=0), base_url=server.url, timeout=0.1, fallback=ChromeFallback(pool, timeout=1))
+        job_dic = scraper.job_information(job_key)
+    pool.close()
+
+    assert job_dic['job_title'] == parse_job_page(routes['/viewjob', job_key].decode('utf-8'), '')['job_title']
+    assert scraper.fallback_pages == 1
+    assert scraper.http_pages == 0
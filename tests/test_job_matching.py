@@ -0,0 +1,24 @@
+from job_matching import JobMatcher, phrase_hashes, tokenise
+from skill_index import TOKEN_PATTERN, load_skill_index
+
+
+def test_texts_are_split_into_the_skill_index_words():
+    text = "Node.js, C++ and C# developer; 3.5 years. Café"
+    hashes, rows = tokenise([text, '', 'node.js'])
+    assert len(hashes) == len(TOKEN_PATTERN.findall(text.lower())) + 1
+    assert list(rows) == [0] * (len(hashes) - 1) + [2]
+    assert hashes[0] == hashes[-1]  # The same word hashes the same in every text
+    assert len(phrase_hashes('Node.js')) == 1
+
+
+def test_rank_orders_jobs_by_fit_and_reports_skills():
+    jobs = ['Data analyst using SQL, Excel and Tableau to build reports',
+            'Forklift driver for a warehouse, FLT licence needed',
+            'Python developer building REST APIs with Django and PostgreSQL']
+    matcher = JobMatcher(load_skill_index(None)).fit(jobs)
+
+    best, *_ = matcher.rank('Built Python services and REST APIs on Postgres', ['Python', 'Django'])
+
+    assert best.index == 2
+    assert best.matched_skills == ['Python', 'Django']
+    assert best.missing_skills == []  # REST APIs and PostgreSQL are already in the résumé
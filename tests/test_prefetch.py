@@ -0,0 +1,44 @@
+import time
+
+from prefetch import JobPrefetcher
+
+
+def jobs(count: int, calls: list):
+    job_dics = iter([{'job_key': f'job{number}'} for number in range(count)])
+
+    def fetch_job():
+        calls.append(time.monotonic())
+        return next(job_dics, None)
+    return fetch_job
+
+
+def wait_until(condition, timeout: float = 5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert condition()
+
+
+def test_next_ready_hands_out_the_jobs_already_scraped_without_scraping_more():
+    calls = []
+    prefetcher = JobPrefetcher(jobs(10, calls), depth=3, idle_timeout=0)
+    wait_until(lambda: prefetcher._idle)  # Stopped with a full queue, as when the search is left idle
+    scraped = len(calls)
+
+    keys = []
+    prefetched = prefetcher.next_ready()
+    while prefetched is not None:
+        keys.append(prefetched.job_dic['job_key'])
+        prefetched = prefetcher.next_ready()
+
+    assert keys == ['job0', 'job1', 'job2', 'job3']  # The queue, then the job the stopped thread was holding
+    assert len(calls) == scraped
+    assert not prefetcher._thread.is_alive()
+
+
+def test_next_ready_returns_none_at_the_end_of_the_search():
+    prefetcher = JobPrefetcher(jobs(1, []), depth=3)
+    wait_until(lambda: not prefetcher._thread.is_alive())
+    assert prefetcher.next_ready().job_dic == {'job_key': 'job0'}
+    assert prefetcher.next_ready() is None
+    assert prefetcher.next() is None
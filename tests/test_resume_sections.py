@@ -0,0 +1,65 @@
+import db
+from db import RESUME_SECTIONS, bulk_save_section
+
+
+class SectionTable:
+    """
+    One résumé section table as bulk_save_section writes it: the upsert on the section's natural key and the delete
+    of the rows that weren't saved.
+    """
+
+    def __init__(self, section: str):
+        self.section = section
+        self.rows = {}  # id -> row
+        self._next_id = 1
+
+    def execute_values(self, cursor, query, rows, page_size=100, fetch=False):
+        _, _, key_columns, _ = RESUME_SECTIONS[self.section]
+        key_of = lambda row: tuple(row[column] for column in key_columns)
+        saved_ids = []
+        for row in rows:
+            row_id = next((row_id for row_id, saved in self.rows.items() if key_of(saved) == key_of(row)), None)
+            if row_id is None:
+                row_id, self._next_id = self._next_id, self._next_id + 1
+            self.rows[row_id] = row
+            saved_ids.append((row_id,))
+        return saved_ids
+
+    def execute(self, query, params):
+        assert query.startswith(f"DELETE FROM {self.section} ")
+        user_ids, saved_ids = params
+        self.rows = {row_id: row for row_id, row in self.rows.items() if row[0] not in user_ids or row_id in saved_ids}
+
+    def entries(self, user_id: int):
+        return [row[1:-1] for row in sorted(self.rows.values(), key=lambda row: row[-1]) if row[0] == user_id]
+
+
+def work(job_title, company, start_date='2020-01-01', job_description='Built reports'):
+    return {'job_title': job_title, 'company': company, 'start_date': start_date, 'end_date': '', 'city': 'Leeds',
+            'country': 'UK', 'job_description': job_description}
+
+
+def save(table, user_id, entries):
+    return bulk_save_section(table, table.section, [(user_id, entry) for entry in entries], user_ids=[user_id])
+
+
+def test_resaving_a_section_updates_edited_entries_and_drops_removed_ones(monkeypatch):
+    table = SectionTable('work_experiences')
+    monkeypatch.setattr(db, 'execute_values', table.execute_values)
+    save(table, 1, [work('Analyst', 'Acme'), work('Engineer', 'Initech'), work('Intern', 'Globex')])
+    save(table, 2, [work('Analyst', 'Acme')])
+
+    # The description edited in place, the company renamed and the internship removed
+    assert save(table, 1, [work('Analyst', 'Acme', job_description='Built dashboards'), work('Engineer', 'Initrode')]) == 2
+
+    assert table.entries(1) == [('Analyst', 'Acme', '2020-01-01', None, 'Leeds', 'UK', 'Built dashboards'),
+                                ('Engineer', 'Initrode', '2020-01-01', None, 'Leeds', 'UK', 'Built reports')]
+    assert len(table.rows) == 3  # The other user's entry is kept
+
+
+def test_saving_no_entries_clears_the_section(monkeypatch):
+    table = SectionTable('certifications')
+    monkeypatch.setattr(db, 'execute_values', table.execute_values)
+    save(table, 1, [{'title': 'AWS Cloud Practitioner'}, {'title': 'PL-300'}])
+    assert save(table, 1, []) == 0
+    assert table.entries(1) == []
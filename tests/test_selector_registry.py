@@ -0,0 +1,29 @@
+import json
+import logging
+import os
+
+from selector_registry import SelectorRegistry
+
+
+def write(path, text: str, version: int):
+    path.write_text(text)
+    os.utime(path, ns=(version * 10 ** 9, version * 10 ** 9))  # A new mtime, however quickly it's written again
+
+
+def test_a_broken_file_is_reported_and_the_selectors_in_use_are_kept(tmp_path, caplog):
+    path = tmp_path / 'job_selectors.json'
+    write(path, json.dumps({'job_card': ['a[data-jk]']}), 1)
+    selectors = SelectorRegistry(str(path))
+
+    write(path, json.dumps({'job_card': ['a[data-jk']}), 2)
+    with caplog.at_level(logging.WARNING, logger='selector_registry'):
+        assert not selectors.reload()
+
+    assert selectors.chain('job_card')[0].value == 'a[data-jk]'
+    assert "couldn't be loaded" in caplog.text
+    assert "couldn't be loaded" in selectors.summary()
+
+    write(path, json.dumps({'job_card': ['a.jcs-JobTitle[data-jk]']}), 3)
+    assert selectors.reload()
+    assert selectors.load_error is None
+    assert selectors.summary() == 'Selectors: every lookup matched its first selector'
@@ -0,0 +1,32 @@
+import semantic_search
+from semantic_search import SemanticIndex, sync_jobs
+
+
+class JobsTable:
+    """
+    The jobs table as sync_jobs queries it.
+    """
+
+    def __init__(self, jobs: dict):
+        self.jobs = jobs  # job_id -> (job_title, job_description)
+
+    def fetch_all(self, query: str, params):
+        if 'ANY' in query:
+            return [(job_id,) + self.jobs[job_id] for job_id in sorted(params[0])]
+        after, limit = params
+        return [(job_id,) for job_id in sorted(self.jobs) if job_id > after][:limit]
+
+
+def test_sync_embeds_jobs_below_ones_added_as_they_were_saved(tmp_path, monkeypatch):
+    table = JobsTable({job_id: (f'Job {job_id}', f'Description of job {job_id}') for job_id in range(1, 8)})
+    monkeypatch.setattr(semantic_search, 'fetch_all', table.fetch_all)
+    index = SemanticIndex(str(tmp_path / 'index'))
+    index.add([7], ['Job 7\nDescription of job 7'])  # Saved in the app before the others were synced
+
+    assert sync_jobs(index, batch_size=3) == 6
+    assert index.missing(range(1, 8)) == []
+    assert index.synced_job_id == 7
+
+    table.jobs[8] = ('Job 8', 'Description of job 8')
+    assert sync_jobs(SemanticIndex(str(tmp_path / 'index')), batch_size=3) == 1  # The watermark is kept in the index files
+    assert sync_jobs(index) == 0
@@ -0,0 +1,37 @@
+from skill_index import Skill, SkillIndex, build_skill_index, listed_phrases, load_skill_index
+
+DESCRIPTIONS = [
+    "We need strong experience with Python, SQL and PowerBI. Add 500 ml of water to the mix.",
+    "Skills: python3, T-SQL, Looker and ML; good communication skills",
+    "Requirements: Python, Looker, Excel\nYou will lead the team and report to the manager",
+    "Tools: Looker, dbt, Python and Microsoft Power BI skills to build reports",
+    "Python, Looker, dbt or Airflow. You will work with the team and the manager",
+]
+
+
+def test_listed_phrases_are_cut_out_of_their_sentence():
+    assert listed_phrases(DESCRIPTIONS[0]) == ['Python', 'SQL', 'PowerBI']
+    assert listed_phrases(DESCRIPTIONS[3]) == ['Looker', 'dbt', 'Python', 'Microsoft Power BI']
+    assert listed_phrases("You will lead the team and report to the manager") == []  # Not a list
+
+
+def test_skills_are_the_phrases_enough_jobs_list_under_their_canonical_names():
+    index = build_skill_index(DESCRIPTIONS, min_documents=2, extra_skills=['Excel', 'Haskell'])
+
+    assert dict(zip(index.names, index.frequencies)) == {'Python': 5, 'Looker': 4, 'dbt': 2, 'Power BI': 2, 'SQL': 2, 'Excel': 1}
+    assert 'team' not in index.names and 'Airflow' not in index.names  # Never listed, or by a single job
+    assert index.documents == len(DESCRIPTIONS)
+
+
+def test_short_aliases_count_in_job_posts_only_in_capitals():
+    index = load_skill_index(None)
+    names = lambda text: [index.names[skill_id] for skill_id in index.find_ids(text)]
+
+    assert names("Add 500 ml of milk and check your flt certificate") == []
+    assert sorted(names("ML engineer with an FLT licence")) == ['Forklift', 'Machine learning']
+    assert index.canonical('ml') == 'Machine learning'  # What a user types is still looked up in any case
+
+
+def test_short_skill_names_are_found_in_any_case():
+    index = SkillIndex([Skill('SQL', 0, ()), Skill('Go', 0, ('golang',))])
+    assert sorted(index.names[skill_id] for skill_id in index.find_ids("sql and go")) == ['Go', 'SQL']